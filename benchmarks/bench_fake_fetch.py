@@ -0,0 +1,89 @@
+"""Benchmark resolving a large dependency graph with the in-memory backend.
+
+Runs the whole `fetch` loop, i.e. parsing manifests, probing and cloning,
+against `FakeGitBackend`. No network is used, so the numbers show the
+overhead of the tool itself and of its scheduling.
+
+Usage:
+    python benchmarks/bench_fake_fetch.py [--repos N] [--latency SECONDS]
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+from os import path
+
+from mock import MagicMock
+
+from catkin_tools_fetch import cli
+from catkin_tools_fetch.lib.fake_backend import FakeGitBackend
+from catkin_tools_fetch.lib.fake_backend import PACKAGE_XML
+
+URL_TEMPLATE = "fake://host/{package}"
+
+
+def make_backend(num_repos, latency, seed):
+    """Create a backend with a random forest of repositories.
+
+    Returns:
+        tuple: (backend, names of the roots)
+    """
+    rng = random.Random(seed)
+    names = ['repo_{:05d}'.format(i) for i in range(num_repos)]
+    deps = {name: [] for name in names}
+    roots = names[:max(1, num_repos // 100)]
+    for i, name in enumerate(names[len(roots):], len(roots)):
+        deps[rng.choice(names[:i])].append(name)
+    backend = FakeGitBackend(latency=latency)
+    for name in names:
+        backend.add_remote(URL_TEMPLATE.format(package=name), name,
+                           depends=deps[name])
+    return backend, roots
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repos', type=int, default=10000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--num_threads', '-j', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.getLogger('deps').setLevel(logging.WARNING)
+    backend, roots = make_backend(args.repos, args.latency, args.seed)
+    workspace = tempfile.mkdtemp()
+    try:
+        ws_path = path.join(workspace, 'src')
+        depends = "\n".join("  <build_depend>{}</build_depend>".format(root)
+                            for root in roots)
+        os.makedirs(path.join(ws_path, 'root'))
+        with open(path.join(ws_path, 'root', 'package.xml'), 'w') as xml:
+            xml.write(PACKAGE_XML.format(name='root', depends=depends))
+        context = MagicMock()
+        context.source_space_abs = ws_path
+        start = time.time()
+        error_code = cli.fetch(packages=[],
+                               workspace=workspace,
+                               context=context,
+                               default_urls=set([URL_TEMPLATE]),
+                               use_preprint=False,
+                               num_threads=args.num_threads,
+                               pull_after_fetch=False,
+                               backend=backend)
+        duration = time.time() - start
+    finally:
+        shutil.rmtree(workspace)
+    operations = {}
+    for operation, _ in backend.calls:
+        operations[operation] = operations.get(operation, 0) + 1
+    print('{} repos resolved in {:.2f} s ({:.2f} ms per repo), '
+          'error code {}, operations: {}'.format(
+              args.repos, duration, 1000.0 * duration / args.repos,
+              error_code, operations))
+
+
+if __name__ == '__main__':
+    main()
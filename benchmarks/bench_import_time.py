@@ -0,0 +1,48 @@
+"""Benchmark the import time of the verb descriptors.
+
+Runs `python -X importtime` in a fresh interpreter for each sample and reports
+the median cumulative import time of `catkin_tools_fetch` (what catkin pays
+for every command) and of `catkin_tools_fetch.cli` (the eager baseline, what
+every command paid before the imports were deferred).
+
+Usage:
+    python benchmarks/bench_import_time.py [--samples N]
+"""
+import argparse
+import subprocess
+import sys
+
+
+def import_time_us(module):
+    """Get cumulative import time of a module in microseconds."""
+    cmd = [sys.executable, '-X', 'importtime', '-c', 'import ' + module]
+    output = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+    for line in output.decode('utf-8').splitlines():
+        fields = [field.strip() for field in line.split('|')]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1])
+    raise RuntimeError('No import time found for ' + module)
+
+
+def median(values):
+    """Get the median of a list of numbers."""
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--samples', type=int, default=11)
+    args = parser.parse_args()
+    lazy = median([import_time_us('catkin_tools_fetch')
+                   for _ in range(args.samples)])
+    eager = median([import_time_us('catkin_tools_fetch.cli')
+                    for _ in range(args.samples)])
+    print('descriptors (lazy):  {:8.1f} ms'.format(lazy / 1000.0))
+    print('cli (eager):         {:8.1f} ms'.format(eager / 1000.0))
+    print('speedup:             {:8.1f}x'.format(eager / float(lazy)))
+
+
+if __name__ == '__main__':
+    main()
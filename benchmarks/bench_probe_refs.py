@@ -0,0 +1,112 @@
+"""Benchmark probing a repository that has many refs.
+
+Creates a local bare repository with many tags and pull request refs, as
+left behind by CI, and compares the bytes sent by the server and the latency
+of three ways to probe it for its `master` branch:
+
+    full:     `git ls-remote URL` with protocol v0, lists every ref.
+    filtered: ref patterns, matched on the client after all refs arrived.
+    v2:       `GitBridge.find_ref`, refs filtered by the server.
+
+The bytes are taken from `GIT_TRACE_PACKET`, i.e. the pkt-lines received by
+the client.
+
+Usage:
+    python benchmarks/bench_probe_refs.py [--refs N] [--repeat R]
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from os import path
+
+from catkin_tools_fetch.lib.tools import GitBridge
+
+PACKET_REGEX = re.compile(r"packet:\s+ls-remote< (.*)$")
+
+
+def make_repo(root, num_refs):
+    """Create a bare repository with one commit and many tags."""
+    work = path.join(root, 'work')
+    env = dict(os.environ, GIT_AUTHOR_NAME='a', GIT_AUTHOR_EMAIL='a@b.c',
+               GIT_COMMITTER_NAME='a', GIT_COMMITTER_EMAIL='a@b.c')
+    subprocess.check_call(['git', 'init', '-q', work])
+    subprocess.check_call(['git', 'commit', '-q', '--allow-empty', '-m', 'x'],
+                          cwd=work, env=env)
+    subprocess.check_call(['git', 'branch', '-M', 'master'], cwd=work)
+    sha = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                  cwd=work).decode().strip()
+    with open(path.join(work, '.git', 'packed-refs'), 'w') as refs:
+        refs.write('# pack-refs with: peeled fully-peeled sorted\n')
+        for i in range(num_refs // 2):
+            refs.write('{} refs/pull/{}/head\n'.format(sha, i))
+        for i in range(num_refs - num_refs // 2):
+            refs.write('{} refs/tags/ci-build-{:06d}\n'.format(sha, i))
+    remote = path.join(root, 'remote.git')
+    subprocess.check_call(['git', 'clone', '-q', '--bare', '--mirror',
+                           work, remote])
+    return remote
+
+
+def probe(cmds, repeat):
+    """Run probe commands and measure received bytes and latency."""
+    trace = tempfile.mktemp()
+    env = dict(os.environ, GIT_TRACE_PACKET=trace)
+    best = None
+    for _ in range(repeat):
+        if path.exists(trace):
+            os.remove(trace)
+        start = time.time()
+        for cmd in cmds:
+            output = subprocess.check_output(cmd, env=env,
+                                             stderr=subprocess.STDOUT)
+            if GitBridge.parse_ls_remote(output, 'master'):
+                break
+        duration = time.time() - start
+        best = duration if best is None else min(best, duration)
+    received = 0
+    with open(trace) as trace_file:
+        for line in trace_file:
+            match = PACKET_REGEX.search(line)
+            if match:
+                # Payload plus the 4 byte pkt-line length header.
+                received += len(match.group(1)) + 4
+    os.remove(trace)
+    return received, best
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--refs', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    root = tempfile.mkdtemp()
+    try:
+        url = 'file://' + make_repo(root, args.refs)
+        variants = [
+            ('full', [['git', '-c', 'protocol.version=0', 'ls-remote',
+                       url]]),
+            ('filtered', [['git', 'ls-remote', url, 'refs/heads/master']]),
+            ('v2', GitBridge.probe_cmds(url, 'master')),
+        ]
+        results = {}
+        for name, cmd in variants:
+            results[name] = probe(cmd, args.repeat)
+        full_bytes, full_time = results['full']
+        for name, _ in variants:
+            received, duration = results[name]
+            print('{:<9} {:>12,} bytes  {:7.1f} ms  ({:5.1f}% of the bytes, '
+                  '{:5.1f}% of the time of a full probe)'.format(
+                      name, received, duration * 1000.0,
+                      100.0 * received / full_bytes,
+                      100.0 * duration / full_time))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
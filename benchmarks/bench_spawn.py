@@ -0,0 +1,81 @@
+"""Benchmark the overhead of starting a git command.
+
+Runs `git --version` many times, which does almost no work, so the measured
+time is the cost of starting a process and collecting its output:
+
+    shell:       `subprocess.Popen` with `shell=True`, how every git command
+                 was started before: `/bin/sh` first, then git.
+    popen:       `Spawner` falling back to `subprocess.Popen` with argv.
+    posix_spawn: `Spawner` with `posix_spawn` and the shared environment.
+
+A ballast of allocated memory makes the process as large as a real run with
+thousands of parsed packages, which matters wherever a fork has to copy the
+page tables of the process.
+
+Usage:
+    python benchmarks/bench_spawn.py [--calls N] [--ballast MiB]
+"""
+import argparse
+import os
+import subprocess
+import time
+
+from catkin_tools_fetch.lib.spawn import Spawner
+from catkin_tools_fetch.lib.tools import GitBridge
+
+
+def run_shell(_):
+    """Start git through a shell like the old bridge did."""
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+    process = subprocess.Popen("git --version", stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, shell=True, env=env,
+                               start_new_session=True)
+    process.communicate()
+
+
+def run_spawner(use_posix_spawn):
+    """Get a function that starts git with the spawner."""
+    def run(_):
+        Spawner.USE_POSIX_SPAWN = use_posix_spawn
+        Spawner.run(["git", "--version"], env=GitBridge.environment())
+    return run
+
+
+def measure(run, calls):
+    """Get the median and the total time of many calls in seconds."""
+    durations = []
+    for i in range(calls):
+        start = time.time()
+        run(i)
+        durations.append(time.time() - start)
+    durations.sort()
+    return durations[len(durations) // 2], sum(durations)
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--ballast', type=int, default=200)
+    args = parser.parse_args()
+    ballast = bytearray(args.ballast * 1024 * 1024)
+    for i in range(0, len(ballast), 4096):
+        ballast[i] = 1
+    variants = [('shell', run_shell),
+                ('popen', run_spawner(False))]
+    if hasattr(os, 'posix_spawn'):
+        variants.append(('posix_spawn', run_spawner(True)))
+    results = {}
+    for name, run in variants:
+        results[name] = measure(run, args.calls)
+    shell_median, _ = results['shell']
+    for name, _ in variants:
+        median, total = results[name]
+        print('{:<12} {:8.0f} us per call  {:7.2f} s for {} calls  '
+              '({:5.1f}% of the shell)'.format(
+                  name, median * 1e6, total, args.calls,
+                  100.0 * median / shell_median))
+
+
+if __name__ == '__main__':
+    main()
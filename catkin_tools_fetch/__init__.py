@@ -12,8 +12,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .cli import main
-from .cli import prepare_arguments_deps
+# catkin loads the descriptors of all verbs for every command, so the heavy
+# imports are deferred until this verb actually runs.
+
+
+def main(opts):
+    """Run the deps verb."""
+    from .cli import main as deps_main
+    return deps_main(opts)
+
+
+def prepare_arguments_deps(parser):
+    """Add the arguments of the deps verb to the parser."""
+    from .arguments import prepare_arguments_deps as prepare_arguments
+    return prepare_arguments(parser)
+
 
 # This describes this command to the loader
 description_deps = dict(
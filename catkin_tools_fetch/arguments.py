@@ -0,0 +1,298 @@
+"""Contains the argument parser for deps verb.
+
+This module is imported for every `catkin` command, so it must stay cheap to
+import. The implementation of the verb lives in `cli`.
+"""
+
+from argparse import ArgumentParser
+
+from catkin_tools.argument_parsing import add_context_args
+
+
+def prepare_arguments_deps(parser):
+    """Parse arguments that belong to this verb.
+
+    Args:
+        parser (argparser): Argument parser
+
+    Returns:
+        argparser: Parser that knows about our flags.
+    """
+    parser.description = """ Manage dependencies for one or more packages in
+        a catkin workspace. This reads dependencies from package.xml file of
+        each of the packages in the workspace and tries to download their
+        sources from version control system of choice."""
+    add_context_args(parser)
+
+    parent_parser = ArgumentParser(add_help=False)
+
+    # add config flags to all groups that need it
+    parent_parser.add_argument(
+        '--default_url', default="{package}",
+        help='[deprecated] Where to look for packages by default.')
+    parent_parser.add_argument(
+        '--default_urls', default="{package}",
+        help='A comma separated list of urls where to look for packages at.')
+    parent_parser.add_argument(
+        '--prefer_urls', default="",
+        help="""A comma separated list of urls that are always probed first,
+        in the given order. Other urls are ordered by their past hit rate.""")
+
+    parent_parser.add_argument(
+        '--dep_profile', default="build",
+        help="""Which dependencies to follow: 'build' (build_depend,
+        build_export_depend, depend), 'exec' (exec_depend, run_depend,
+        depend), 'test' (build, exec and test_depend), 'doc' (build and
+        doc_depend) or 'full' (all of them).""")
+
+    # Behavior
+    parent_parser.add_argument('--verbose', '-v',
+                               action='store_true',
+                               default=False,
+                               help='Print output from commands.')
+    parent_parser.add_argument('--no_status',
+                               action='store_true',
+                               default=False,
+                               help='Do not use progress status when cloning.')
+    parent_parser.add_argument('--num_threads', '-j',
+                               type=int,
+                               default=None,
+                               help="""Maximum number of parallel git
+                               operations of all phases together. Each phase
+                               adapts its parallelism to the observed
+                               throughput and errors, by default up to 32
+                               probes, 8 clones and 8 pulls.""")
+    parent_parser.add_argument('--timeouts',
+                               default="",
+                               help="""Comma separated timeouts in seconds
+                               per git operation, e.g. 'probe=30,clone=600'.
+                               Operations: status, pull, probe, clone,
+                               maintain.""")
+    parent_parser.add_argument('--retries',
+                               type=int,
+                               default=None,
+                               help="""How many times to retry a git command
+                               after a timeout or a network error.""")
+
+    packages_help_msg = """
+        Packages for which the dependencies are analyzed.
+        If no packages are given, all packages are processed."""
+
+    # we need subparsers for this verb
+    subparsers = parser.add_subparsers(dest='subverb', help="Possible verbs.")
+
+    # add a parser for update sub-verb
+    update_help_msg = """
+        Update the existing repositories to their latest state from remote."""
+    parser_update = subparsers.add_parser(
+        'update', help=update_help_msg, parents=[parent_parser])
+
+    parser_update.add_argument('--maintain',
+                               action='store_true',
+                               default=False,
+                               help="""Run git maintenance in all updated
+                               repositories afterwards.""")
+    parser_update.add_argument('--max_age', '--max-age',
+                               default=None,
+                               metavar='AGE',
+                               help="""Skip the repositories pulled less than
+                               AGE ago, e.g. 90 (seconds), 15m, 2h or 1d,
+                               unless they are named explicitly.""")
+
+    update_pkg_group = parser_update.add_argument_group(
+        'Packages',
+        'Control for which packages we update dependencies.')
+    update_pkg_group.add_argument('packages',
+                                  metavar='PKGNAME',
+                                  nargs='*',
+                                  help=packages_help_msg)
+
+    # add a parser for fetch sub-verb
+    fetch_help_msg = """
+        Fetch the dependencies stored package.xml files."""
+    parser_fetch = subparsers.add_parser('fetch',
+                                         help=fetch_help_msg,
+                                         parents=[parent_parser])
+    parser_fetch.add_argument('--update',
+                              action='store_true',
+                              default=True,
+                              help="Update after fetch.")
+    parser_fetch.add_argument('--size_hints',
+                              default=None,
+                              help="""A json file {name: size in MiB} with
+                              expected repository sizes. Big repositories
+                              are cloned first.""")
+    parser_fetch.add_argument('--repos',
+                              default=None,
+                              metavar='FILE',
+                              help="""Clone the repositories listed in this
+                              vcstool `.repos` file in one go, without
+                              reading package.xml files or searching urls.
+                              Existing ones are updated.""")
+    parser_fetch.add_argument('--shard',
+                              default=None,
+                              metavar='I/N',
+                              help="""Only clone the I-th of N parts of the
+                              `--repos` file, e.g. 2/4. The parts are
+                              balanced by repository size, give the same
+                              `--size_hints` on all machines.""")
+    parser_fetch.add_argument('--bundle_dir',
+                              default=None,
+                              metavar='DIR',
+                              help="""Write the cloned repositories of the
+                              shard as git bundles into this folder, to be
+                              put together with `merge`.""")
+    fetch_group = parser_fetch.add_argument_group(
+        'Packages',
+        'Control for which packages we fetch dependencies.')
+    fetch_group.add_argument('packages',
+                             metavar='PKGNAME',
+                             nargs='*',
+                             help=packages_help_msg)
+
+    # add a parser for watch sub-verb
+    watch_help_msg = """
+        Keep running and fetch new dependencies in background as soon as
+        package.xml files change."""
+    parser_watch = subparsers.add_parser('watch',
+                                         help=watch_help_msg,
+                                         parents=[parent_parser])
+    parser_watch.add_argument('--poll_interval',
+                              type=float,
+                              default=1.0,
+                              help="Seconds between checks for changes.")
+
+    # add a parser for maintain sub-verb
+    maintain_help_msg = """
+        Run git maintenance in the repositories of the workspace to keep
+        status and pull fast."""
+    parser_maintain = subparsers.add_parser('maintain',
+                                            help=maintain_help_msg,
+                                            parents=[parent_parser])
+    parser_maintain.add_argument('--tasks',
+                                 default="",
+                                 help="""Comma separated maintenance tasks.
+                                 Default: commit-graph, loose-objects,
+                                 incremental-repack, prefetch.""")
+    parser_maintain.add_argument('--io_budget',
+                                 type=float,
+                                 default=None,
+                                 help="""Process at most this many MiB of
+                                 repository data per second.""")
+    maintain_group = parser_maintain.add_argument_group(
+        'Packages',
+        'Control which repositories we maintain.')
+    maintain_group.add_argument('packages',
+                                metavar='PKGNAME',
+                                nargs='*',
+                                help=packages_help_msg)
+
+    # add a parser for stats sub-verb
+    stats_help_msg = """
+        Show statistics of past fetch and update runs."""
+    parser_stats = subparsers.add_parser('stats',
+                                         help=stats_help_msg,
+                                         parents=[parent_parser])
+    parser_stats.add_argument('--last',
+                              type=int,
+                              default=None,
+                              help="Only consider the last N runs.")
+    parser_stats.add_argument('--top',
+                              type=int,
+                              default=10,
+                              help="Number of slowest repositories to show.")
+    parser_stats.add_argument('--prometheus',
+                              default=None,
+                              help="""Write the statistics to this file in
+                              the Prometheus textfile format.""")
+
+    # add a parser for export sub-verb
+    export_help_msg = """
+        Export the urls and versions of the workspace repositories."""
+    parser_export = subparsers.add_parser('export',
+                                          help=export_help_msg,
+                                          parents=[parent_parser])
+    parser_export.add_argument('--repos',
+                               nargs='?',
+                               const='-',
+                               default='-',
+                               metavar='FILE',
+                               help="""Write a vcstool `.repos` file, to
+                               stdout if no file is given.""")
+    parser_export.add_argument('--exact',
+                               action='store_true',
+                               default=False,
+                               help="""Export commit shas instead of branch
+                               names.""")
+    export_group = parser_export.add_argument_group(
+        'Packages',
+        'Control which repositories we export.')
+    export_group.add_argument('packages',
+                              metavar='PKGNAME',
+                              nargs='*',
+                              help=packages_help_msg)
+
+    # add a parser for merge sub-verb
+    merge_help_msg = """
+        Clone the repositories of all shards of a sharded fetch from the
+        bundles they wrote."""
+    parser_merge = subparsers.add_parser('merge',
+                                         help=merge_help_msg,
+                                         parents=[parent_parser])
+    parser_merge.add_argument('bundle_dirs',
+                              metavar='DIR',
+                              nargs='+',
+                              help="""Folders with the bundles of the
+                              shards, written by `fetch --bundle_dir`.""")
+
+    # add a parser for cache sub-verb
+    cache_help_msg = """
+        Save the repositories of the workspace as archives or restore them
+        and pull only those that moved since."""
+    parser_cache = subparsers.add_parser('cache',
+                                         help=cache_help_msg,
+                                         parents=[parent_parser])
+    parser_cache.add_argument('action',
+                              choices=['save', 'restore'],
+                              help="Save or restore the repositories.")
+    parser_cache.add_argument('--cache_dir',
+                              default=None,
+                              metavar='DIR',
+                              help="""Folder of the cache, by default
+                              in ~/.cache/catkin_tools_fetch.""")
+    parser_cache.add_argument('--key',
+                              default=None,
+                              help="""Key of the workspace to restore,
+                              the newest saved one by default.""")
+    cache_group = parser_cache.add_argument_group(
+        'Packages',
+        'Control which repositories we save.')
+    cache_group.add_argument('packages',
+                             metavar='PKGNAME',
+                             nargs='*',
+                             help=packages_help_msg)
+
+    # add a parser for graph sub-verb
+    graph_help_msg = """
+        Show the dependency closure of packages and where each dependency
+        was found, using only the manifests and the results of past runs."""
+    parser_graph = subparsers.add_parser('graph',
+                                         help=graph_help_msg,
+                                         parents=[parent_parser])
+    parser_graph.add_argument('--format',
+                              dest='graph_format',
+                              choices=['tree', 'dot', 'json'],
+                              default='tree',
+                              help="Output format, 'dot' is for Graphviz.")
+    parser_graph.add_argument('--output', '-o',
+                              default=None,
+                              help="Write to this file instead of stdout.")
+    graph_group = parser_graph.add_argument_group(
+        'Packages',
+        'Control which packages the graph starts from.')
+    graph_group.add_argument('packages',
+                             metavar='PKGNAME',
+                             nargs='*',
+                             help=packages_help_msg)
+
+    return parser
@@ -6,8 +6,8 @@ Attributes:
 
 import sys
 import logging
+import subprocess
 from os import path
-from argparse import ArgumentParser
 
 try:
     from catkin_pkg.packages import find_packages
@@ -18,99 +18,35 @@ except ImportError as e:
         '"catkin_pkg", and that it is up to date and on the PYTHONPATH.' % e
     )
 
-from catkin_tools.argument_parsing import add_context_args
 from catkin_tools.context import Context
 
+from catkin_tools_fetch.arguments import prepare_arguments_deps  # noqa: F401
+from catkin_tools_fetch.lib.closure_cache import ClosureCache
+from catkin_tools_fetch.lib.dependency_parser import Dependency
 from catkin_tools_fetch.lib.dependency_parser import Parser
 from catkin_tools_fetch.lib.downloader import Downloader
+from catkin_tools_fetch.lib.graph import DependencyGraph
+from catkin_tools_fetch.lib.history import RunHistory
+from catkin_tools_fetch.lib.journal import FetchJournal
+from catkin_tools_fetch.lib.maintenance import Maintainer
+from catkin_tools_fetch.lib.repos_file import ReposFile
+from catkin_tools_fetch.lib.rosdep_index import RosdepIndex
+from catkin_tools_fetch.lib.scheduler import CloneScheduler
+from catkin_tools_fetch.lib.session import Session
+from catkin_tools_fetch.lib.shard import Shard
+from catkin_tools_fetch.lib.stats import RunStats
+from catkin_tools_fetch.lib.sync_state import SyncState
+from catkin_tools_fetch.lib.tools import GitBridge
 from catkin_tools_fetch.lib.tools import Tools
 from catkin_tools_fetch.lib.update import Updater
+from catkin_tools_fetch.lib.url_ranker import UrlRanker
+from catkin_tools_fetch.lib.watcher import Watcher
+from catkin_tools_fetch.lib.workspace_cache import WorkspaceCache
 
 logging.basicConfig()
 log = logging.getLogger('deps')
 
 
-def prepare_arguments_deps(parser):
-    """Parse arguments that belong to this verb.
-
-    Args:
-        parser (argparser): Argument parser
-
-    Returns:
-        argparser: Parser that knows about our flags.
-    """
-    parser.description = """ Manage dependencies for one or more packages in
-        a catkin workspace. This reads dependencies from package.xml file of
-        each of the packages in the workspace and tries to download their
-        sources from version control system of choice."""
-    add_context_args(parser)
-
-    parent_parser = ArgumentParser(add_help=False)
-
-    # add config flags to all groups that need it
-    parent_parser.add_argument(
-        '--default_url', default="{package}",
-        help='[deprecated] Where to look for packages by default.')
-    parent_parser.add_argument(
-        '--default_urls', default="{package}",
-        help='A comma separated list of urls where to look for packages at.')
-
-    # Behavior
-    parent_parser.add_argument('--verbose', '-v',
-                               action='store_true',
-                               default=False,
-                               help='Print output from commands.')
-    parent_parser.add_argument('--no_status',
-                               action='store_true',
-                               default=False,
-                               help='Do not use progress status when cloning.')
-    parent_parser.add_argument('--num_threads', '-j',
-                               type=int,
-                               default=4,
-                               help='Number of threads run in parallel.')
-
-    packages_help_msg = """
-        Packages for which the dependencies are analyzed.
-        If no packages are given, all packages are processed."""
-
-    # we need subparsers for this verb
-    subparsers = parser.add_subparsers(dest='subverb', help="Possible verbs.")
-
-    # add a parser for update sub-verb
-    update_help_msg = """
-        Update the existing repositories to their latest state from remote."""
-    parser_update = subparsers.add_parser(
-        'update', help=update_help_msg, parents=[parent_parser])
-
-    update_pkg_group = parser_update.add_argument_group(
-        'Packages',
-        'Control for which packages we update dependencies.')
-    update_pkg_group.add_argument('packages',
-                                  metavar='PKGNAME',
-                                  nargs='*',
-                                  help=packages_help_msg)
-
-    # add a parser for fetch sub-verb
-    fetch_help_msg = """
-        Fetch the dependencies stored package.xml files."""
-    parser_fetch = subparsers.add_parser('fetch',
-                                         help=fetch_help_msg,
-                                         parents=[parent_parser])
-    parser_fetch.add_argument('--update',
-                              action='store_true',
-                              default=True,
-                              help="Update after fetch.")
-    fetch_group = parser_fetch.add_argument_group(
-        'Packages',
-        'Control for which packages we fetch dependencies.')
-    fetch_group.add_argument('packages',
-                             metavar='PKGNAME',
-                             nargs='*',
-                             help=packages_help_msg)
-
-    return parser
-
-
 def main(opts):
     """Run the script.
 
@@ -134,37 +70,573 @@ def main(opts):
         log.info(" Will print status messages while cloning.")
         use_preprint = True
 
-    log.info(" Using %s threads.", opts.num_threads)
+    if opts.num_threads:
+        log.info(" Using at most %s threads.", opts.num_threads)
+    else:
+        log.info(" Adapting the number of threads automatically.")
+    try:
+        GitBridge.configure(
+            timeouts=GitBridge.parse_timeouts(opts.timeouts),
+            retries=opts.retries)
+    except ValueError as e:
+        log.critical(" %s", e)
+        return 1
+    if opts.dep_profile not in Parser.PROFILES:
+        log.critical(" Unknown dependency profile '%s'. Choose from: %s",
+                     opts.dep_profile, ", ".join(sorted(Parser.PROFILES)))
+        return 1
+    if opts.subverb == 'stats':
+        return stats(history_path=RunHistory.default_history_path(),
+                     last=opts.last,
+                     top=opts.top,
+                     prometheus_path=opts.prometheus)
 
     context = Context.load(opts.workspace, opts.profile, opts, append=True)
     if opts.default_url != Tools.PACKAGE_TAG:
         opts.default_urls += "," + opts.default_url
     # Prepare the set of default urls
     default_urls = Tools.prepare_default_urls(opts.default_urls)
+    preferred_urls = [Tools.prepare_default_url(url)
+                      for url in opts.prefer_urls.split(",") if url]
+    preferred_urls = [url for url in preferred_urls if url]
+    url_ranker = UrlRanker(
+        stats_path=UrlRanker.default_stats_path(),
+        priorities=UrlRanker.priorities_from_urls(preferred_urls))
     if not opts.workspace:
         log.critical(" Workspace undefined! Abort!")
         return 1
     if opts.verb == 'fetch' or opts.subverb == 'fetch':
-        return fetch(packages=opts.packages,
+        size_hints = None
+        if opts.size_hints:
+            size_hints = CloneScheduler.load_size_hints(opts.size_hints)
+        scheduler = CloneScheduler(
+            hints_path=CloneScheduler.default_hints_path(),
+            size_hints=size_hints)
+        history = RunHistory(RunHistory.default_history_path(), 'fetch')
+        shard = None
+        if opts.shard:
+            try:
+                shard = Shard.parse_spec(opts.shard)
+            except ValueError as e:
+                log.critical(" %s", e)
+                return 1
+        if (shard or opts.bundle_dir) and not opts.repos:
+            log.critical(" Sharding needs the repositories of a `.repos` "
+                         "file, use --repos.")
+            return 1
+        if opts.repos:
+            error_code = fetch_repos(repos_path=opts.repos,
+                                     workspace=opts.workspace,
+                                     use_preprint=use_preprint,
+                                     num_threads=opts.num_threads,
+                                     pull_after_fetch=opts.update,
+                                     history=history,
+                                     shard=shard,
+                                     bundle_dir=opts.bundle_dir,
+                                     scheduler=scheduler,
+                                     size_hints=size_hints,
+                                     sync_state=SyncState(
+                                         SyncState.default_state_path(
+                                             opts.workspace)))
+            history.save()
+            return error_code
+        error_code = fetch(packages=opts.packages,
+                           workspace=opts.workspace,
+                           context=context,
+                           default_urls=default_urls,
+                           use_preprint=use_preprint,
+                           num_threads=opts.num_threads,
+                           pull_after_fetch=opts.update,
+                           url_ranker=url_ranker,
+                           scheduler=scheduler,
+                           history=history,
+                           dep_profile=opts.dep_profile,
+                           closure_cache=ClosureCache(
+                               ClosureCache.default_cache_path(
+                                   opts.workspace, opts.dep_profile)),
+                           journal=FetchJournal(
+                               FetchJournal.default_journal_path(
+                                   opts.workspace)),
+                           sync_state=SyncState(
+                               SyncState.default_state_path(
+                                   opts.workspace)))
+        history.save()
+        return error_code
+    if opts.subverb == 'update':
+        max_age = None
+        if opts.max_age:
+            try:
+                max_age = SyncState.parse_age(opts.max_age)
+            except ValueError as e:
+                log.critical(" %s", e)
+                return 1
+        history = RunHistory(RunHistory.default_history_path(), 'update')
+        error_code = update(packages=opts.packages,
+                            workspace=opts.workspace,
+                            context=context,
+                            use_preprint=use_preprint,
+                            num_threads=opts.num_threads,
+                            history=history,
+                            maintain_after_update=opts.maintain,
+                            sync_state=SyncState(
+                                SyncState.default_state_path(
+                                    opts.workspace)),
+                            max_age=max_age)
+        history.save()
+        return error_code
+    if opts.subverb == 'maintain':
+        try:
+            tasks = Maintainer.parse_tasks(opts.tasks)
+        except ValueError as e:
+            log.critical(" %s", e)
+            return 1
+        io_budget = None
+        if opts.io_budget:
+            io_budget = opts.io_budget * 1024 * 1024
+        return maintain(packages=opts.packages,
+                        workspace=opts.workspace,
+                        context=context,
+                        use_preprint=use_preprint,
+                        num_threads=opts.num_threads,
+                        tasks=tasks,
+                        io_budget=io_budget)
+    if opts.subverb == 'export':
+        return export(packages=opts.packages,
+                      workspace=opts.workspace,
+                      context=context,
+                      repos_path=opts.repos,
+                      exact=opts.exact,
+                      num_threads=opts.num_threads)
+    if opts.subverb == 'merge':
+        return merge(bundle_dirs=opts.bundle_dirs,
+                     workspace=opts.workspace,
+                     use_preprint=use_preprint,
+                     num_threads=opts.num_threads)
+    if opts.subverb == 'cache':
+        return cache(action=opts.action,
+                     packages=opts.packages,
+                     workspace=opts.workspace,
+                     context=context,
+                     cache_dir=opts.cache_dir or
+                     WorkspaceCache.default_cache_dir(),
+                     key=opts.key,
+                     use_preprint=use_preprint,
+                     num_threads=opts.num_threads)
+    if opts.subverb == 'graph':
+        return graph(packages=opts.packages,
                      workspace=opts.workspace,
                      context=context,
+                     default_urls=default_urls,
+                     output_format=opts.graph_format,
+                     output_path=opts.output,
+                     dep_profile=opts.dep_profile,
+                     num_threads=opts.num_threads)
+    if opts.subverb == 'watch':
+        return watch(workspace=opts.workspace,
                      default_urls=default_urls,
                      use_preprint=use_preprint,
                      num_threads=opts.num_threads,
-                     pull_after_fetch=opts.update)
-    if opts.subverb == 'update':
-        return update(packages=opts.packages,
-                      workspace=opts.workspace,
-                      context=context,
-                      use_preprint=use_preprint,
-                      num_threads=opts.num_threads)
+                     poll_interval=opts.poll_interval,
+                     url_ranker=url_ranker,
+                     dep_profile=opts.dep_profile)
+
+
+def stats(history_path, last=None, top=10, prometheus_path=None):
+    """Report statistics of past runs.
+
+    Args:
+        history_path (str): Path to the history file.
+        last (int): Only consider this many most recent runs.
+        top (int): Number of slowest repositories to show.
+        prometheus_path (str): Export the statistics to this file too.
+
+    Returns:
+        int: Return code. 0 if success. 1 if the export failed.
+    """
+    runs = RunHistory.load_runs(history_path)
+    if last:
+        runs = runs[-last:]
+    run_stats = RunStats(runs)
+    for line in run_stats.report(top):
+        log.info(" %s", line)
+    if prometheus_path:
+        if not Tools.save_text(prometheus_path, run_stats.to_prometheus()):
+            return 1
+        log.info(" Exported statistics to '%s'.", prometheus_path)
+    return 0
+
+
+def export(packages,
+           workspace,
+           context,
+           repos_path='-',
+           exact=False,
+           num_threads=None,
+           backend=GitBridge):
+    """Export the repositories of the workspace to a `.repos` file.
+
+    Args:
+        packages (list): Export only the repositories of these packages, all
+            if empty.
+        workspace (str): Path to a workspace (without src/ in the end).
+        context (Context): Current context. Needed to find current packages.
+        repos_path (str): File to write, '-' for stdout.
+        exact (bool): Export commit shas instead of branch names.
+        num_threads (int): Number of repositories read in parallel.
+        backend (GitBackend): Reads the repositories.
+
+    Returns:
+        int: Return code. 0 if success. 1 if the file cannot be written.
+    """
+    ws_path = path.join(workspace, 'src')
+    workspace_packages = find_packages(context.source_space_abs,
+                                       exclude_subspaces=True,
+                                       warnings=[])
+    repos = Tools.find_repos(ws_path, workspace_packages, packages)
+    with Session(num_threads) as session:
+        repos_file = ReposFile.from_workspace(ws_path, repos, exact=exact,
+                                              backend=backend,
+                                              session=session)
+    text = repos_file.dumps()
+    if not repos_path or repos_path == '-':
+        sys.stdout.write(text)
+        return 0
+    if not Tools.save_text(repos_path, text):
+        return 1
+    log.info(" Exported %s repositories to '%s'.",
+             len(repos_file.repositories), repos_path)
+    return 0
+
+
+def fetch_repos(repos_path,
+                workspace,
+                use_preprint,
+                num_threads,
+                pull_after_fetch,
+                history=None,
+                backend=GitBridge,
+                session=None,
+                shard=None,
+                bundle_dir=None,
+                scheduler=None,
+                size_hints=None,
+                sync_state=None):
+    """Clone or update the repositories listed in a `.repos` file.
+
+    Nothing is parsed or probed: all missing repositories are cloned in one
+    parallel wave and the existing ones are pulled afterwards. With a shard,
+    only its part of the repositories is cloned, so that several machines
+    share the work and `merge` puts the bundles of all shards together.
+
+    Args:
+        repos_path (str): Path to the `.repos` file.
+        workspace (str): Path to a workspace (without src/ in the end).
+        use_preprint (bool): Show status messages while cloning
+        num_threads (int): Maximum number of parallel clones and pulls.
+        pull_after_fetch (bool): Pull the repositories that existed before.
+        history (RunHistory): Records the duration of every git operation.
+        backend (GitBackend): Talks to the repositories.
+        session (Session): Lends the workers to clones and pulls. A new one
+            is used and closed if None.
+        shard (tuple): (index, count) of the shard to clone, all
+            repositories if None.
+        bundle_dir (str): Write the cloned repositories as git bundles into
+            this folder, to be merged later.
+        scheduler (CloneScheduler): Orders the clones.
+        size_hints (dict): {relative path: size in bytes} given by the user
+            that balance the shards. Sizes learned on this machine are not
+            used, as other machines must compute the same split.
+        sync_state (SyncState): Records when every pulled repository was
+            last synced.
+
+    Returns:
+        int: Return code. 0 if success. Git error code otherwise.
+    """
+    ws_path = path.join(workspace, 'src')
+    try:
+        repos_file = ReposFile.load(repos_path)
+    except ValueError as e:
+        log.critical(" Encountered error. Abort.")
+        log.critical(" Error message: %s", e)
+        return 1
+    if shard or bundle_dir:
+        index, count = shard if shard else (1, 1)
+        shard = Shard.from_repos(repos_file, index, count,
+                                 size_hints=size_hints)
+        log.info(" Shard %s/%s holds %s of %s repositories.", index, count,
+                 len(shard.repositories), len(repos_file.repositories))
+        repos_file = ReposFile(shard.repositories)
+    deps = {}
+    existing = {}
+    for repo_path, repo in repos_file.repositories.items():
+        dependency = Dependency(name=repo_path, url=repo['url'],
+                                branch=repo['version'])
+        if path.exists(path.join(ws_path, repo_path)):
+            existing[repo_path] = dependency
+        deps[repo_path] = dependency
+    with Session.borrow(session, num_threads) as session:
+        try:
+            downloader = Downloader(ws_path=ws_path,
+                                    available_pkgs=list(existing),
+                                    ignore_pkgs=set(),
+                                    use_preprint=use_preprint,
+                                    num_threads=num_threads,
+                                    scheduler=scheduler,
+                                    history=history,
+                                    backend=backend,
+                                    session=session,
+                                    default_branch=None)
+        except ValueError as e:
+            log.critical(" Encountered error. Abort.")
+            log.critical(" Error message: %s", e)
+            return 1
+        log.info(" Read %s repositories from '%s'.", len(deps), repos_path)
+        error_code = downloader.clone_dependencies(deps)
+        if scheduler:
+            scheduler.save()
+        # A pinned commit has no branch to pull.
+        to_pull = {repo_path: dependency
+                   for repo_path, dependency in existing.items()
+                   if not GitBridge.is_sha(dependency.branch)}
+        if pull_after_fetch and to_pull:
+            updater = Updater(ws_path=ws_path,
+                              packages=to_pull,
+                              use_preprint=use_preprint,
+                              num_threads=num_threads,
+                              history=history,
+                              backend=backend,
+                              session=session,
+                              sync_state=sync_state)
+            updater.update_packages([])
+            if sync_state:
+                sync_state.save()
+        if bundle_dir:
+            bundle_error = shard.write_bundles(ws_path, bundle_dir,
+                                               backend=backend,
+                                               session=session)
+            error_code = error_code or bundle_error
+        return error_code
+
+
+def merge(bundle_dirs,
+          workspace,
+          use_preprint,
+          num_threads,
+          backend=GitBridge,
+          session=None):
+    """Clone the repositories of all shards from their bundles.
+
+    The clones point to the urls of the repositories, not to the bundles,
+    so they can be updated as usual. Existing repositories are kept.
+
+    Args:
+        bundle_dirs (str[]): Folders written by `fetch --bundle_dir`.
+        workspace (str): Path to a workspace (without src/ in the end).
+        use_preprint (bool): Show status messages while cloning
+        num_threads (int): Maximum number of parallel clones.
+        backend (GitBackend): Talks to the repositories.
+        session (Session): Lends the workers to clones. A new one is used
+            and closed if None.
+
+    Returns:
+        int: Return code. 0 if success. 1 if a shard or a clone is missing.
+    """
+    ws_path = path.join(workspace, 'src')
+    try:
+        repositories = Shard.load_bundles(bundle_dirs)
+    except ValueError as e:
+        log.critical(" Encountered error. Abort.")
+        log.critical(" Error message: %s", e)
+        return 1
+    deps = {}
+    existing = []
+    for repo_path, repo in repositories.items():
+        if path.exists(path.join(ws_path, repo_path)):
+            existing.append(repo_path)
+        deps[repo_path] = Dependency(name=repo_path, url=repo['bundle'],
+                                     branch=repo['version'])
+    with Session.borrow(session, num_threads) as session:
+        try:
+            downloader = Downloader(ws_path=ws_path,
+                                    available_pkgs=existing,
+                                    ignore_pkgs=set(),
+                                    use_preprint=use_preprint,
+                                    backend=backend,
+                                    session=session,
+                                    default_branch=None)
+        except ValueError as e:
+            log.critical(" Encountered error. Abort.")
+            log.critical(" Error message: %s", e)
+            return 1
+        log.info(" Merging %s repositories from %s shard folders.",
+                 len(deps), len(bundle_dirs))
+        error_code = downloader.clone_dependencies(deps)
+    for repo_path, repo in sorted(repositories.items()):
+        repo_folder = path.join(ws_path, repo_path)
+        if repo_path in existing or not path.exists(repo_folder):
+            continue
+        try:
+            backend.set_remote_url(repo_folder, repo['url'])
+        except subprocess.CalledProcessError as e:
+            log.error(" %s: cannot set the url of origin: %s",
+                      Tools.decorate(repo_path), e)
+            error_code = 1
+    return error_code
+
+
+def cache(action,
+          packages,
+          workspace,
+          context,
+          cache_dir,
+          key=None,
+          use_preprint=True,
+          num_threads=None,
+          backend=GitBridge,
+          session=None):
+    """Save the repositories of the workspace to a cache or restore them.
+
+    Restoring unpacks every missing repository of the saved workspace and
+    then pulls only those whose branch moved on the remote since.
+
+    Args:
+        action (str): Either 'save' or 'restore'.
+        packages (list): Save only the repositories of these packages, all
+            if empty.
+        workspace (str): Path to a workspace (without src/ in the end).
+        context (Context): Current context. Needed to find current packages.
+        cache_dir (str): Folder of the cache.
+        key (str): Key of the workspace to restore, the newest if None.
+        use_preprint (bool): Show status messages while pulling.
+        num_threads (int): Maximum number of parallel git operations.
+        backend (GitBackend): Talks to the repositories.
+        session (Session): Lends the workers. A new one is used and closed
+            if None.
+
+    Returns:
+        int: Return code. 0 if success. 1 if a repository cannot be saved or
+            restored.
+    """
+    ws_path = path.join(workspace, 'src')
+    workspace_cache = WorkspaceCache(cache_dir)
+    with Session.borrow(session, num_threads) as session:
+        if action == 'save':
+            workspace_packages = find_packages(context.source_space_abs,
+                                               exclude_subspaces=True,
+                                               warnings=[])
+            repos = Tools.find_repos(ws_path, workspace_packages, packages)
+            graph = WorkspaceCache.read_graph(ws_path, repos,
+                                              backend=backend,
+                                              session=session)
+            key = workspace_cache.save(ws_path, graph, session=session)
+            if not key:
+                return 1
+            log.info(" Saved %s repositories to '%s' with key %s.",
+                     len(graph), cache_dir, key)
+            return 0
+        if not key:
+            key = workspace_cache.latest_key()
+        if not key:
+            log.critical(" No saved workspace in '%s'.", cache_dir)
+            return 1
+        try:
+            graph = workspace_cache.load(key)
+        except ValueError as e:
+            log.critical(" Encountered error. Abort.")
+            log.critical(" Error message: %s", e)
+            return 1
+        restored, failed = workspace_cache.restore(ws_path, graph,
+                                                   session=session)
+        log.info(" Restored %s of %s repositories from key %s.",
+                 len(restored), len(graph), key)
+        moved = WorkspaceCache.moved_tips(graph, restored,
+                                          backend=backend,
+                                          session=session)
+        if moved:
+            log.info(" Branches moved since saving: %s", ", ".join(moved))
+            updater = Updater(ws_path=ws_path,
+                              packages={
+                                  repo_path: Dependency(
+                                      name=repo_path,
+                                      url=graph[repo_path]['url'],
+                                      branch=graph[repo_path]['branch'])
+                                  for repo_path in moved},
+                              use_preprint=use_preprint,
+                              num_threads=num_threads,
+                              backend=backend,
+                              session=session)
+            updater.update_packages([])
+    if failed:
+        return 1
+    return 0
+
+
+def graph(packages,
+          workspace,
+          context,
+          default_urls,
+          output_format='tree',
+          output_path=None,
+          dep_profile=Parser.DEFAULT_PROFILE,
+          num_threads=None,
+          history_path=None):
+    """Show the dependency graph without probing or cloning anything.
+
+    Args:
+        packages (list): Packages to start from, all if empty.
+        workspace (str): Path to a workspace (without src/ in the end).
+        context (Context): Current context. Needed to find current packages.
+        default_urls (set(str)): A set of urls where we search for packages.
+        output_format (str): One of DependencyGraph.FORMATS.
+        output_path (str): Write the graph here instead of to stdout.
+        dep_profile (str): Which kinds of dependencies to follow.
+        num_threads (int): Number of parsing workers.
+        history_path (str): History with the urls of past runs, the
+            default one if None.
+
+    Returns:
+        int: Return code. 0 if success. 1 if the graph cannot be written.
+    """
+    ws_path = path.join(workspace, 'src')
+    workspace_packages = find_packages(context.source_space_abs,
+                                       exclude_subspaces=True,
+                                       warnings=[])
+    if history_path is None:
+        history_path = RunHistory.default_history_path()
+    known_urls = DependencyGraph.known_urls(
+        RunHistory.load_runs(history_path))
+    with Session(num_threads) as session:
+        dependency_graph = DependencyGraph.from_workspace(
+            ws_path=ws_path,
+            workspace_packages=workspace_packages,
+            packages=packages,
+            default_urls=default_urls,
+            tags=Parser.PROFILES[dep_profile],
+            known_urls=known_urls,
+            system_pkgs=RosdepIndex.load(),
+            session=session)
+    text = dependency_graph.render(output_format)
+    if not output_path:
+        sys.stdout.write(text)
+        return 0
+    if not Tools.save_text(output_path, text):
+        return 1
+    log.info(" Wrote the graph of %s packages to '%s'.",
+             len(dependency_graph.nodes), output_path)
+    return 0
 
 
 def update(packages,
            workspace,
            context,
            use_preprint,
-           num_threads):
+           num_threads,
+           history=None,
+           backend=GitBridge,
+           maintain_after_update=False,
+           session=None,
+           sync_state=None,
+           max_age=None):
     """Update packages from the available remotes.
 
     Args:
@@ -172,6 +644,14 @@ def update(packages,
         workspace (str): Path to a workspace (without src/ in the end).
         context (Context): Current context. Needed to find current packages.
         use_preprint (bool): Show status messages while cloning
+        history (RunHistory): Records the duration of every pull.
+        backend (GitBackend): Talks to the repositories.
+        maintain_after_update (bool): Run git maintenance afterwards.
+        session (Session): Lends the workers to pulls and maintenance. A new
+            one is used and closed if None.
+        sync_state (SyncState): Records when every package was pulled.
+        max_age (float): Skip the packages pulled less than this many
+            seconds ago, unless they are named in packages.
 
     Returns:
         int: Return code. 0 if success. Git error code otherwise.
@@ -180,21 +660,127 @@ def update(packages,
     workspace_packages = find_packages(context.source_space_abs,
                                        exclude_subspaces=True,
                                        warnings=[])
-    updater = Updater(ws_path=ws_path,
-                      packages=workspace_packages,
-                      use_preprint=use_preprint,
-                      num_threads=num_threads)
-    updater.update_packages(packages)
+    with Session.borrow(session, num_threads) as session:
+        updater = Updater(ws_path=ws_path,
+                          packages=workspace_packages,
+                          use_preprint=use_preprint,
+                          num_threads=num_threads,
+                          history=history,
+                          backend=backend,
+                          session=session,
+                          sync_state=sync_state,
+                          max_age=max_age)
+        updater.update_packages(packages)
+        if sync_state:
+            sync_state.save()
+        if maintain_after_update:
+            maintainer = Maintainer(ws_path=ws_path,
+                                    packages=workspace_packages,
+                                    use_preprint=use_preprint,
+                                    num_threads=num_threads,
+                                    backend=backend,
+                                    session=session)
+            maintainer.maintain_packages(packages)
+    return 0
+
+
+def maintain(packages,
+             workspace,
+             context,
+             use_preprint,
+             num_threads,
+             tasks=None,
+             io_budget=None,
+             backend=GitBridge,
+             session=None):
+    """Run git maintenance in the repositories of the workspace.
+
+    Args:
+        packages (list): A list of packages provided by the user.
+        workspace (str): Path to a workspace (without src/ in the end).
+        context (Context): Current context. Needed to find current packages.
+        use_preprint (bool): Show status messages while working.
+        tasks (str[]): Maintenance tasks, all default ones if empty.
+        io_budget (float): Bytes per second to process. No limit if None.
+        backend (GitBackend): Talks to the repositories.
+        session (Session): Lends the workers. A new one is used and closed
+            if None.
+
+    Returns:
+        int: Return code. 0 if success. 1 if a task failed.
+    """
+    ws_path = path.join(workspace, 'src')
+    workspace_packages = find_packages(context.source_space_abs,
+                                       exclude_subspaces=True,
+                                       warnings=[])
+    with Session.borrow(session, num_threads) as session:
+        maintainer = Maintainer(ws_path=ws_path,
+                                packages=workspace_packages,
+                                tasks=tasks,
+                                io_budget=io_budget,
+                                use_preprint=use_preprint,
+                                num_threads=num_threads,
+                                backend=backend,
+                                session=session)
+        results = maintainer.maintain_packages(packages)
+    if any(failed for _, failed, _, _ in results):
+        return 1
     return 0
 
 
+def watch(workspace,
+          default_urls,
+          use_preprint,
+          num_threads,
+          poll_interval,
+          url_ranker=None,
+          dep_profile=Parser.DEFAULT_PROFILE):
+    """Watch the workspace and fetch new dependencies in background.
+
+    Args:
+        workspace (str): Path to a workspace (without src/ in the end).
+        default_urls (set(str)): A set of urls where we search for packages.
+        use_preprint (bool): Show status messages while cloning
+        poll_interval (float): Seconds between checks for changes.
+        url_ranker (UrlRanker): Orders default urls and learns from probes.
+        dep_profile (str): Which kinds of dependencies to follow.
+
+    Returns:
+        int: Return code. 0 if success. 1 if any download failed.
+    """
+    ws_path = path.join(workspace, 'src')
+    try:
+        watcher = Watcher(ws_path=ws_path,
+                          default_urls=default_urls,
+                          ignore_pkgs=Tools.list_all_ros_pkgs(),
+                          use_preprint=use_preprint,
+                          num_threads=num_threads,
+                          url_ranker=url_ranker,
+                          system_pkgs=RosdepIndex.load(),
+                          tags=Parser.PROFILES[dep_profile])
+    except ValueError as e:
+        log.critical(" Encountered error. Abort.")
+        log.critical(" Error message: %s", e)
+        return 1
+    return watcher.run(poll_interval=poll_interval)
+
+
 def fetch(packages,
           workspace,
           context,
           default_urls,
           use_preprint,
           num_threads,
-          pull_after_fetch):
+          pull_after_fetch,
+          url_ranker=None,
+          scheduler=None,
+          history=None,
+          backend=GitBridge,
+          dep_profile=Parser.DEFAULT_PROFILE,
+          closure_cache=None,
+          session=None,
+          journal=None,
+          sync_state=None):
     """Fetch dependencies of a package.
 
     Args:
@@ -203,6 +789,20 @@ def fetch(packages,
         context (Context): Current context. Needed to find current packages.
         default_urls (set(str)): A set of urls where we search for packages.
         use_preprint (bool): Show status messages while cloning
+        url_ranker (UrlRanker): Orders default urls and learns from probes.
+        scheduler (CloneScheduler): Orders clones and learns their sizes.
+        history (RunHistory): Records the duration of every git operation.
+        backend (GitBackend): Talks to the repositories.
+        dep_profile (str): Which kinds of dependencies to follow, a key of
+            Parser.PROFILES.
+        closure_cache (ClosureCache): Skips fetching if the dependencies of
+            an unchanged workspace were fetched before.
+        session (Session): Lends the workers to all rounds of probes and
+            clones and to the pulls. A new one is used and closed if None.
+        journal (FetchJournal): Journals probes and clones, so that a rerun
+            after an interruption resumes instead of starting over.
+        sync_state (SyncState): Records when every package pulled after the
+            fetch was last synced.
 
     Returns:
         int: Return code. 0 if success. Git error code otherwise.
@@ -212,63 +812,127 @@ def fetch(packages,
         fetch_all = True
 
     ws_path = path.join(workspace, 'src')
-    ignore_pkgs = Tools.list_all_ros_pkgs()
 
     already_fetched = set()
     packages = set(packages)
 
     global_error_code = Downloader.NO_ERROR
 
-    # loop until there are no new dependencies left to download
-    while(True):
-        log.info(" Searching for dependencies.")
-        deps_to_fetch = {}
-        workspace_packages = find_packages(
-            context.source_space_abs,
-            exclude_subspaces=True, warnings=[])
-        available_pkgs = [pkg.name for _, pkg in workspace_packages.items()]
-        initial_cloned_pkgs = len(already_fetched)
-        for package_path, package in workspace_packages.items():
-            if package.name in already_fetched:
-                continue
-            if fetch_all or (package.name in packages):
-                parser = Parser(default_urls=default_urls,
-                                pkg_name=package.name)
-                package_folder = path.join(ws_path, package_path)
-                deps_to_fetch = Tools.update_deps_dict(
-                    deps_to_fetch, parser.get_dependencies(package_folder))
-                if deps_to_fetch is None:
-                    sys.exit(1)
-                already_fetched.add(package.name)
-                for new_dep_name in deps_to_fetch.keys():
-                    # make sure we don't stop until we analyzed all
-                    # dependencies as we have just added these repositories
-                    # we must analyze their dependencies too even if we wanted
-                    # to download dependencies for one project only.
-                    packages.add(new_dep_name)
-                # Update default url to use the new version of it further on.
-                default_urls.update(parser.default_urls)
-        try:
-            downloader = Downloader(ws_path=ws_path,
-                                    available_pkgs=available_pkgs,
-                                    ignore_pkgs=ignore_pkgs,
-                                    use_preprint=use_preprint,
-                                    num_threads=num_threads)
-        except ValueError as e:
-            log.critical(" Encountered error. Abort.")
-            log.critical(" Error message: %s", e.message)
-            return 1
-        error_code = downloader.download_dependencies(deps_to_fetch)
-        if len(already_fetched) == initial_cloned_pkgs:
-            log.info(" No new dependencies. Done.")
-            break
-        if error_code != 0:
-            global_error_code = error_code
-        log.info(" New packages available. Process their dependencies now.")
-    if pull_after_fetch:
-        updater = Updater(ws_path=ws_path,
-                          packages=workspace_packages,
-                          use_preprint=use_preprint,
-                          num_threads=num_threads)
-        updater.update_packages(packages)
-    return global_error_code
+    tags = Parser.PROFILES[dep_profile]
+    workspace_packages = find_packages(
+        context.source_space_abs,
+        exclude_subspaces=True, warnings=[])
+    # Parsing adds to both, so keep what identifies the request.
+    requested_packages = sorted(packages)
+    initial_urls = set(default_urls)
+    closure_key = ClosureCache.make_key(
+        dep_profile, requested_packages, initial_urls,
+        ClosureCache.manifest_mtimes(context.source_space_abs,
+                                     workspace_packages))
+    closure_complete = False
+    if closure_cache and closure_cache.is_complete(closure_key):
+        log.info(" All '%s' dependencies were fetched before and no "
+                 "package.xml changed. Nothing to fetch.", dep_profile)
+        closure_complete = True
+    closure_incomplete = False
+    if journal and not closure_complete and journal.is_resumed():
+        log.info(" Resuming an interrupted fetch with %s journaled probes "
+                 "and %s completed clones.", len(journal.probes),
+                 len(journal.cloned))
+        cleaned = journal.clean_partials()
+        if cleaned:
+            log.info(" Removed partial clones of: %s", ", ".join(cleaned))
+
+    # All rounds share the workers and what the limiters learn.
+    with Session.borrow(session, num_threads) as session:
+        # loop until there are no new dependencies left to download
+        while not closure_complete:
+            log.info(" Searching for dependencies.")
+            deps_to_fetch = {}
+            available_pkgs = [pkg.name
+                              for _, pkg in workspace_packages.items()]
+            initial_cloned_pkgs = len(already_fetched)
+            while True:
+                to_parse = [
+                    (package.name, path.join(ws_path, package_path))
+                    for package_path, package in workspace_packages.items()
+                    if package.name not in already_fetched and
+                    (fetch_all or package.name in packages)]
+                if not to_parse:
+                    break
+                parsed = Parser.parse_packages(to_parse, default_urls,
+                                               tags=tags, session=session)
+                for pkg_name, package_deps in parsed:
+                    already_fetched.add(pkg_name)
+                    if package_deps is None:
+                        continue
+                    if scheduler:
+                        scheduler.record_dependencies(pkg_name,
+                                                      package_deps.keys())
+                    deps_to_fetch = Tools.update_deps_dict(
+                        deps_to_fetch, package_deps)
+                    if deps_to_fetch is None:
+                        sys.exit(1)
+                    for new_dep_name in deps_to_fetch.keys():
+                        # make sure we don't stop until we analyzed all
+                        # dependencies as we have just added these
+                        # repositories we must analyze their dependencies
+                        # too even if we wanted to download dependencies
+                        # for one project only.
+                        packages.add(new_dep_name)
+            try:
+                downloader = Downloader(ws_path=ws_path,
+                                        available_pkgs=available_pkgs,
+                                        ignore_pkgs=session.ignore_pkgs,
+                                        use_preprint=use_preprint,
+                                        url_ranker=url_ranker,
+                                        scheduler=scheduler,
+                                        session=session,
+                                        system_pkgs=session.system_pkgs,
+                                        history=history,
+                                        backend=backend,
+                                        journal=journal)
+            except ValueError as e:
+                log.critical(" Encountered error. Abort.")
+                log.critical(" Error message: %s", e.message)
+                return 1
+            error_code = downloader.download_dependencies(deps_to_fetch)
+            if downloader.not_found:
+                closure_incomplete = True
+            if url_ranker:
+                url_ranker.save()
+            if scheduler:
+                scheduler.save()
+            if len(already_fetched) == initial_cloned_pkgs:
+                log.info(" No new dependencies. Done.")
+                break
+            if error_code != 0:
+                global_error_code = error_code
+            log.info(" New packages available. "
+                     "Process their dependencies now.")
+            workspace_packages = find_packages(
+                context.source_space_abs,
+                exclude_subspaces=True, warnings=[])
+        if closure_cache and not closure_complete and not closure_incomplete \
+                and global_error_code == Downloader.NO_ERROR:
+            # The fetched packages brought their own manifests along.
+            closure_key = ClosureCache.make_key(
+                dep_profile, requested_packages, initial_urls,
+                ClosureCache.manifest_mtimes(context.source_space_abs,
+                                             workspace_packages))
+            closure_cache.save(closure_key, already_fetched)
+        if journal and global_error_code == Downloader.NO_ERROR:
+            journal.finish()
+        if pull_after_fetch:
+            updater = Updater(ws_path=ws_path,
+                              packages=workspace_packages,
+                              use_preprint=use_preprint,
+                              num_threads=num_threads,
+                              history=history,
+                              backend=backend,
+                              session=session,
+                              sync_state=sync_state)
+            updater.update_packages(packages)
+            if sync_state:
+                sync_state.save()
+        return global_error_code
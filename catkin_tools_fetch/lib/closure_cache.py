@@ -0,0 +1,84 @@
+"""Remembers which dependency closures are already complete.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import os
+import logging
+from os import path
+
+from catkin_tools_fetch.lib.tools import Tools
+
+log = logging.getLogger('deps')
+
+
+class ClosureCache(object):
+    """Cache of resolved dependency closures, one file per profile.
+
+    After a successful fetch, the state of the workspace that led to it is
+    stored: the profile, the requested packages, the url templates and the
+    modification time of every manifest. If a later fetch finds the very same
+    state, all dependencies of the profile were already resolved and there is
+    nothing to probe or clone. Any edited, added or removed manifest makes
+    the cache stale.
+
+    Attributes:
+        FOLDER (str): Folder inside the workspace that holds the caches.
+        cache_path (str): Path to the cache file of one profile.
+    """
+
+    FOLDER = path.join('.catkin_tools', 'deps')
+
+    def __init__(self, cache_path):
+        """Initialize the cache stored in a file."""
+        super(ClosureCache, self).__init__()
+        self.cache_path = cache_path
+
+    @staticmethod
+    def default_cache_path(workspace, profile):
+        """Get the cache file of a profile inside the workspace."""
+        return path.join(workspace, ClosureCache.FOLDER,
+                         'closure_{}.json'.format(profile))
+
+    @staticmethod
+    def manifest_mtimes(ws_path, workspace_packages):
+        """Get the modification times of all manifests in the workspace.
+
+        Args:
+            ws_path (str): Workspace source path.
+            workspace_packages (dict): {package folder: package}.
+
+        Returns:
+            dict: {package folder: mtime}
+        """
+        mtimes = {}
+        for package_path in workspace_packages:
+            path_to_xml = path.join(ws_path, package_path, 'package.xml')
+            try:
+                mtimes[package_path] = os.stat(path_to_xml).st_mtime
+            except OSError:
+                mtimes[package_path] = None
+        return mtimes
+
+    @staticmethod
+    def make_key(profile, packages, default_urls, mtimes):
+        """Generate the state of the workspace that identifies a closure."""
+        return {'profile': profile,
+                'packages': sorted(packages),
+                'default_urls': sorted(default_urls),
+                'manifests': mtimes}
+
+    def is_complete(self, key):
+        """Check if the closure for this state was resolved before."""
+        cached = Tools.load_json(self.cache_path, default={})
+        return cached.get('key') == key
+
+    def save(self, key, closure):
+        """Store a resolved closure.
+
+        Args:
+            key (dict): State of the workspace, see make_key.
+            closure (iterable): Names of all packages in the closure.
+        """
+        return Tools.save_json(self.cache_path,
+                               {'key': key, 'closure': sorted(closure)})
@@ -0,0 +1,224 @@
+"""Adapts the number of parallel git operations to what the system handles.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import time
+import logging
+from threading import BoundedSemaphore
+from threading import Condition
+from threading import Lock
+
+log = logging.getLogger('deps')
+
+
+class AdaptiveLimiter(object):
+    """Limit the number of parallel tasks of one phase with AIMD.
+
+    Probes are bound by latency and scale to many parallel tasks, clones and
+    pulls are bound by bandwidth and disk and degrade past a handful. So each
+    phase gets its own limiter that adapts after every window of completed
+    tasks: the limit is halved if any task failed in the window, it is
+    decreased by one if the throughput dropped after the last increase and
+    increased by one otherwise. The limit never exceeds the ceiling.
+    Limiters may also share a semaphore that caps the tasks of all their
+    phases together.
+
+    Attributes:
+        DEFAULT_CEILINGS (dict): {phase: ceiling} used if the user gives none.
+        INITIAL_LIMIT (int): Limit to start with if not given otherwise.
+        TOLERANCE (float): Relative throughput drop that counts as a drop.
+        phase (str): Name of the phase, used for logging.
+        ceiling (int): Maximum limit.
+        limit (float): Current limit.
+        history (list): All limits set so far.
+    """
+
+    DEFAULT_CEILINGS = {'probe': 32, 'clone': 8, 'pull': 8, 'maintain': 4}
+    INITIAL_LIMIT = 4
+    TOLERANCE = 0.1
+
+    def __init__(self, phase, ceiling=None, initial=None, clock=time.time,
+                 shared=None):
+        """Initialize the limiter.
+
+        Args:
+            phase (str): Name of the phase, e.g. 'probe'.
+            ceiling (int): Maximum limit, the default for the phase if None.
+            initial (int): Limit to start with.
+            clock (callable): Returns current time in seconds.
+            shared (BoundedSemaphore): Held by every running task, shared
+                with the limiters of other phases. No common cap if None.
+        """
+        super(AdaptiveLimiter, self).__init__()
+        self.phase = phase
+        if not ceiling:
+            ceiling = AdaptiveLimiter.DEFAULT_CEILINGS.get(
+                phase, AdaptiveLimiter.INITIAL_LIMIT)
+        self.ceiling = max(1, ceiling)
+        if not initial:
+            initial = AdaptiveLimiter.INITIAL_LIMIT
+        self.limit = float(min(initial, self.ceiling))
+        self.history = [int(self.limit)]
+        self.__clock = clock
+        self.__shared = shared
+        self.__condition = Condition()
+        self.__active = 0
+        self.__next_ticket = 0
+        self.__serving = 0
+        self.__window_start = None
+        self.__completed = 0
+        self.__errors = 0
+        self.__last_throughput = None
+        self.__last_increased = False
+
+    @staticmethod
+    def for_phases(phases, ceiling=None):
+        """Create a limiter for each phase, all capped by the same ceiling.
+
+        A user given ceiling caps the tasks of all phases together, not
+        just of each phase, so that `-j N` never runs more than N tasks.
+
+        Args:
+            phases (str[]): Names of the phases.
+            ceiling (int): User given ceiling. Phase defaults if None.
+
+        Returns:
+            dict: {phase: AdaptiveLimiter}
+        """
+        shared = BoundedSemaphore(max(1, ceiling)) if ceiling else None
+        return {phase: AdaptiveLimiter(phase, ceiling, shared=shared)
+                for phase in phases}
+
+    def acquire(self):
+        """Block until a task may start. Tasks start in the order they come."""
+        with self.__condition:
+            ticket = self.__next_ticket
+            self.__next_ticket += 1
+            while ticket != self.__serving or \
+                    self.__active >= int(self.limit):
+                self.__condition.wait()
+            self.__serving += 1
+            self.__active += 1
+            if self.__window_start is None:
+                self.__window_start = self.__clock()
+            self.__condition.notify_all()
+        if self.__shared:
+            # Only running tasks hold it, so waiting here cannot deadlock.
+            self.__shared.acquire()
+
+    def release(self, error=False):
+        """Mark a task as finished and adapt the limit.
+
+        Args:
+            error (bool): True if the task failed.
+        """
+        if self.__shared:
+            self.__shared.release()
+        with self.__condition:
+            self.__active -= 1
+            self.__completed += 1
+            if error:
+                self.__errors += 1
+            if self.__completed >= max(2, int(self.limit)):
+                self.__adapt()
+            self.__condition.notify_all()
+
+    def call(self, is_error, func, *args):
+        """Run a function once the limit allows it.
+
+        Args:
+            is_error (callable): Tells from the result if the task failed.
+                May be None, then only exceptions count as failures.
+            func (callable): Function to run.
+            *args: Arguments to the function.
+
+        Returns:
+            object: The result of the function.
+        """
+        self.acquire()
+        error = True
+        try:
+            result = func(*args)
+            error = bool(is_error(result)) if is_error else False
+            return result
+        finally:
+            self.release(error)
+
+    def __adapt(self):
+        """Set a new limit from the last window. Holds the condition."""
+        now = self.__clock()
+        elapsed = max(now - self.__window_start, 1e-6)
+        throughput = self.__completed / elapsed
+        old_limit = int(self.limit)
+        if self.__errors:
+            self.limit = max(1.0, self.limit / 2.0)
+            self.__last_increased = False
+        elif self.__last_increased and self.__last_throughput and \
+                throughput < self.__last_throughput * (
+                    1.0 - AdaptiveLimiter.TOLERANCE):
+            self.limit = max(1.0, self.limit - 1.0)
+            self.__last_increased = False
+        else:
+            self.__last_increased = self.limit < self.ceiling
+            self.limit = min(float(self.ceiling), self.limit + 1.0)
+        if int(self.limit) != old_limit:
+            log.debug(" [%s]: %.1f tasks/s, %s errors. Limit %s -> %s.",
+                      self.phase, throughput, self.__errors,
+                      old_limit, int(self.limit))
+        self.history.append(int(self.limit))
+        self.__last_throughput = throughput
+        self.__window_start = now
+        self.__completed = 0
+        self.__errors = 0
+
+
+class IoBudget(object):
+    """Limit the rate of disk-heavy work with a token bucket.
+
+    Every task consumes the number of bytes it is expected to read and
+    write. The bucket refills at the given rate and may go into debt, in
+    which case the task waits until the debt is paid off. So a single big
+    task is never blocked forever and many small ones can run in bursts.
+
+    Attributes:
+        rate (float): Budget in bytes per second. No limit if None.
+    """
+
+    def __init__(self, rate=None, clock=time.time, sleep=time.sleep):
+        """Initialize a full bucket.
+
+        Args:
+            rate (float): Budget in bytes per second. No limit if None.
+            clock (callable): Returns current time in seconds.
+            sleep (callable): Sleeps for a number of seconds.
+        """
+        super(IoBudget, self).__init__()
+        self.rate = rate
+        self.__clock = clock
+        self.__sleep = sleep
+        self.__lock = Lock()
+        self.__tokens = float(rate) if rate else 0.0
+        self.__last = clock()
+
+    def consume(self, amount):
+        """Wait until the budget allows to process amount bytes.
+
+        Args:
+            amount (int): Expected number of bytes.
+
+        Returns:
+            float: Seconds waited.
+        """
+        if not self.rate:
+            return 0.0
+        with self.__lock:
+            now = self.__clock()
+            self.__tokens = min(float(self.rate), self.__tokens +
+                                (now - self.__last) * self.rate)
+            self.__last = now
+            self.__tokens -= amount
+            wait = -self.__tokens / self.rate if self.__tokens < 0 else 0.0
+        if wait > 0:
+            self.__sleep(wait)
+        return wait
@@ -7,6 +7,7 @@ import os
 import logging
 from os import path
 from xml.dom import minidom
+from xml.parsers.expat import ExpatError
 
 from catkin_tools_fetch.lib.tools import Tools
 from catkin_tools_fetch.lib.printer import Printer
@@ -15,23 +16,40 @@ log = logging.getLogger('deps')
 
 
 class Dependency(object):
-    """Incapsulate a single dependency here."""
+    """Incapsulate a single dependency here.
 
-    def __init__(self, name, url=None, branch=None):
+    Attributes:
+        sha (str): Commit of the branch, set once the repository is found.
+        probe_error (bool): The last probe hit a network error on some url,
+            so a dependency that was not found may still exist.
+        subdir (str): Folder of the package inside its repository. Only this
+            folder is checked out if set.
+    """
+
+    def __init__(self, name, url=None, branch=None, subdir=None):
         """Initialize a dependency.
 
         Args:
             name (str): Name of the dependee package
             url (str): Explicit location url
             branch (str): Name of branch
+            subdir (str): Folder of the package inside the repository
         """
         self.name = name
         self.url = url
         self.branch = branch
-        self.default_urls = set()
+        self.subdir = subdir
+        self.sha = None
+        self.probe_error = False
+        self.default_urls = []
+        self.url_templates = {}
 
     def set_default_urls_if_needed(self, default_urls):
-        """Set default urls if no url set before."""
+        """Set default urls if no url set before.
+
+        The urls are sorted by their templates to keep the probing order
+        deterministic. A `UrlRanker` can reorder them later on.
+        """
         if not default_urls:
             return
         if self.url:
@@ -39,13 +57,23 @@ class Dependency(object):
                 " Package [%s]: Skip default urls. Explicit one defined: %s",
                 self.name, self.url)
             return
-        self.default_urls = Tools.populate_urls_with_name(urls=default_urls,
-                                                          pkg_name=self.name)
+        self.default_urls = []
+        self.url_templates = {}
+        for template in sorted(default_urls):
+            populated = Tools.populate_urls_with_name(urls=[template],
+                                                      pkg_name=self.name)
+            if not populated:
+                continue
+            self.default_urls.append(populated[0])
+            self.url_templates[template] = populated[0]
 
     def __repr__(self):
         """Show how to print it."""
-        return "name: '{}', branch: '{}', url: '{}'".format(
+        text = "name: '{}', branch: '{}', url: '{}'".format(
             self.name, self.branch, self.url)
+        if self.subdir:
+            text += ", subdir: '{}'".format(self.subdir)
+        return text
 
 
 class Parser(object):
@@ -53,22 +81,41 @@ class Parser(object):
 
     Attributes:
         pkg_name (str): Name of currently parsed package.
-        TAGS (list): A list of tags that we want to parse.
+        tags (list): Dependency tags parsed for the chosen profile.
+        PROFILES (dict): {profile: tags} dependency tags that are needed to
+            build, run, test or document a package, or all of them.
+        DEFAULT_PROFILE (str): Profile used if none is given.
+        TAGS (list): A list of tags that we parse by default.
         URL_TAGS (list): A list of tags to consider when parsing explicit urls.
         XML_FILE_NAME (str): A generic xml name of package to be parsed.
     """
 
     XML_FILE_NAME = "package.xml"
-    TAGS = ["build_depend", "depend"]
+    PROFILES = {
+        'build': ["build_depend", "build_export_depend", "depend"],
+        'exec': ["exec_depend", "run_depend", "depend"],
+        'test': ["build_depend", "build_export_depend", "depend",
+                 "exec_depend", "run_depend", "test_depend"],
+        'doc': ["build_depend", "build_export_depend", "depend",
+                "doc_depend"],
+        'full': ["buildtool_depend", "build_depend", "build_export_depend",
+                 "depend", "exec_depend", "run_depend", "test_depend",
+                 "doc_depend"],
+    }
+    DEFAULT_PROFILE = 'build'
+    TAGS = PROFILES[DEFAULT_PROFILE]
     URL_TAGS = ["git_url"]
+    PROCESS_POOL_THRESHOLD = 200
 
-    def __init__(self, default_urls, pkg_name):
+    def __init__(self, default_urls, pkg_name, tags=None, quiet=False):
         """Initialize a dependency parser.
 
         Args:
             default_urls (set(str)): a set of masks containing {package}
                 tag to be replaced later, e.g. git@<path>/{package}.git
             pkg_name (str): Name of current package
+            tags (list): Dependency tags to parse, TAGS if None.
+            quiet (bool): Do not print what was found.
         """
         super(Parser, self).__init__()
         # First perform a sanity check.
@@ -79,6 +126,8 @@ class Parser(object):
                 raise ValueError(error)
         self.default_urls = default_urls
         self.pkg_name = pkg_name
+        self.tags = tags if tags else Parser.TAGS
+        self.quiet = quiet
         self.printer = Printer()
 
     def get_dependencies(self, package_folder):
@@ -97,17 +146,108 @@ class Parser(object):
             return None
         xmldoc = minidom.parse(path_to_xml)
         all_deps = []
-        for tag in Parser.TAGS:
+        for tag in self.tags:
             deps = Parser.__node_to_list(xmldoc, tag)
             deps = Parser.__fix_dependencies(deps, self.pkg_name)
             all_deps += deps
-        msg = " {}: Found {} valid dependencies".format(
-            Tools.decorate(self.pkg_name), len(all_deps))
-        self.printer.print_msg(msg)
+        if not self.quiet:
+            msg = " {}: Found {} valid dependencies".format(
+                Tools.decorate(self.pkg_name), len(all_deps))
+            self.printer.print_msg(msg)
         log.debug(" Dependencies: %s", all_deps)
         deps_with_urls = self.__init_dep_dict(all_deps)
         return self.__update_explicit_values(xmldoc, deps_with_urls)
 
+    @staticmethod
+    def parse_packages(packages, default_urls, tags=None, quiet=False,
+                       session=None):
+        """Parse many packages in parallel.
+
+        Each package is parsed with its own copy of the default urls. The
+        results are then merged in the order of package names as if the
+        packages were parsed one by one in that order: the default urls that
+        a package adds with `target="all"` are used for its own dependencies
+        and for all packages after it. This keeps the result deterministic.
+        Very large workspaces are parsed in the process pool of the session.
+
+        Args:
+            packages (list): [(pkg_name, package_folder)] to parse.
+            default_urls (set(str)): Url templates. Updated in place with the
+                templates found in the manifests.
+            tags (list): Dependency tags to parse, TAGS if None.
+            quiet (bool): Do not print what was found.
+            session (Session): Lends its workers, packages are parsed one by
+                one if None.
+
+        Returns:
+            list: [(pkg_name, deps)] sorted by name, deps is a dict
+                {name: dep} or None if the package could not be parsed.
+        """
+        packages = sorted(packages)
+        initial_urls = set(default_urls)
+        map_func = map
+        if session and len(packages) > Parser.PROCESS_POOL_THRESHOLD:
+            map_func = session.process_pool.map
+        elif session:
+            map_func = session.thread_pool.map
+        results = list(map_func(
+            Parser.parse_package,
+            [initial_urls] * len(packages),
+            [pkg_name for pkg_name, _ in packages],
+            [folder for _, folder in packages],
+            [tags] * len(packages),
+            [quiet] * len(packages)))
+        merged = []
+        for (pkg_name, _), (deps, parser_urls) in zip(packages, results):
+            default_urls.update(parser_urls)
+            if deps is not None:
+                for dep in deps.values():
+                    if not dep.url:
+                        dep.set_default_urls_if_needed(default_urls)
+            merged.append((pkg_name, deps))
+        return merged
+
+    @staticmethod
+    def parse_package(default_urls, pkg_name, package_folder, tags=None,
+                      quiet=False):
+        """Parse a single package with its own copy of default urls.
+
+        Args:
+            default_urls (set(str)): Url templates.
+            pkg_name (str): Name of the package.
+            package_folder (str): A folder to search package.xml in.
+            tags (list): Dependency tags to parse, TAGS if None.
+            quiet (bool): Do not print what was found.
+
+        Returns:
+            tuple: (deps, default_urls) with a dict {name: dep} or None and
+                the default urls including the ones found in the manifest.
+        """
+        parser = Parser(default_urls=set(default_urls), pkg_name=pkg_name,
+                        tags=tags, quiet=quiet)
+        return parser.get_dependencies(package_folder), parser.default_urls
+
+    @staticmethod
+    def get_package_name(path_to_xml):
+        """Read the name of a package from its `package.xml` file.
+
+        Args:
+            path_to_xml (str): Path to the `package.xml` file.
+
+        Returns:
+            str: Name of the package or None if it cannot be read.
+        """
+        try:
+            xmldoc = minidom.parse(path_to_xml)
+            names = Parser.__node_to_list(xmldoc, 'name')
+        except (IOError, OSError, ExpatError, IndexError) as e:
+            log.debug(" Cannot read package name from '%s': %s",
+                      path_to_xml, e)
+            return None
+        if not names:
+            return None
+        return names[0].strip()
+
     @staticmethod
     def __fix_dependencies(deps, pkg_name):
         """Fix dependencies if they are malformed.
@@ -153,16 +293,21 @@ class Parser(object):
                     continue
                 log.debug(" read target:'%s'", target)
                 url = Parser.__get_attr('url', item)
+                if url and target == 'all':
+                    # The target is 'all' so this denotes a default url.
+                    prepared_url = Tools.prepare_default_url(url)
+                    if prepared_url:
+                        self.default_urls.add(prepared_url)
+                    else:
+                        log.error("Url: '%s' is wrongly formatted.", url)
+                    # We are done reading this entry, skip to next now.
+                    continue
+                if target not in dep_dict:
+                    # E.g. a build dependency while only exec ones are read.
+                    log.debug(" skip target '%s' that is not a dependency.",
+                              target)
+                    continue
                 if url:
-                    if target == 'all':
-                        # The target is 'all' so this denotes a default url.
-                        prepared_url = Tools.prepare_default_url(url)
-                        if prepared_url:
-                            self.default_urls.add(prepared_url)
-                        else:
-                            log.error("Url: '%s' is wrongly formatted.", url)
-                        # We are done reading this entry, skip to next now.
-                        continue
                     # Here we assume url is a full explicit url to package.
                     dep_dict[target].url = url
                     log.debug(" target url:'%s'", url)
@@ -170,6 +315,15 @@ class Parser(object):
                 if branch:
                     dep_dict[target].branch = branch
                     log.debug(" target branch:'%s'", branch)
+                subdir = Parser.__get_attr('subdir', item)
+                if subdir:
+                    subdir = Tools.normalize_subdir(subdir)
+                    if subdir:
+                        dep_dict[target].subdir = subdir
+                        log.debug(" target subdir:'%s'", subdir)
+                    else:
+                        log.error("Subdir of '%s' must be a relative path "
+                                  "inside the repository.", target)
                 log.debug(" updated dependency: %s", dep_dict[target])
         # Update the default urls for all dependencies
         for dep in dep_dict.values():
@@ -3,7 +3,10 @@
 Attributes:
     log (logging.Log): logger
 """
+import time
+import heapq
 import logging
+import collections
 
 from os import path
 from termcolor import colored
@@ -11,7 +14,10 @@ from concurrent import futures
 
 from catkin_tools_fetch.lib.tools import Tools
 from catkin_tools_fetch.lib.tools import GitBridge
+from catkin_tools_fetch.lib.history import RunHistory
 from catkin_tools_fetch.lib.printer import Printer
+from catkin_tools_fetch.lib.progress import CloneProgress
+from catkin_tools_fetch.lib.session import Session
 
 log = logging.getLogger('deps')
 
@@ -22,14 +28,33 @@ class Downloader(object):
     Attributes:
         available_pkgs (str[]): dict of available packages in workspace
         ignore_pkgs (set): a set of packages to ignore (mostly ROS ones).
+        system_pkgs (set): system dependencies installed by rosdep.
+        url_ranker (UrlRanker): orders and learns default urls, may be None.
+        scheduler (CloneScheduler): orders the clones, may be None.
+        progress (dict): {name: CloneProgress} of the clones of this run.
+        not_found (set): names of dependencies that no url hosts.
+        session (Session): lends the worker pool, limiters and printer,
+            may be None.
+        history (RunHistory): records every probe and clone, may be None.
+        journal (FetchJournal): records every probe and clone to resume an
+            interrupted fetch, may be None.
+        default_branch (str): branch cloned for dependencies without one,
+            the default branch of each remote if None.
+        backend (GitBackend): probes and clones repositories.
         ws_path (str): Workspace path. This is where packages live.
     """
 
     IGNORE_TAG = colored("[IGNORED]", 'yellow')
+    SYSTEM_TAG = colored("[SYSTEM]", 'cyan')
     NOT_FOUND_TAG = colored("[NOT FOUND]", 'red')
     FOUND_TAG = colored("[FOUND]", 'green') + ': '
     CLONING_TAG = "[CLONING]"
     CHECKING_TAG = "[CHECKING]"
+    STALLED_TAG = colored("[STALLED]", 'yellow')
+
+    SHA_LENGTH = 7
+    PROGRESS_PERIOD = 0.5
+    STALL_TIMEOUT = 60.0
 
     NO_ERROR = 0
 
@@ -38,13 +63,43 @@ class Downloader(object):
                  available_pkgs,
                  ignore_pkgs,
                  use_preprint=True,
-                 num_threads=4):
+                 num_threads=None,
+                 url_ranker=None,
+                 scheduler=None,
+                 progress_callback=None,
+                 session=None,
+                 system_pkgs=None,
+                 history=None,
+                 backend=GitBridge,
+                 journal=None,
+                 default_branch=GitBridge.DEFAULT_BRANCH):
         """Init a downloader.
 
         Args:
             ws_path (str): Workspace path. This is where packages live.
             available_pkgs (iterable): dict of available packages in workspace.
             ignore_pkgs (iterable): set of packages to ignore (e.g. ROS ones).
+            num_threads (int): Maximum number of parallel probes and clones.
+                Each phase adapts its own limit up to a default if None.
+            url_ranker (UrlRanker): Orders default urls before probing them.
+            scheduler (CloneScheduler): Orders clones, critical ones first.
+            progress_callback (callable): Called with a CloneProgress every
+                time a clone makes progress.
+            session (Session): Lends its worker pool, limiters and printer,
+                so that they are shared across downloaders. A session of
+                its own is used for every download and closed afterwards if
+                None.
+            system_pkgs (iterable): System dependencies, e.g. a RosdepIndex.
+                They are never probed unless they have an explicit url.
+            history (RunHistory): Records the duration and outcome of every
+                probe and clone.
+            backend (GitBackend): Probes and clones repositories, git
+                command line by default.
+            journal (FetchJournal): Journals every probe and clone and
+                provides the probe results of an interrupted fetch.
+            default_branch (str): Branch to clone for dependencies without
+                one. None clones the default branch of each remote, as
+                vcstool does for `.repos` entries without a version.
         """
         super(Downloader, self).__init__()
         if not path.exists(ws_path):
@@ -55,9 +110,20 @@ class Downloader(object):
         self.ws_path = ws_path
         self.available_pkgs = available_pkgs
         self.ignore_pkgs = ignore_pkgs
-        self.thread_pool = futures.ThreadPoolExecutor(max_workers=num_threads)
+        self.system_pkgs = system_pkgs if system_pkgs else set()
+        self.session = session
+        self.num_threads = num_threads
         self.use_preprint = use_preprint
-        self.printer = Printer()
+        self.url_ranker = url_ranker
+        self.scheduler = scheduler
+        self.progress_callback = progress_callback
+        self.progress = {}
+        self.not_found = set()
+        self.history = history
+        self.backend = backend
+        self.journal = journal
+        self.default_branch = default_branch
+        self.printer = session.printer if session else Printer()
 
     def download_dependencies(self, dep_dict):
         """Check and download dependencies from a dependency dictionary.
@@ -72,99 +138,273 @@ class Downloader(object):
             raise ValueError("expected a dictionary with dependencies.")
         for dep in dep_dict.values():
             log.debug(" dep before: %s", dep)
-        checked_deps = self.__check_dependencies(dep_dict)
-        return self.__clone_dependencies(checked_deps)
+        to_probe = self.__filter_dependencies(dep_dict)
+        if not to_probe:
+            return Downloader.NO_ERROR
+        log.info(" Checking and cloning dependencies:")
+        with Session.borrow(self.session, self.num_threads) as session:
+            return self.__run_pipeline(session, to_probe, [])
+
+    def clone_dependencies(self, dep_dict):
+        """Clone dependencies with known urls without checking them first.
+
+        Args:
+            dep_dict (dict): dictionary {name: dep} with dependencies. The
+                name is also the folder to clone into, relative to ws_path.
 
-    def __clone_dependency(self, pkg_name, url, dep_path, branch):
+        Returns:
+            int: Return code. 0 if all fine. Git error code otherwise.
+        """
+        if not dep_dict:
+            return Downloader.NO_ERROR
+        log.info(" Cloning dependencies:")
+        with Session.borrow(self.session, self.num_threads) as session:
+            return self.__run_pipeline(session, [], list(dep_dict.values()))
+
+    def __clone_dependency(self, pkg_name, url, dep_path, branch,
+                           subdir=None, sha=None):
         """Clone a single dependency. Return a future to the clone process."""
         if self.use_preprint:
             msg = " {}: {}".format(Tools.decorate(pkg_name),
                                    Downloader.CLONING_TAG)
             self.printer.add_msg(pkg_name, msg)
-        return GitBridge.clone(pkg_name, url, dep_path, branch)
+        progress = CloneProgress(pkg_name)
+        self.progress[pkg_name] = progress
+        last_print = [progress.started]
+
+        def on_progress(line):
+            if not progress.update(line):
+                return
+            if self.progress_callback:
+                self.progress_callback(progress)
+            now = time.time()
+            if self.use_preprint and \
+                    now - last_print[0] > Downloader.PROGRESS_PERIOD:
+                last_print[0] = now
+                msg = " {}: {} {}".format(Tools.decorate(pkg_name),
+                                          Downloader.CLONING_TAG, progress)
+                self.printer.update_msg(pkg_name, msg)
+
+        if self.journal:
+            self.journal.record_cloning(pkg_name, dep_path)
+        pkg_name, clone_result = self.backend.clone(
+            pkg_name, url, dep_path, branch, on_progress=on_progress,
+            subdir=subdir, sha=sha)
+        progress.finish()
+        if self.journal and clone_result != GitBridge.ERROR_TAG:
+            self.journal.record_cloned(pkg_name)
+        if not progress.received_bytes and clone_result not in [
+                GitBridge.ERROR_TAG, GitBridge.EXISTS_TAG]:
+            # Git skips the byte counter for transfers that finish quickly.
+            progress.received_bytes = Tools.folder_size(
+                path.join(dep_path, '.git', 'objects', 'pack'))
+        if self.scheduler and clone_result not in [GitBridge.ERROR_TAG,
+                                                   GitBridge.EXISTS_TAG]:
+            self.scheduler.record_size(
+                pkg_name, self.scheduler.repository_size(dep_path))
+        if self.history:
+            outcome = RunHistory.OK
+            if clone_result == GitBridge.ERROR_TAG:
+                outcome = RunHistory.ERROR
+            elif clone_result == GitBridge.EXISTS_TAG:
+                outcome = RunHistory.SKIPPED
+            self.history.record(pkg_name, 'clone', progress.duration(),
+                                outcome, url=url,
+                                num_bytes=progress.received_bytes)
+        return pkg_name, clone_result
+
+    def __run_pipeline(self, session, to_probe, to_clone):
+        """Probe dependencies and clone each one as soon as it is found.
 
-    def __clone_dependencies(self, checked_deps):
-        """Clone dependencies.
+        A clone does not wait for the probes of other dependencies, so the
+        slowest probe only delays its own clone. Only as many tasks of a
+        phase are submitted as its limiter may ever run at once, so that
+        probes and clones never queue up behind each other in the shared
+        pool. Among the dependencies that are ready to clone, the scheduler
+        picks which goes first.
 
         Args:
-            checked_deps (dict): Dict {name: dep} with valid dependencies.
+            session (Session): Lends the worker pool and limiters.
+            to_probe (list): Dependencies to probe, then clone if found.
+            to_clone (list): Dependencies to clone right away.
 
         Returns:
-            int: Error code. 0 if all fine, Result from git error otherwise.
+            int: Error code. 0 if all fine, 1 if a clone failed.
         """
-        if not checked_deps:
-            # exit early if there is nothing to download
-            return Downloader.NO_ERROR
-        log.info(" Cloning valid dependencies:")
+        names = [dep.name for dep in to_probe + to_clone]
+        if self.scheduler:
+            names = self.scheduler.order(names)
+        rank = {name: i for i, name in enumerate(names)}
+        to_probe = collections.deque(
+            sorted(to_probe, key=lambda dep: rank[dep.name]))
+        ready = []
+        for dependency in to_clone:
+            self.__add_ready(ready, rank, dependency)
+        probes = {}
+        clones = set()
+        found = 0
         error_code = Downloader.NO_ERROR
-        # store all tasks in a futures list
-        futures_list = []
-        for name, dependency in checked_deps.items():
-            url = dependency.url
-            branch = dependency.branch
-            log.debug(" prepare clone: url: %s, branch: %s", url, branch)
-            if not branch:
-                branch = "master"
-            if name in self.available_pkgs:
+        started = time.time()
+        stalled = set()
+        while to_probe or probes or ready or clones:
+            while to_probe and \
+                    len(probes) < session.limiters['probe'].ceiling:
+                dependency = to_probe.popleft()
+                probes[session.thread_pool.submit(
+                    session.limiters['probe'].call,
+                    Downloader.__probe_failed, self.__check_dependency,
+                    dependency)] = dependency
+            while ready and len(clones) < session.limiters['clone'].ceiling:
+                _, _, dependency = heapq.heappop(ready)
+                clones.add(self.__submit_clone(session, dependency))
+            done, _ = futures.wait(
+                list(probes) + list(clones),
+                timeout=Downloader.PROGRESS_PERIOD,
+                return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                if future in probes:
+                    del probes[future]
+                    dependency, repo_found = future.result()
+                    if self.__report_probe(dependency, repo_found):
+                        found += 1
+                        self.__add_ready(ready, rank, dependency)
+                    continue
+                clones.discard(future)
+                pkg_name, clone_result = future.result()
                 msg = " {}: {}".format(
-                    Tools.decorate(name), GitBridge.EXISTS_TAG)
-                self.printer.purge_msg(name, msg)
-                continue
-            dep_path = path.join(self.ws_path, name)
-            future = self.thread_pool.submit(
-                self.__clone_dependency, name, url, dep_path, branch)
-            futures_list.append(future)
-        # we have all the futures ready. Now just wait for them to finish.
-        for future in futures.as_completed(futures_list):
-            pkg_name, clone_result = future.result()
-            msg = " {}: {}".format(
-                Tools.decorate(pkg_name), clone_result)
-            self.printer.purge_msg(pkg_name, msg)
-            if clone_result == GitBridge.ERROR_TAG:
-                error_code = 1
+                    Tools.decorate(pkg_name), clone_result)
+                self.printer.purge_msg(pkg_name, msg)
+                if clone_result == GitBridge.ERROR_TAG:
+                    error_code = 1
+            stalled = self.__report_stalled(stalled)
+        if found or self.not_found:
+            log.info(" Found %s of %s dependencies.", found,
+                     found + len(self.not_found))
+        if self.not_found:
+            log.info(" Not found: %s", ", ".join(sorted(self.not_found)))
+        self.__report_throughput(time.time() - started)
         return error_code
 
+    def __add_ready(self, ready, rank, dependency):
+        """Queue a found dependency for cloning unless it exists already."""
+        if dependency.name in self.available_pkgs:
+            msg = " {}: {}".format(
+                Tools.decorate(dependency.name), GitBridge.EXISTS_TAG)
+            self.printer.purge_msg(dependency.name, msg)
+            return
+        heapq.heappush(ready, (rank[dependency.name], dependency.name,
+                               dependency))
+
+    def __submit_clone(self, session, dependency):
+        """Submit the clone of a dependency to the pool."""
+        branch = dependency.branch
+        log.debug(" prepare clone: url: %s, branch: %s, subdir: %s",
+                  dependency.url, branch, dependency.subdir)
+        if not branch:
+            branch = self.default_branch
+        dep_path = path.join(self.ws_path, dependency.name)
+        return session.thread_pool.submit(
+            session.limiters['clone'].call, Downloader.__clone_failed,
+            self.__clone_dependency, dependency.name, dependency.url,
+            dep_path, branch, dependency.subdir, dependency.sha)
+
+    @staticmethod
+    def __probe_failed(result):
+        """Tell the probe limiter if a probe hit a network error."""
+        dependency, _ = result
+        return dependency.probe_error
+
+    @staticmethod
+    def __clone_failed(result):
+        """Tell the clone limiter if a clone failed."""
+        _, clone_result = result
+        return clone_result == GitBridge.ERROR_TAG
+
+    def __report_stalled(self, already_reported):
+        """Warn once about every clone that stopped making progress."""
+        stalled = set(
+            name for name, progress in list(self.progress.items())
+            if progress.is_stalled(Downloader.STALL_TIMEOUT))
+        for name in sorted(stalled - already_reported):
+            progress = self.progress[name]
+            log.warning(" %s: %s no progress for %.0f s. Last: %s",
+                        Tools.decorate(name), Downloader.STALLED_TAG,
+                        time.time() - progress.last_change, progress)
+        return stalled
+
+    def __report_throughput(self, duration):
+        """Log the total amount of data received by all clones."""
+        total_bytes = sum(progress.received_bytes
+                          for progress in self.progress.values())
+        if not total_bytes or duration <= 0:
+            return
+        log.info(" Received %s in %.1f s (%.2f MB/s).",
+                 CloneProgress.format_bytes(total_bytes), duration,
+                 total_bytes / duration / 1e6)
+
     def __check_dependency(self, dependency):
         if self.use_preprint:
             msg = " {}: {}".format(
                 Tools.decorate(dependency.name), Downloader.CHECKING_TAG)
             self.printer.add_msg(dependency.name, msg)
-        return GitBridge.repository_exists(dependency)
+        if self.journal:
+            repo_found = self.journal.probe_result(dependency)
+            if repo_found is not None:
+                log.debug(" Probe of '%s' was journaled.", dependency.name)
+                return dependency, repo_found
+        if self.url_ranker:
+            self.url_ranker.sort_dependency_urls(dependency)
+        started = time.time()
+        dependency, repo_found = self.backend.repository_exists(dependency)
+        if self.journal and repo_found:
+            self.journal.record_probe(dependency)
+        if self.url_ranker:
+            self.url_ranker.record(dependency, repo_found)
+        if self.history:
+            self.history.record(
+                dependency.name, 'probe', time.time() - started,
+                RunHistory.OK if repo_found else RunHistory.MISS,
+                url=dependency.url if repo_found else None)
+        return dependency, repo_found
 
-    def __check_dependencies(self, dep_dict):
-        """Check dependencies for validity.
-
-        We don't want to avoid packages that we ignore or those which
-        repositories do not exist.
+    def __filter_dependencies(self, dep_dict):
+        """Drop the dependencies that are ignored or installed by rosdep.
 
         Args:
             dep_dict (dict): A dictionary {name: dep} with dependencies.
 
         Returns:
-            dict: Only valid dependencies from the input dict.
+            list: Dependencies to probe.
         """
-        checked_deps = {}
-        if not dep_dict:
-            # exit early if there are no new dependencies
-            return checked_deps
-        futures_list = []
-        log.info(" Checking merged dependencies:")
+        to_probe = []
         for dependency in dep_dict.values():
             log.debug(" Check dependency: %s", dependency)
             if dependency.name in self.ignore_pkgs:
                 log.debug(" Skipping ignored package '%s'", dependency.name)
                 continue
-            futures_list.append(self.thread_pool.submit(
-                self.__check_dependency, dependency))
-        for future in futures.as_completed(futures_list):
-            dependency, repo_found = future.result()
-            if repo_found:
-                msg = " {}: {}".format(Tools.decorate(dependency.name),
-                                       Downloader.FOUND_TAG + dependency.url)
-                self.printer.purge_msg(dependency.name, msg)
-                checked_deps[dependency.name] = dependency
-            else:
+            if not dependency.url and dependency.name in self.system_pkgs:
                 msg = " {}: {}".format(
-                    Tools.decorate(dependency.name), Downloader.NOT_FOUND_TAG)
+                    Tools.decorate(dependency.name), Downloader.SYSTEM_TAG)
                 self.printer.purge_msg(dependency.name, msg)
-        return checked_deps
+                continue
+            to_probe.append(dependency)
+        return to_probe
+
+    def __report_probe(self, dependency, repo_found):
+        """Show the result of a probe.
+
+        Returns:
+            bool: True if the dependency was found.
+        """
+        if repo_found:
+            found = Downloader.FOUND_TAG + dependency.url
+            if dependency.sha:
+                found += " @ " + dependency.sha[:Downloader.SHA_LENGTH]
+            msg = " {}: {}".format(Tools.decorate(dependency.name), found)
+            self.printer.purge_msg(dependency.name, msg)
+            return True
+        self.not_found.add(dependency.name)
+        msg = " {}: {}".format(
+            Tools.decorate(dependency.name), Downloader.NOT_FOUND_TAG)
+        self.printer.purge_msg(dependency.name, msg)
+        return False
@@ -0,0 +1,310 @@
+"""An in-memory git backend for tests and benchmarks.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import os
+import time
+import hashlib
+import random
+import logging
+import subprocess
+from os import path
+from threading import Lock
+
+from catkin_tools_fetch.lib.tools import GitBackend
+from catkin_tools_fetch.lib.tools import GitBridge
+
+log = logging.getLogger('deps')
+
+PACKAGE_XML = """<?xml version="1.0"?>
+<package>
+  <name>{name}</name>
+  <version>0.0.0</version>
+  <description>{name}</description>
+  <maintainer email="fake@example.com">fake</maintainer>
+  <license>BSD</license>
+  <buildtool_depend>catkin</buildtool_depend>
+{depends}
+</package>
+"""
+
+
+class FakeGitBackend(GitBackend):
+    """Serve repositories from memory with simulated latency and failures.
+
+    Remotes live in a dictionary, so probes never touch the network. A clone
+    only writes the files of the remote, usually a single `package.xml`, so
+    the rest of the tool finds and parses the cloned packages as usual.
+
+    Attributes:
+        remotes (dict): {url: remote} where a remote is a dict with the
+            'files', 'branches' and the 'revision' of the remote.
+        clones (dict): {clone_path: local} where a local is a dict with the
+            'url', 'branch', 'revision', 'changes' and sparse 'subdir' of a
+            clone, and the remote revision 'fetched' by its last pull.
+        latency (dict): {operation: seconds} to sleep in every operation.
+        failures (dict): {operation: set of names or urls} that always fail.
+        failure_rate (float): Probability that any operation fails.
+        calls (list): Tuples (operation, target) of all calls so far.
+    """
+
+    OPERATIONS = ['status', 'pull', 'probe', 'clone', 'maintain', 'bundle']
+
+    def __init__(self, latency=None, failures=None, failure_rate=0.0, seed=0,
+                 sleep=time.sleep):
+        """Initialize an empty backend.
+
+        Args:
+            latency (float or dict): Seconds every operation takes, either
+                for all operations or as {operation: seconds}.
+            failures (dict): {operation: names or urls} that always fail.
+            failure_rate (float): Probability that any operation fails.
+            seed (int): Seed for the random failures.
+            sleep (callable): Sleeps for the latency, e.g. time.sleep.
+        """
+        super(FakeGitBackend, self).__init__()
+        if not isinstance(latency, dict):
+            latency = {operation: latency or 0.0
+                       for operation in FakeGitBackend.OPERATIONS}
+        self.latency = latency
+        self.failures = {operation: set(targets) for operation, targets
+                         in (failures or {}).items()}
+        self.failure_rate = failure_rate
+        self.remotes = {}
+        self.clones = {}
+        self.calls = []
+        self.__random = random.Random(seed)
+        self.__sleep = sleep
+        self.__lock = Lock()
+
+    def add_remote(self, url, name, depends=(), branches=("master",),
+                   files=None):
+        """Add a remote repository with a single catkin package.
+
+        Args:
+            url (str): Url of the remote.
+            name (str): Name of the package in it.
+            depends (str[]): Names of its build dependencies.
+            branches (str[]): Branches of the remote.
+            files (dict): {relative path: contents} to use instead of the
+                generated `package.xml`.
+        """
+        if files is None:
+            depends_str = "\n".join(
+                "  <build_depend>{}</build_depend>".format(dep)
+                for dep in depends)
+            files = {'package.xml': PACKAGE_XML.format(name=name,
+                                                       depends=depends_str)}
+        with self.__lock:
+            self.remotes[url] = {'files': files,
+                                 'branches': set(branches),
+                                 'revision': 0}
+
+    def commit(self, url):
+        """Simulate a new commit on the remote."""
+        with self.__lock:
+            self.remotes[url]['revision'] += 1
+
+    def make_changes(self, clone_path):
+        """Simulate uncommitted changes in a clone."""
+        with self.__lock:
+            self.__local(clone_path)['changes'] = True
+
+    def status(self, repo_folder):
+        """Get the status of a clone in the `git status` porcelain format."""
+        self.__operation('status', repo_folder)
+        with self.__lock:
+            local = self.__local(repo_folder)
+            output = "## {branch}...origin/{branch}\n".format(
+                branch=local['branch'])
+            has_changes = local['changes']
+            if has_changes:
+                output += " M package.xml\n"
+        output = output.encode("utf-8")
+        return output, self.get_branch_name(output), has_changes
+
+    def pull(self, repo_folder, branch):
+        """Bring a clone to the revision of its remote."""
+        self.__operation('pull', repo_folder)
+        with self.__lock:
+            local = self.__local(repo_folder)
+            remote = self.remotes.get(local['url'])
+            if remote:
+                local['fetched'] = remote['revision']
+            if not remote or remote['revision'] == local['revision']:
+                return b"Already up to date.\n"
+            local['revision'] = remote['revision']
+        return b"Updating 0000000..1111111\nFast-forward\n"
+
+    def clone(self, name, url, clone_path, branch="master", on_progress=None,
+              subdir=None, sha=None):
+        """Write the files of a remote into clone_path.
+
+        With subdir, only the files in it and at the top are written, as in
+        a cone-mode sparse checkout. With sha, the clone is at the revision
+        of the branch that has this fake sha.
+        """
+        try:
+            self.__operation('clone', url, name)
+        except subprocess.CalledProcessError as e:
+            log.critical("Git error: %s", e)
+            return name, GitBackend.ERROR_TAG
+        if path.exists(clone_path):
+            return name, GitBackend.EXISTS_TAG
+        with self.__lock:
+            remote = self.remotes.get(url)
+            if remote and not branch:
+                branch = FakeGitBackend.default_branch(remote)
+            if not remote or branch not in remote['branches'] and \
+                    not GitBridge.is_sha(branch):
+                return name, GitBackend.ERROR_TAG
+            files = dict(remote['files'])
+            revision = remote['revision']
+            if sha and not GitBridge.is_sha(branch):
+                revision = next(
+                    (old for old in range(revision, -1, -1)
+                     if FakeGitBackend.sha(url, branch, old) == sha),
+                    revision)
+            self.clones[clone_path] = {'url': url,
+                                       'branch': branch,
+                                       'revision': revision,
+                                       'changes': False,
+                                       'subdir': subdir}
+        if subdir:
+            files = {relative_path: contents
+                     for relative_path, contents in files.items()
+                     if "/" not in relative_path or
+                     relative_path.startswith(subdir + "/")}
+        num_bytes = 0
+        for relative_path, contents in files.items():
+            file_path = path.join(clone_path, relative_path)
+            if not path.isdir(path.dirname(file_path)):
+                os.makedirs(path.dirname(file_path))
+            with open(file_path, 'w') as repo_file:
+                repo_file.write(contents)
+            num_bytes += len(contents)
+        if on_progress:
+            on_progress("Receiving objects: 100% ({0}/{0}), {1} bytes | "
+                        "{1} bytes/s, done.".format(len(files), num_bytes))
+        return name, GitBackend.CLONED_TAG.format(branch=branch)
+
+    @staticmethod
+    def default_branch(remote):
+        """Get the branch a clone without a branch checks out."""
+        if GitBridge.DEFAULT_BRANCH in remote['branches']:
+            return GitBridge.DEFAULT_BRANCH
+        return sorted(remote['branches'])[0]
+
+    def repository_exists(self, dependency):
+        """Probe the urls of a dependency in order for its branch."""
+        urls = [dependency.url] if dependency.url else dependency.default_urls
+        branch = dependency.branch or GitBridge.DEFAULT_BRANCH
+        dependency.probe_error = False
+        for url in urls:
+            try:
+                self.__operation('probe', url, dependency.name)
+            except subprocess.CalledProcessError:
+                # Injected failures stand for network errors.
+                dependency.probe_error = True
+                continue
+            with self.__lock:
+                remote = self.remotes.get(url)
+                if not remote or branch not in remote['branches']:
+                    continue
+                dependency.sha = FakeGitBackend.sha(url, branch,
+                                                    remote['revision'])
+            dependency.url = url
+            return dependency, True
+        return dependency, False
+
+    @staticmethod
+    def sha(url, branch, revision):
+        """Generate a stable fake commit sha."""
+        return hashlib.sha1("{}@{}#{}".format(
+            url, branch, revision).encode("utf-8")).hexdigest()
+
+    def get_branch_name(self, status_output):
+        """Parse branch name from the output of status."""
+        return GitBridge.get_branch_name(status_output)
+
+    def maintain(self, repo_folder, task):
+        """Pretend to run a maintenance task."""
+        self.__operation('maintain', repo_folder, task)
+        with self.__lock:
+            self.__local(repo_folder).setdefault('maintained', []).append(
+                task)
+
+    def remote_url(self, repo_folder):
+        """Get the url a clone was made from."""
+        with self.__lock:
+            return self.__local(repo_folder)['url']
+
+    def head(self, repo_folder):
+        """Get the branch and the fake sha of a clone."""
+        with self.__lock:
+            local = self.__local(repo_folder)
+            if GitBridge.is_sha(local['branch']):
+                return None, local['branch']
+            return local['branch'], FakeGitBackend.sha(
+                local['url'], local['branch'], local['revision'])
+
+    def fetched_sha(self, repo_folder):
+        """Get the fake sha of the remote revision seen by the last pull."""
+        with self.__lock:
+            local = self.__local(repo_folder)
+            if 'fetched' not in local:
+                raise subprocess.CalledProcessError(
+                    128, "fake rev-parse " + repo_folder,
+                    output=b"fatal: ambiguous argument 'FETCH_HEAD'")
+            return FakeGitBackend.sha(local['url'], local['branch'],
+                                      local['fetched'])
+
+    def bundle(self, repo_folder, bundle_path):
+        """Serve a clone as a new remote at the path of the bundle."""
+        self.__operation('bundle', repo_folder)
+        with self.__lock:
+            local = self.__local(repo_folder)
+            remote = self.remotes.get(local['url'])
+            if not remote:
+                raise subprocess.CalledProcessError(
+                    128, "fake bundle " + repo_folder,
+                    output=b"fatal: unknown remote")
+            branches = set(remote['branches'])
+            if not GitBridge.is_sha(local['branch']):
+                branches.add(local['branch'])
+            self.remotes[bundle_path] = {'files': dict(remote['files']),
+                                         'branches': branches,
+                                         'revision': local['revision']}
+        with open(bundle_path, 'w') as bundle_file:
+            bundle_file.write(local['url'] + '\n')
+
+    def set_remote_url(self, repo_folder, url):
+        """Point a clone to another remote."""
+        with self.__lock:
+            self.__local(repo_folder)['url'] = url
+
+    def __local(self, clone_path):
+        """Get the state of a clone. Holds the lock."""
+        if clone_path not in self.clones:
+            # Repositories that were there before are clean and up to date.
+            self.clones[clone_path] = {'url': None,
+                                       'branch': 'master',
+                                       'revision': 0,
+                                       'changes': False,
+                                       'subdir': None}
+        return self.clones[clone_path]
+
+    def __operation(self, operation, target, name=None):
+        """Record an operation, wait for its latency and maybe fail it."""
+        with self.__lock:
+            self.calls.append((operation, target))
+            failed = (target in self.failures.get(operation, ()) or
+                      name in self.failures.get(operation, ()) or
+                      self.__random.random() < self.failure_rate)
+        if self.latency.get(operation):
+            self.__sleep(self.latency[operation])
+        if failed:
+            raise subprocess.CalledProcessError(
+                128, "fake {} {}".format(operation, target),
+                output=b"fatal: injected failure")
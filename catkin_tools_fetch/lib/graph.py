@@ -0,0 +1,242 @@
+"""Builds the dependency graph of a workspace without touching the network.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import json
+import logging
+from os import path
+
+from catkin_tools_fetch.lib.dependency_parser import Parser
+from catkin_tools_fetch.lib.history import RunHistory
+from catkin_tools_fetch.lib.tools import Tools
+
+log = logging.getLogger('deps')
+
+
+class DependencyGraph(object):
+    """Dependency closure of workspace packages.
+
+    The edges come from the manifests in the workspace. Where a dependency
+    lives is only known from past runs: the urls that probes found and
+    clones used are read from the run history, the newest first. Nothing is
+    probed, so the graph shows what the last fetch resolved.
+
+    Attributes:
+        WORKSPACE (str): Kind of a package that is in the workspace.
+        SYSTEM (str): Kind of a rosdep key, installed by the system.
+        RESOLVED (str): Kind of a missing package with a known url.
+        UNRESOLVED (str): Kind of a missing package with no known url.
+        EXPLICIT (str): Template shown for urls given with `git_url`.
+        FORMATS (str[]): Output formats.
+        roots (str[]): Packages the closure starts from.
+        nodes (dict): {name: node} where a node is a dict with the 'kind',
+            'url', 'template', 'branch', 'repo' and 'depends' of a package.
+    """
+
+    WORKSPACE = 'workspace'
+    SYSTEM = 'system'
+    RESOLVED = 'resolved'
+    UNRESOLVED = 'unresolved'
+    EXPLICIT = 'explicit'
+    FORMATS = ['tree', 'dot', 'json']
+
+    DOT_STYLES = {
+        SYSTEM: 'style=dashed',
+        RESOLVED: 'style=dotted',
+        UNRESOLVED: 'color=red, fontcolor=red',
+    }
+
+    def __init__(self, roots, nodes):
+        """Initialize a graph from its nodes."""
+        super(DependencyGraph, self).__init__()
+        self.roots = roots
+        self.nodes = nodes
+
+    @staticmethod
+    def known_urls(runs):
+        """Get the url of every package found or cloned in past runs.
+
+        Args:
+            runs (list): Runs as loaded by RunHistory.load_runs, the oldest
+                first.
+
+        Returns:
+            dict: {name: url} with the newest url of each package.
+        """
+        urls = {}
+        for run in runs:
+            for record in run.get('repos', []):
+                if record.get('operation') not in ['probe', 'clone']:
+                    continue
+                if record.get('outcome') == RunHistory.ERROR or \
+                        not record.get('url'):
+                    continue
+                urls[record['name']] = record['url']
+        return urls
+
+    @staticmethod
+    def from_workspace(ws_path,
+                       workspace_packages,
+                       packages,
+                       default_urls,
+                       tags=None,
+                       known_urls=None,
+                       system_pkgs=(),
+                       session=None):
+        """Build the graph of the selected packages and all they pull in.
+
+        Args:
+            ws_path (str): Workspace source path.
+            workspace_packages (dict): {package folder: package}.
+            packages (str[]): Packages to start from, all if empty.
+            default_urls (set(str)): Url templates.
+            tags (list): Dependency tags to follow, Parser.TAGS if None.
+            known_urls (dict): {name: url} resolved in past runs.
+            system_pkgs (container): Names of rosdep keys.
+            session (Session): Lends the parsing workers, packages are
+                parsed one by one if None.
+
+        Returns:
+            DependencyGraph: The graph.
+        """
+        known_urls = known_urls if known_urls else {}
+        folders = {package.name: package_path for package_path, package
+                   in workspace_packages.items()}
+        parsed = Parser.parse_packages(
+            [(name, path.join(ws_path, folder))
+             for name, folder in folders.items()],
+            set(default_urls), tags=tags, quiet=True, session=session)
+        edges = {}
+        dependencies = {}
+        for pkg_name, deps in parsed:
+            edges[pkg_name] = sorted(deps) if deps else []
+            for dep_name, dep in sorted((deps or {}).items()):
+                # Keep the first explicit url any manifest gives.
+                if dep_name not in dependencies or \
+                        dep.url and not dependencies[dep_name].url:
+                    dependencies[dep_name] = dep
+        roots = sorted(packages) if packages else sorted(folders)
+        nodes = {}
+        to_visit = list(roots)
+        while to_visit:
+            name = to_visit.pop()
+            if name in nodes:
+                continue
+            dependency = dependencies.get(name)
+            node = {'kind': DependencyGraph.UNRESOLVED,
+                    'url': known_urls.get(name),
+                    'template': None,
+                    'branch': dependency.branch if dependency else None,
+                    'repo': None,
+                    'depends': edges.get(name, [])}
+            if dependency and dependency.url:
+                node['url'] = dependency.url
+                node['template'] = DependencyGraph.EXPLICIT
+            elif dependency and node['url']:
+                for template, url in dependency.url_templates.items():
+                    if url == node['url']:
+                        node['template'] = template
+            if name in folders:
+                node['kind'] = DependencyGraph.WORKSPACE
+                root = Tools.repo_root(path.join(ws_path, folders[name]),
+                                       ws_path)
+                if root:
+                    node['repo'] = path.relpath(root, ws_path)
+            elif name in system_pkgs and not node['url']:
+                node['kind'] = DependencyGraph.SYSTEM
+            elif node['url']:
+                node['kind'] = DependencyGraph.RESOLVED
+            nodes[name] = node
+            to_visit.extend(node['depends'])
+        return DependencyGraph(roots, nodes)
+
+    def render(self, output_format):
+        """Get the graph in one of FORMATS."""
+        if output_format == 'dot':
+            return self.to_dot()
+        if output_format == 'json':
+            return self.to_json()
+        return self.to_tree()
+
+    def to_json(self):
+        """Get the graph as a json string."""
+        return json.dumps({'roots': self.roots, 'packages': self.nodes},
+                          indent=2, sort_keys=True) + "\n"
+
+    def to_dot(self):
+        """Get the graph in the DOT language of Graphviz.
+
+        Packages of one repository are drawn in one cluster.
+        """
+        lines = ['digraph deps {', '  rankdir=LR;', '  node [shape=box];']
+        repos = {}
+        for name, node in sorted(self.nodes.items()):
+            if node['repo']:
+                repos.setdefault(node['repo'], []).append(name)
+        for i, (repo, names) in enumerate(sorted(repos.items())):
+            lines.append('  subgraph cluster_{} {{'.format(i))
+            lines.append('    label={};'.format(DependencyGraph.__quote(repo)))
+            for name in names:
+                lines.append('    {};'.format(DependencyGraph.__quote(name)))
+            lines.append('  }')
+        for name, node in sorted(self.nodes.items()):
+            style = DependencyGraph.DOT_STYLES.get(node['kind'])
+            if style:
+                lines.append('  {} [{}];'.format(
+                    DependencyGraph.__quote(name), style))
+        for name, node in sorted(self.nodes.items()):
+            for dep_name in node['depends']:
+                lines.append('  {} -> {};'.format(
+                    DependencyGraph.__quote(name),
+                    DependencyGraph.__quote(dep_name)))
+        lines.append('}')
+        return "\n".join(lines) + "\n"
+
+    def to_tree(self):
+        """Get the graph as a text tree, one line per package.
+
+        Packages that were shown before are marked with `(*)` and not
+        expanded again, which also stops at cycles.
+        """
+        lines = []
+        shown = set()
+        for root in self.roots:
+            self.__add_tree_lines(root, "", "", shown, lines)
+        return "\n".join(lines) + "\n"
+
+    def __add_tree_lines(self, name, prefix, child_prefix, shown, lines):
+        """Add the lines of a package and, once, of its dependencies."""
+        node = self.nodes[name]
+        line = prefix + name + "  " + self.__describe(node)
+        if name in shown and node['depends']:
+            lines.append(line + " (*)")
+            return
+        lines.append(line)
+        shown.add(name)
+        for i, dep_name in enumerate(node['depends']):
+            last = i == len(node['depends']) - 1
+            self.__add_tree_lines(
+                dep_name,
+                child_prefix + ("`-- " if last else "|-- "),
+                child_prefix + ("    " if last else "|   "),
+                shown, lines)
+
+    @staticmethod
+    def __describe(node):
+        """Describe where a package comes from."""
+        details = [node['kind']]
+        if node['repo']:
+            details.append("repo: " + node['repo'])
+        if node['url']:
+            details.append(node['url'])
+        if node['template']:
+            details.append("via " + node['template'])
+        if node['branch']:
+            details.append("branch: " + node['branch'])
+        return "(" + ", ".join(details) + ")"
+
+    @staticmethod
+    def __quote(text):
+        """Quote an identifier for DOT."""
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
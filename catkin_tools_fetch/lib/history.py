@@ -0,0 +1,151 @@
+"""Keeps the timings of past runs.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import os
+import json
+import time
+import logging
+from os import path
+from threading import Lock
+
+from catkin_tools_fetch.lib.tools import Tools
+
+log = logging.getLogger('deps')
+
+
+class RunHistory(object):
+    """Records what every git operation of one run took and how it ended.
+
+    Every run is appended as a single json line to a history file. Once the
+    file grows over `MAX_BYTES` it is moved to a backup file, replacing the
+    previous backup, so the history never takes more than twice that space.
+
+    Attributes:
+        FILE_NAME (str): Name of the history file.
+        BACKUP_SUFFIX (str): Suffix of the rotated history file.
+        MAX_BYTES (int): Size after which the history file is rotated.
+        OK (str): Outcome of a successful operation.
+        ERROR (str): Outcome of a failed operation.
+        MISS (str): Outcome of a probe that did not find the repository.
+        SKIPPED (str): Outcome of an operation that had nothing to do.
+        history_path (str): Path to the history file.
+        verb (str): The verb of this run, e.g. 'fetch'.
+        started (float): Time when the run started.
+        records (list): Recorded operations of this run.
+    """
+
+    FILE_NAME = 'history.jsonl'
+    BACKUP_SUFFIX = '.1'
+    MAX_BYTES = 1024 * 1024
+
+    OK = 'ok'
+    ERROR = 'error'
+    MISS = 'miss'
+    SKIPPED = 'skipped'
+
+    def __init__(self, history_path=None, verb=None, clock=time.time):
+        """Start recording a run.
+
+        Args:
+            history_path (str): Path to the history file. If None, the run is
+                kept only in memory.
+            verb (str): The verb of this run, e.g. 'fetch'.
+            clock (callable): Returns current time in seconds.
+        """
+        super(RunHistory, self).__init__()
+        self.history_path = history_path
+        self.verb = verb
+        self.records = []
+        self.__clock = clock
+        self.started = clock()
+        self.__lock = Lock()
+
+    @staticmethod
+    def default_history_path():
+        """Get the default location of the history file."""
+        return path.join(Tools.cache_dir(), RunHistory.FILE_NAME)
+
+    def record(self, name, operation, duration, outcome,
+               url=None, num_bytes=0):
+        """Record a single git operation.
+
+        Args:
+            name (str): Name of the package.
+            operation (str): One of 'probe', 'clone', 'pull'.
+            duration (float): Duration of the operation in seconds.
+            outcome (str): One of the outcomes defined in this class.
+            url (str): Url of the repository if known.
+            num_bytes (int): Received bytes if known.
+        """
+        entry = {'name': name,
+                 'operation': operation,
+                 'duration': round(duration, 3),
+                 'outcome': outcome}
+        if url:
+            entry['url'] = url
+        if num_bytes:
+            entry['bytes'] = num_bytes
+        with self.__lock:
+            self.records.append(entry)
+
+    def to_dict(self):
+        """Get the run as a json-serializable dictionary."""
+        with self.__lock:
+            return {'verb': self.verb,
+                    'started': round(self.started, 3),
+                    'duration': round(self.__clock() - self.started, 3),
+                    'repos': list(self.records)}
+
+    def save(self):
+        """Append the run to the history file, rotating it if needed.
+
+        Returns:
+            bool: True if written, False otherwise.
+        """
+        if not self.history_path:
+            return False
+        line = json.dumps(self.to_dict(), sort_keys=True,
+                          separators=(',', ':'))
+        try:
+            folder = path.dirname(self.history_path)
+            if folder and not path.isdir(folder):
+                os.makedirs(folder)
+            if path.exists(self.history_path) and \
+                    path.getsize(self.history_path) > RunHistory.MAX_BYTES:
+                os.rename(self.history_path,
+                          self.history_path + RunHistory.BACKUP_SUFFIX)
+            with open(self.history_path, 'a') as history_file:
+                history_file.write(line + '\n')
+            return True
+        except (IOError, OSError) as e:
+            log.warning(" Cannot write '%s': %s", self.history_path, e)
+            return False
+
+    @staticmethod
+    def load_runs(history_path):
+        """Read all runs from the history, the oldest first.
+
+        Malformed lines, e.g. from an interrupted write, are skipped.
+
+        Args:
+            history_path (str): Path to the history file.
+
+        Returns:
+            list: Runs as dictionaries.
+        """
+        runs = []
+        for file_path in [history_path + RunHistory.BACKUP_SUFFIX,
+                          history_path]:
+            if not path.exists(file_path):
+                continue
+            with open(file_path) as history_file:
+                for line in history_file:
+                    try:
+                        run = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(run, dict):
+                        runs.append(run)
+        return sorted(runs, key=lambda run: run.get('started', 0))
@@ -0,0 +1,198 @@
+"""Journals the steps of a fetch, so that an interrupted one can resume.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import os
+import json
+import shutil
+import logging
+import threading
+from os import path
+
+from catkin_tools_fetch.lib.closure_cache import ClosureCache
+from catkin_tools_fetch.lib.tools import GitBridge
+
+log = logging.getLogger('deps')
+
+
+class FetchJournal(object):
+    """Append-only record of the probes and clones of an unfinished fetch.
+
+    Every finished step is appended as one line of json and flushed to disk
+    right away, so the journal survives a Ctrl-C, an OOM kill or a CI
+    timeout. A line torn by a kill is ignored on load. A rerun reuses the
+    journaled probes instead of asking every url again, and removes the
+    partial folders of clones that never finished. Only found dependencies
+    are journaled: a miss may come from a network error or a repository
+    that is pushed by now, so it is probed again. Completed clones
+    need no journal to be skipped: only a complete clone is renamed into
+    place, so any existing folder is one. The journal is removed once a
+    fetch completes.
+
+    Attributes:
+        FILE_NAME (str): Name of the journal inside ClosureCache.FOLDER.
+        PROBED (str): Step of a dependency found under a url.
+        CLONING (str): Step of a clone that started.
+        CLONED (str): Step of a clone that completed.
+        journal_path (str): Path to the journal file.
+        probes (dict): {name: record} of the journaled probes.
+        cloning (dict): {name: partial path} of the unfinished clones.
+        cloned (set): Names of the completed clones.
+    """
+
+    FILE_NAME = 'fetch_journal.jsonl'
+    PROBED = 'probed'
+    CLONING = 'cloning'
+    CLONED = 'cloned'
+
+    def __init__(self, journal_path):
+        """Initialize the journal and read what an earlier run left."""
+        super(FetchJournal, self).__init__()
+        self.journal_path = journal_path
+        self.probes = {}
+        self.cloning = {}
+        self.cloned = set()
+        self.__lock = threading.Lock()
+        for record in FetchJournal.__read_records(journal_path):
+            self.__apply(record)
+        FetchJournal.__end_torn_line(journal_path)
+
+    @staticmethod
+    def default_journal_path(workspace):
+        """Get the journal file inside the workspace."""
+        return path.join(workspace, ClosureCache.FOLDER,
+                         FetchJournal.FILE_NAME)
+
+    @staticmethod
+    def probe_key(dependency):
+        """Get what a probe of a dependency depends on."""
+        # A probe sets the url of a dependency found under a default one.
+        urls = sorted(dependency.default_urls) if dependency.default_urls \
+            else [dependency.url]
+        return {'branch': dependency.branch, 'urls': urls}
+
+    def is_resumed(self):
+        """Check if an earlier fetch left any steps behind."""
+        return bool(self.probes or self.cloning or self.cloned)
+
+    def probe_result(self, dependency):
+        """Get the journaled result of probing a dependency.
+
+        A result only counts if the dependency was probed with the same
+        branch and urls as now.
+
+        Returns:
+            bool: True if found, None if it has to be probed. The url and sha
+                of a found dependency are set.
+        """
+        record = self.probes.get(dependency.name)
+        if not record or not record.get('url') or \
+                record.get('key') != FetchJournal.probe_key(dependency):
+            return None
+        dependency.url = record['url']
+        dependency.sha = record.get('sha')
+        return True
+
+    def record_probe(self, dependency):
+        """Journal that a dependency was found under its url."""
+        self.__append({'step': FetchJournal.PROBED,
+                       'name': dependency.name,
+                       'key': FetchJournal.probe_key(dependency),
+                       'url': dependency.url,
+                       'sha': dependency.sha})
+
+    def record_cloning(self, name, clone_path):
+        """Journal that a clone into clone_path starts."""
+        self.__append({'step': FetchJournal.CLONING, 'name': name,
+                       'partial': GitBridge.partial_path(clone_path)})
+
+    def record_cloned(self, name):
+        """Journal that the clone of a dependency completed."""
+        self.__append({'step': FetchJournal.CLONED, 'name': name})
+
+    def clean_partials(self):
+        """Remove the partial folders of clones that never completed.
+
+        Returns:
+            str[]: Sorted names of the clones that were cleaned up.
+        """
+        cleaned = []
+        for name, partial in sorted(self.cloning.items()):
+            if path.exists(partial):
+                shutil.rmtree(partial, ignore_errors=True)
+                cleaned.append(name)
+        self.cloning = {}
+        return cleaned
+
+    def finish(self):
+        """Remove the journal once the fetch completed."""
+        with self.__lock:
+            self.probes = {}
+            self.cloning = {}
+            self.cloned = set()
+            if path.exists(self.journal_path):
+                os.remove(self.journal_path)
+
+    def __append(self, record):
+        """Apply a record and append it to the journal as one line."""
+        line = json.dumps(record, sort_keys=True) + "\n"
+        with self.__lock:
+            self.__apply(record)
+            try:
+                folder = path.dirname(self.journal_path)
+                if folder and not path.isdir(folder):
+                    os.makedirs(folder)
+                with open(self.journal_path, 'a') as journal_file:
+                    journal_file.write(line)
+                    journal_file.flush()
+                    os.fsync(journal_file.fileno())
+            except (IOError, OSError) as e:
+                log.warning(" Cannot write to journal '%s': %s",
+                            self.journal_path, e)
+
+    def __apply(self, record):
+        """Update the state with one record."""
+        name = record.get('name')
+        step = record.get('step')
+        if step == FetchJournal.PROBED:
+            self.probes[name] = record
+        elif step == FetchJournal.CLONING:
+            self.cloning[name] = record['partial']
+        elif step == FetchJournal.CLONED:
+            self.cloning.pop(name, None)
+            self.cloned.add(name)
+
+    @staticmethod
+    def __end_torn_line(journal_path):
+        """End a line torn by a kill, so that new records start afresh."""
+        try:
+            with open(journal_path, 'rb+') as journal_file:
+                journal_file.seek(0, os.SEEK_END)
+                if not journal_file.tell():
+                    return
+                journal_file.seek(-1, os.SEEK_END)
+                if journal_file.read(1) != b"\n":
+                    journal_file.write(b"\n")
+        except (IOError, OSError):
+            pass
+
+    @staticmethod
+    def __read_records(journal_path):
+        """Read all complete records of a journal file."""
+        if not path.exists(journal_path):
+            return []
+        records = []
+        try:
+            with open(journal_path) as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A kill may have torn the last line.
+                        continue
+                    if isinstance(record, dict) and 'name' in record:
+                        records.append(record)
+        except (IOError, OSError) as e:
+            log.warning(" Cannot read journal '%s': %s", journal_path, e)
+        return records
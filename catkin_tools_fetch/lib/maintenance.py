@@ -0,0 +1,228 @@
+"""Keeps the git repositories of a workspace fast.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import re
+import time
+import logging
+import subprocess
+from os import path
+from termcolor import colored
+from concurrent import futures
+
+from catkin_tools_fetch.lib.tools import Tools
+from catkin_tools_fetch.lib.tools import GitBridge
+from catkin_tools_fetch.lib.concurrency import IoBudget
+from catkin_tools_fetch.lib.printer import Printer
+from catkin_tools_fetch.lib.session import Session
+
+log = logging.getLogger('deps')
+
+
+class Maintainer(object):
+    """Runs `git maintenance` tasks in all repositories of a workspace.
+
+    Repositories collect loose objects and packs over time and have no
+    commit-graph unless git writes one, which makes every `status` and
+    `pull` slower. The tasks run in parallel, every repository at most once
+    even if it holds many packages. Repacking reads and writes about the
+    whole object database, so the repositories are throttled by an I/O
+    budget according to the size of their `.git` folder. The time of a
+    `git status` is measured before and after and both are reported.
+
+    Attributes:
+        TASKS (str[]): Maintenance tasks run by default, in this order.
+        STATUS_SAMPLES (int): How many times status is timed, best one wins.
+        NOISE (float): Relative change of the status time that is within
+            the jitter of repeated measurements.
+        NOTHING_TO_DO_REGEX (re): Errors of tasks that had nothing to do.
+        ws_path (str): Workspace path. This is where packages live.
+        packages (dict): {folder: package} found in the workspace.
+        tasks (str[]): Tasks to run.
+        budget (IoBudget): Limits the bytes processed per second.
+        session (Session): Lends the worker pool, limiters and printer,
+            may be None.
+        backend (GitBackend): Runs the git commands.
+    """
+
+    TASKS = ['commit-graph', 'loose-objects', 'incremental-repack',
+             'prefetch']
+    STATUS_SAMPLES = 3
+    NOISE = 0.1
+    NOTHING_TO_DO_REGEX = re.compile(r"no pack files to index")
+
+    MAINTAINED_TAG = colored("[MAINTAINED]", 'green')
+    FAILED_TAG = colored("[MAINTENANCE FAILED]", 'red') + " [TASKS: {tasks}]"
+    RUNNING_TAG = "[MAINTAINING]"
+
+    def __init__(self,
+                 ws_path,
+                 packages,
+                 tasks=None,
+                 io_budget=None,
+                 use_preprint=True,
+                 num_threads=None,
+                 backend=GitBridge,
+                 session=None):
+        """Initialize the maintainer.
+
+        Args:
+            ws_path (str): Path to the workspace.
+            packages (dict): {folder: package} found in the workspace.
+            tasks (str[]): Tasks to run, all of TASKS if None.
+            io_budget (float): Bytes per second to process. No limit if None.
+            use_preprint (bool): Show status messages while working.
+            num_threads (int): Maximum number of repositories in parallel.
+            backend (GitBackend): Runs the git commands.
+            session (Session): Lends its worker pool, maintain limiter and
+                printer. A session of its own is used for every run and
+                closed afterwards if None.
+        """
+        super(Maintainer, self).__init__()
+        self.ws_path = ws_path
+        self.packages = packages
+        self.tasks = tasks if tasks else Maintainer.TASKS
+        self.budget = IoBudget(io_budget)
+        self.session = session
+        self.num_threads = num_threads
+        self.use_preprint = use_preprint
+        self.backend = backend
+        self.printer = session.printer if session else Printer()
+
+    @staticmethod
+    def parse_tasks(tasks_str):
+        """Parse a comma separated list of tasks.
+
+        Raises:
+            ValueError: If a task is unknown.
+        """
+        tasks = [task.strip() for task in tasks_str.split(',')
+                 if task.strip()]
+        unknown = set(tasks) - set(Maintainer.TASKS)
+        if unknown:
+            raise ValueError("Unknown maintenance tasks: {}".format(
+                ", ".join(sorted(unknown))))
+        return tasks
+
+    def find_repos(self, selected_packages):
+        """Map the repositories to maintain to the names of their packages.
+
+        Args:
+            selected_packages (str[]): Names picked by the user, all if empty.
+
+        Returns:
+            dict: {repo root: sorted package names}
+        """
+        return Tools.find_repos(self.ws_path, self.packages,
+                                selected_packages)
+
+    def time_status(self, repo_folder):
+        """Get the best time of a few `git status` calls in seconds."""
+        best = None
+        for _ in range(Maintainer.STATUS_SAMPLES):
+            start = time.time()
+            try:
+                self.backend.status(repo_folder)
+            except subprocess.CalledProcessError:
+                return None
+            duration = time.time() - start
+            best = duration if best is None else min(best, duration)
+        return best
+
+    def maintain_repo(self, repo_folder, name):
+        """Run all tasks in one repository.
+
+        Returns:
+            tuple: (name, failed tasks, status seconds before, after)
+        """
+        if self.use_preprint:
+            msg = " {}: {}".format(Tools.decorate(name),
+                                   Maintainer.RUNNING_TAG)
+            self.printer.add_msg(name, msg)
+        before = self.time_status(repo_folder)
+        self.budget.consume(
+            Tools.folder_size(path.join(repo_folder, '.git')))
+        failed = []
+        for task in self.tasks:
+            try:
+                self.backend.maintain(repo_folder, task)
+            except subprocess.CalledProcessError as e:
+                output = e.output
+                if isinstance(output, bytes):
+                    output = output.decode("utf-8", "replace")
+                if Maintainer.NOTHING_TO_DO_REGEX.search(output or ""):
+                    continue
+                log.debug(" Task '%s' failed in '%s': %s",
+                          task, repo_folder, e)
+                failed.append(task)
+        after = self.time_status(repo_folder)
+        return name, failed, before, after
+
+    def maintain_packages(self, selected_packages):
+        """Maintain the repositories of the selected packages.
+
+        Args:
+            selected_packages (str[]): Names picked by the user, all if empty.
+
+        Returns:
+            list: Tuples (name, failed tasks, status seconds before, after).
+        """
+        repos = self.find_repos(selected_packages)
+        if not repos:
+            return []
+        log.info(" Maintaining %s repositories:", len(repos))
+        futures_list = []
+        results = []
+        with Session.borrow(self.session, self.num_threads) as session:
+            for repo_folder in sorted(repos):
+                name = path.basename(repo_folder)
+                futures_list.append(session.thread_pool.submit(
+                    session.limiters['maintain'].call,
+                    self.__maintenance_failed,
+                    self.maintain_repo, repo_folder, name))
+            for future in futures.as_completed(futures_list):
+                name, failed, before, after = future.result()
+                if failed:
+                    tag = Maintainer.FAILED_TAG.format(
+                        tasks=", ".join(failed))
+                else:
+                    tag = Maintainer.MAINTAINED_TAG
+                self.printer.purge_msg(name, " {}: {}".format(
+                    Tools.decorate(name), tag))
+                results.append((name, failed, before, after))
+        Maintainer.report_status_times(results)
+        return results
+
+    def __maintenance_failed(self, result):
+        """Tell the limiter if all tasks failed."""
+        _, failed, _, _ = result
+        return len(failed) == len(self.tasks)
+
+    @staticmethod
+    def report_status_times(results):
+        """Log the measured status times before and after maintenance.
+
+        A change is only reported if it is larger than the noise.
+
+        Returns:
+            float: Seconds one status check in every repository became
+                faster, 0.0 if the change is within the noise.
+        """
+        timed = [(before, after) for _, _, before, after in results
+                 if before is not None and after is not None]
+        if not timed:
+            return 0.0
+        total_before = sum(before for before, _ in timed)
+        total_after = sum(after for _, after in timed)
+        log.info(" Status of %s repositories took %.0f ms before and "
+                 "%.0f ms after maintenance (best of %s).", len(timed),
+                 1000.0 * total_before, 1000.0 * total_after,
+                 Maintainer.STATUS_SAMPLES)
+        saved = total_before - total_after
+        if saved <= Maintainer.NOISE * total_before:
+            log.info(" No measurable change.")
+            return 0.0
+        log.info(" Status became %.0f%% faster.",
+                 100.0 * saved / total_before)
+        return saved
@@ -20,6 +20,15 @@ class Printer:
             self.__msgs[key] = msg
             print(self.__msgs[key].ljust(self.__line_length, " "))
 
+    def update_msg(self, key, msg):
+        """Replace an active message in place."""
+        with self.__rlock:
+            if key not in self.__msgs:
+                self.add_msg(key, msg)
+                return
+            self.__msgs[key] = msg
+            self.__print_active(move_up=True)
+
     def print_msg(self, msg):
         """Print a single message."""
         print(msg.ljust(self.__line_length, " "))
@@ -0,0 +1,142 @@
+"""Parses the progress that git reports while cloning.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import re
+import time
+import logging
+
+log = logging.getLogger('deps')
+
+
+class CloneProgress(object):
+    """Progress of a single clone, updated from git's progress lines.
+
+    Attributes:
+        UNITS (dict): {unit: bytes} for units that git uses.
+        name (str): Name of the cloned package.
+        phase (str): Current phase reported by git, e.g. 'Receiving objects'.
+        percent (int): Progress of the current phase in percent.
+        objects (int): Received objects.
+        total_objects (int): Total objects to receive.
+        received_bytes (int): Received bytes.
+        throughput (float): Current throughput in bytes per second.
+        started (float): Time when the clone started.
+        last_change (float): Time of the last progress change.
+        finished (float): Time when the clone finished or None.
+    """
+
+    UNITS = {'bytes': 1, 'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3}
+
+    PHASE_REGEX = re.compile(
+        r"(?:remote: )?(?P<phase>[A-Z][\w ]+):\s+(?P<percent>\d+)%"
+        r"(?: \((?P<done>\d+)/(?P<total>\d+)\))?")
+    BYTES_REGEX = re.compile(
+        r", (?P<amount>[\d.]+) (?P<unit>bytes|KiB|MiB|GiB)"
+        r"(?: \| (?P<rate>[\d.]+) (?P<rate_unit>bytes|KiB|MiB|GiB)/s)?")
+
+    RECEIVING_PHASE = 'Receiving objects'
+
+    def __init__(self, name, now=None):
+        """Initialize the progress of a clone that starts now."""
+        super(CloneProgress, self).__init__()
+        self.name = name
+        self.phase = None
+        self.percent = 0
+        self.objects = 0
+        self.total_objects = 0
+        self.received_bytes = 0
+        self.throughput = 0.0
+        self.started = now if now is not None else time.time()
+        self.last_change = self.started
+        self.finished = None
+
+    def update(self, line, now=None):
+        """Update the progress from a line of git output.
+
+        Args:
+            line (str): A line of git's stderr, split at '\\r' or '\\n'.
+            now (float): Current time, time.time() if None.
+
+        Returns:
+            bool: True if the progress has changed.
+        """
+        match = CloneProgress.PHASE_REGEX.search(line)
+        if not match:
+            return False
+        now = now if now is not None else time.time()
+        state = self.__state()
+        self.phase = match.group('phase')
+        self.percent = int(match.group('percent'))
+        if self.phase == CloneProgress.RECEIVING_PHASE:
+            if match.group('done'):
+                self.objects = int(match.group('done'))
+                self.total_objects = int(match.group('total'))
+            bytes_match = CloneProgress.BYTES_REGEX.search(line)
+            if bytes_match:
+                self.received_bytes = CloneProgress.to_bytes(
+                    bytes_match.group('amount'), bytes_match.group('unit'))
+                if bytes_match.group('rate'):
+                    self.throughput = CloneProgress.to_bytes(
+                        bytes_match.group('rate'),
+                        bytes_match.group('rate_unit'))
+        if state == self.__state():
+            return False
+        self.last_change = now
+        return True
+
+    def finish(self, now=None):
+        """Mark the clone as finished."""
+        self.finished = now if now is not None else time.time()
+
+    def is_stalled(self, threshold, now=None):
+        """Check if a running clone made no progress for too long.
+
+        Args:
+            threshold (float): Seconds without progress.
+            now (float): Current time, time.time() if None.
+        """
+        if self.finished is not None:
+            return False
+        now = now if now is not None else time.time()
+        return now - self.last_change > threshold
+
+    def duration(self, now=None):
+        """Get the duration of the clone in seconds."""
+        end = self.finished
+        if end is None:
+            end = now if now is not None else time.time()
+        return end - self.started
+
+    def __state(self):
+        """Get the values whose change counts as progress."""
+        return (self.phase, self.percent, self.objects, self.received_bytes)
+
+    def __str__(self):
+        """Show how to print it."""
+        if not self.phase:
+            return ""
+        if self.phase != CloneProgress.RECEIVING_PHASE:
+            return "{}: {}%".format(self.phase, self.percent)
+        return "{}/{} objects, {}, {}/s".format(
+            self.objects, self.total_objects,
+            CloneProgress.format_bytes(self.received_bytes),
+            CloneProgress.format_bytes(self.throughput))
+
+    @staticmethod
+    def to_bytes(amount, unit):
+        """Convert an amount in git units to bytes."""
+        return int(float(amount) * CloneProgress.UNITS[unit])
+
+    @staticmethod
+    def format_bytes(num_bytes):
+        """Format a number of bytes for humans."""
+        if num_bytes < 1024:
+            return "{} bytes".format(int(num_bytes))
+        for unit in ['KiB', 'MiB']:
+            num_bytes /= 1024.0
+            if num_bytes < 1024:
+                return "{:.1f} {}".format(num_bytes, unit)
+        num_bytes /= 1024.0
+        return "{:.2f} GiB".format(num_bytes)
@@ -0,0 +1,130 @@
+"""Reads and writes the `.repos` files of vcstool.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import logging
+from os import path
+
+import yaml
+
+from catkin_tools_fetch.lib.tools import GitBridge
+
+log = logging.getLogger('deps')
+
+
+class ReposFile(object):
+    """A set of repositories with their urls and versions.
+
+    The format is the one of `vcs import` and `vcs export`:
+
+        repositories:
+          relative/path:
+            type: git
+            url: https://github.com/user/repo.git
+            version: master
+
+    Paths are relative to the `src` folder of the workspace. The version is
+    a branch, a tag or a commit sha.
+
+    Attributes:
+        GIT_TYPE (str): The only repository type this tool can clone.
+        repositories (dict): {relative path: {'type', 'url', 'version'}}.
+    """
+
+    GIT_TYPE = 'git'
+
+    def __init__(self, repositories=None):
+        """Initialize the file contents."""
+        super(ReposFile, self).__init__()
+        self.repositories = repositories if repositories else {}
+
+    @staticmethod
+    def load(file_path):
+        """Read a `.repos` file.
+
+        Repositories that are not git repositories are skipped with a
+        warning.
+
+        Args:
+            file_path (str): Path to the file.
+
+        Raises:
+            ValueError: If the file cannot be read or is malformed.
+
+        Returns:
+            ReposFile: The repositories in the file.
+        """
+        try:
+            with open(file_path) as repos_file:
+                data = yaml.safe_load(repos_file)
+        except (IOError, OSError, yaml.YAMLError) as e:
+            raise ValueError("Cannot read '{}': {}".format(file_path, e))
+        if not isinstance(data, dict) or \
+                not isinstance(data.get('repositories'), dict):
+            raise ValueError("'{}' has no 'repositories'.".format(file_path))
+        repositories = {}
+        for repo_path, repo in sorted(data['repositories'].items()):
+            if not isinstance(repo, dict) or not repo.get('url'):
+                raise ValueError("Repository '{}' in '{}' has no url.".format(
+                    repo_path, file_path))
+            repo_type = repo.get('type', ReposFile.GIT_TYPE)
+            if repo_type != ReposFile.GIT_TYPE:
+                log.warning(" Skip repository '%s' of type '%s'.",
+                            repo_path, repo_type)
+                continue
+            if path.isabs(repo_path) or '..' in repo_path.split('/'):
+                raise ValueError(
+                    "Repository path '{}' is not inside the workspace.".format(
+                        repo_path))
+            version = repo.get('version')
+            repositories[repo_path] = {
+                'type': repo_type,
+                'url': repo['url'],
+                'version': str(version) if version is not None else None}
+        return ReposFile(repositories)
+
+    @staticmethod
+    def from_workspace(ws_path, repo_roots, exact=False, backend=GitBridge,
+                       session=None):
+        """Read the url and version of every repository in a workspace.
+
+        Args:
+            ws_path (str): Workspace source path.
+            repo_roots (iterable): Paths to the repositories.
+            exact (bool): Store commit shas instead of branch names.
+            backend (GitBackend): Reads the local repositories.
+            session (Session): Lends its workers, repositories are read one
+                by one if None.
+
+        Returns:
+            ReposFile: The repositories that have an origin.
+        """
+        def read_repo(repo_root):
+            url = backend.remote_url(repo_root)
+            if not url:
+                return repo_root, None, None
+            branch, sha = backend.head(repo_root)
+            return repo_root, url, sha if exact or not branch else branch
+
+        roots = sorted(repo_roots)
+        if session:
+            results = list(session.thread_pool.map(read_repo, roots))
+        else:
+            results = [read_repo(repo_root) for repo_root in roots]
+        repositories = {}
+        for repo_root, url, version in results:
+            repo_path = path.relpath(repo_root, ws_path)
+            if not url:
+                log.warning(" Skip repository '%s' with no origin.",
+                            repo_path)
+                continue
+            repositories[repo_path] = {'type': ReposFile.GIT_TYPE,
+                                       'url': url,
+                                       'version': version}
+        return ReposFile(repositories)
+
+    def dumps(self):
+        """Get the contents of the `.repos` file."""
+        return yaml.safe_dump({'repositories': self.repositories},
+                              default_flow_style=False)
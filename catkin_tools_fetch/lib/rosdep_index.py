@@ -0,0 +1,129 @@
+"""Knows which dependencies are system dependencies resolved by rosdep.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import os
+import gzip
+import pickle
+import logging
+from os import path
+
+from catkin_tools_fetch.lib.tools import Tools
+
+log = logging.getLogger('deps')
+
+
+class RosdepIndex(object):
+    """A set of rosdep keys read from the local rosdep cache.
+
+    Dependencies like `boost` or `python-numpy` are installed by rosdep and
+    have no repository to clone. Reading all rosdep sources is slow, so the
+    keys are stored as a plain json list keyed by the modification time of
+    the rosdep cache and read again only after `rosdep update`.
+
+    Attributes:
+        FILE_NAME (str): Name of the file that stores the keys.
+        PICKLE_EXTENSIONS (str[]): Extensions of rosdep cache files.
+        keys (set): All known rosdep keys.
+    """
+
+    FILE_NAME = 'rosdep_keys.json'
+    PICKLE_EXTENSIONS = ['.pickle', '.pickle.gz']
+
+    def __init__(self, keys=None):
+        """Initialize the index with a set of keys."""
+        super(RosdepIndex, self).__init__()
+        self.keys = set(keys) if keys else set()
+
+    def __contains__(self, name):
+        """Check if a name is a rosdep key."""
+        return name in self.keys
+
+    def __len__(self):
+        """Get the number of keys."""
+        return len(self.keys)
+
+    @staticmethod
+    def default_sources_cache():
+        """Get the folder where rosdep keeps its cache."""
+        ros_home = os.environ.get(
+            'ROS_HOME', path.join(path.expanduser('~'), '.ros'))
+        return path.join(ros_home, 'rosdep', 'sources.cache')
+
+    @staticmethod
+    def default_index_path():
+        """Get the default location of the cached keys."""
+        return path.join(Tools.cache_dir(), RosdepIndex.FILE_NAME)
+
+    @staticmethod
+    def __cache_files(sources_cache):
+        """List rosdep cache files with the data."""
+        if not path.isdir(sources_cache):
+            return []
+        return sorted(
+            path.join(sources_cache, file_name)
+            for file_name in os.listdir(sources_cache)
+            if any(file_name.endswith(extension)
+                   for extension in RosdepIndex.PICKLE_EXTENSIONS))
+
+    @staticmethod
+    def cache_mtime(sources_cache):
+        """Get the latest modification time of the rosdep cache."""
+        files = RosdepIndex.__cache_files(sources_cache)
+        if not files:
+            return None
+        return max(os.stat(file_path).st_mtime for file_path in files)
+
+    @staticmethod
+    def read_sources(sources_cache):
+        """Read all keys from the rosdep cache.
+
+        Args:
+            sources_cache (str): Folder with the rosdep cache.
+
+        Returns:
+            set: All rosdep keys found.
+        """
+        keys = set()
+        for file_path in RosdepIndex.__cache_files(sources_cache):
+            opener = gzip.open if file_path.endswith('.gz') else open
+            try:
+                with opener(file_path, 'rb') as cache_file:
+                    rosdep_data = pickle.load(cache_file)
+            except Exception as e:
+                log.debug(" Cannot read rosdep cache '%s': %s", file_path, e)
+                continue
+            if isinstance(rosdep_data, dict):
+                keys.update(rosdep_data.keys())
+        return keys
+
+    @staticmethod
+    def load(sources_cache=None, index_path=None):
+        """Load the keys, reading the rosdep cache only if it has changed.
+
+        Args:
+            sources_cache (str): Folder with the rosdep cache.
+            index_path (str): Json file with the cached keys.
+
+        Returns:
+            RosdepIndex: Index with all known rosdep keys.
+        """
+        if sources_cache is None:
+            sources_cache = RosdepIndex.default_sources_cache()
+        if index_path is None:
+            index_path = RosdepIndex.default_index_path()
+        mtime = RosdepIndex.cache_mtime(sources_cache)
+        if mtime is None:
+            log.info(" [ROSDEP]: No cache found. Run 'rosdep update'.")
+            return RosdepIndex()
+        cached = Tools.load_json(index_path, default={})
+        if cached.get('mtime') == mtime and \
+                cached.get('sources_cache') == sources_cache:
+            return RosdepIndex(cached.get('keys'))
+        keys = RosdepIndex.read_sources(sources_cache)
+        log.info(" [ROSDEP]: Indexed %s system dependencies.", len(keys))
+        Tools.save_json(index_path, {'mtime': mtime,
+                                     'sources_cache': sources_cache,
+                                     'keys': sorted(keys)})
+        return RosdepIndex(keys)
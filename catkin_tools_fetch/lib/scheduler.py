@@ -0,0 +1,157 @@
+"""Decides in which order the dependencies are cloned.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import logging
+from os import path
+from threading import Lock
+
+from catkin_tools_fetch.lib.tools import Tools
+
+log = logging.getLogger('deps')
+
+
+class CloneScheduler(object):
+    """Order clones so that the critical ones start first.
+
+    A fetch finishes when its longest chain of clones finishes. The chain of
+    a repository is its own clone plus the chain of the longest dependency
+    it unblocks, as those can only be found after cloning it. We estimate
+    the clone time by the repository size that we learn from earlier clones
+    or from user hints, and we learn the dependencies from parsed manifests.
+    Repositories with the longest chain are submitted first.
+
+    Attributes:
+        FILE_NAME (str): Name of the file that stores the hints.
+        DEFAULT_SIZE (int): Size in bytes assumed for unknown repositories.
+        hints_path (str): Path to the file with hints.
+    """
+
+    FILE_NAME = 'clone_hints.json'
+    DEFAULT_SIZE = 1024 * 1024
+
+    def __init__(self, hints_path=None, size_hints=None):
+        """Initialize the scheduler and read the learned hints.
+
+        Args:
+            hints_path (str): Path to the hints file. If None, the hints are
+                kept only in memory.
+            size_hints (dict): {name: size in bytes} given by the user. These
+                take precedence over the learned sizes.
+        """
+        super(CloneScheduler, self).__init__()
+        self.hints_path = hints_path
+        self.__lock = Lock()
+        hints = {}
+        if hints_path:
+            hints = Tools.load_json(hints_path, default={})
+        self.__sizes = hints.get('sizes', {})
+        self.__deps = hints.get('deps', {})
+        self.__user_sizes = size_hints if size_hints else {}
+
+    @staticmethod
+    def default_hints_path():
+        """Get the default location of the hints file."""
+        return path.join(Tools.cache_dir(), CloneScheduler.FILE_NAME)
+
+    @staticmethod
+    def load_size_hints(hints_file):
+        """Read user size hints from a json file {name: size in MiB}.
+
+        Entries whose size is not a non-negative number are skipped.
+
+        Args:
+            hints_file (str): Path to the json file.
+
+        Returns:
+            dict: {name: size in bytes}
+        """
+        hints = Tools.load_json(hints_file, default=None)
+        if not isinstance(hints, dict):
+            log.warning(" Ignoring malformed size hints file: '%s'",
+                        hints_file)
+            return {}
+        sizes = {}
+        for name, size in sorted(hints.items()):
+            try:
+                if isinstance(size, bool) or float(size) < 0:
+                    raise ValueError(size)
+                sizes[name] = int(float(size) * 1024 * 1024)
+            except (TypeError, ValueError, OverflowError):
+                log.warning(" Ignoring malformed size hint for '%s' in "
+                            "'%s': %s", name, hints_file, size)
+        return sizes
+
+    @staticmethod
+    def repository_size(repo_folder):
+        """Get the size of the git objects of a repository in bytes."""
+        return Tools.folder_size(path.join(repo_folder, '.git'))
+
+    def size(self, name):
+        """Get the estimated size of a repository in bytes."""
+        if name in self.__user_sizes:
+            return self.__user_sizes[name]
+        return self.__sizes.get(name, CloneScheduler.DEFAULT_SIZE)
+
+    def record_size(self, name, size):
+        """Remember the size of a cloned repository."""
+        with self.__lock:
+            self.__sizes[name] = size
+
+    def record_dependencies(self, name, dep_names):
+        """Remember the dependencies that a package unblocks."""
+        with self.__lock:
+            self.__deps[name] = sorted(dep_names)
+
+    def chain_size(self, name, visiting=None, memo=None):
+        """Get the size of the longest chain of clones starting at name.
+
+        Args:
+            name (str): Name of the repository.
+            visiting (set): Names on the current path, guards against cycles.
+            memo (dict): {name: chain size} computed so far.
+
+        Returns:
+            int: Sum of the sizes along the longest chain in bytes.
+        """
+        if visiting is None:
+            visiting = set()
+        if memo is None:
+            memo = {}
+        if name in memo:
+            return memo[name]
+        visiting.add(name)
+        longest_child = 0
+        for child in self.__deps.get(name, []):
+            if child in visiting:
+                continue
+            longest_child = max(longest_child,
+                                self.chain_size(child, visiting, memo))
+        visiting.discard(name)
+        memo[name] = self.size(name) + longest_child
+        return memo[name]
+
+    def order(self, names):
+        """Sort names so that the longest chains go first.
+
+        Ties are broken by name to keep the order deterministic.
+
+        Args:
+            names (iterable): Names of repositories to clone.
+
+        Returns:
+            str[]: Sorted names.
+        """
+        memo = {}
+        with self.__lock:
+            return sorted(names, key=lambda name: (
+                -self.chain_size(name, memo=memo), name))
+
+    def save(self):
+        """Write the learned hints to disk."""
+        if not self.hints_path:
+            return False
+        with self.__lock:
+            data = {'sizes': self.__sizes, 'deps': self.__deps}
+            return Tools.save_json(self.hints_path, data)
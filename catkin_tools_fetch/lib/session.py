@@ -0,0 +1,123 @@
+"""Holds the resources that one invocation of a verb shares.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import logging
+import contextlib
+from threading import Lock
+from concurrent import futures
+
+from catkin_tools_fetch.lib.concurrency import AdaptiveLimiter
+from catkin_tools_fetch.lib.printer import Printer
+from catkin_tools_fetch.lib.rosdep_index import RosdepIndex
+from catkin_tools_fetch.lib.tools import Tools
+
+log = logging.getLogger('deps')
+
+
+class Session(object):
+    """A worker pool, a printer and caches shared by one verb invocation.
+
+    `fetch` downloads in rounds and may pull and maintain afterwards. Every
+    round borrows the same threads, the same limiters, so that they keep
+    what they learn, and the same printer from the session instead of
+    starting its own. Use it as a context manager to shut the pool down
+    once the verb is done:
+
+        with Session(num_threads) as session:
+            Downloader(ws_path, [], set(), session=session)
+
+    Attributes:
+        PHASES (str[]): Phases that have a limiter.
+        num_threads (int): User given maximum of parallel tasks, may be None.
+        limiters (dict): {phase: AdaptiveLimiter} for all PHASES.
+        thread_pool (ThreadPoolExecutor): Runs the tasks of all phases.
+        printer (Printer): Shows the status of running tasks.
+    """
+
+    PHASES = ['probe', 'clone', 'pull', 'maintain']
+
+    def __init__(self, num_threads=None):
+        """Initialize the session.
+
+        Args:
+            num_threads (int): Maximum number of parallel tasks of all
+                phases together. Each phase adapts its own limit up to a
+                default if None.
+        """
+        super(Session, self).__init__()
+        self.num_threads = num_threads
+        self.limiters = AdaptiveLimiter.for_phases(Session.PHASES,
+                                                   num_threads)
+        # Every phase gets its own threads. A task waiting for its limiter
+        # must never keep a task of another phase from running.
+        self.thread_pool = futures.ThreadPoolExecutor(max_workers=sum(
+            limiter.ceiling for limiter in self.limiters.values()))
+        self.printer = Printer()
+        self.__ignore_pkgs = None
+        self.__system_pkgs = None
+        self.__process_pool = None
+        self.__lock = Lock()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def borrow(session=None, num_threads=None):
+        """Use the given session or a new one for a block of code.
+
+        Only a session created here is closed at the end of the block, the
+        given one stays open for its owner.
+
+        Args:
+            session (Session): Session of the caller, may be None.
+            num_threads (int): Used for a new session.
+
+        Yields:
+            Session: The session to use.
+        """
+        if session:
+            yield session
+            return
+        with Session(num_threads) as own_session:
+            yield own_session
+
+    def __enter__(self):
+        """Use the session for a block of code."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Shut the session down when leaving the block."""
+        self.close()
+        return False
+
+    @property
+    def ignore_pkgs(self):
+        """Get the installed ROS packages. Searched for only once."""
+        with self.__lock:
+            if self.__ignore_pkgs is None:
+                self.__ignore_pkgs = Tools.list_all_ros_pkgs()
+            return self.__ignore_pkgs
+
+    @property
+    def system_pkgs(self):
+        """Get the rosdep keys. Loaded only once."""
+        with self.__lock:
+            if self.__system_pkgs is None:
+                self.__system_pkgs = RosdepIndex.load()
+            return self.__system_pkgs
+
+    @property
+    def process_pool(self):
+        """Get a pool of processes for CPU-bound work. Started only once."""
+        with self.__lock:
+            if self.__process_pool is None:
+                self.__process_pool = futures.ProcessPoolExecutor(
+                    max_workers=self.num_threads)
+            return self.__process_pool
+
+    def close(self):
+        """Wait for running tasks and stop all workers."""
+        self.thread_pool.shutdown(wait=True)
+        with self.__lock:
+            if self.__process_pool is not None:
+                self.__process_pool.shutdown(wait=True)
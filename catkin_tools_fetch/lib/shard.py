@@ -0,0 +1,261 @@
+"""Splits the repositories of a workspace across several machines.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import os
+import re
+import json
+import heapq
+import hashlib
+import logging
+import subprocess
+from os import path
+
+from catkin_tools_fetch.lib.scheduler import CloneScheduler
+from catkin_tools_fetch.lib.tools import GitBridge
+from catkin_tools_fetch.lib.tools import Tools
+
+log = logging.getLogger('deps')
+
+
+class Shard(object):
+    """One of N deterministic parts of the repositories of a `.repos` file.
+
+    A single machine cannot clone hundreds of repositories faster than its
+    network link allows, so N machines each clone one shard and write it
+    into a folder of git bundles. The merge step clones all bundles into
+    one workspace, which is a local copy and takes no network at all.
+
+    Every machine computes the same split as long as it reads the same
+    `.repos` file and the same sizes: the repositories are sorted by size,
+    the biggest first, and each goes to the shard with the least data so
+    far. Ties are broken by path and by shard index. Only sizes given to
+    all machines count, never the ones a machine learned from its own
+    clones. Each manifest stores a key of the whole set and its sizes, so
+    merging shards of different sets or different splits fails.
+
+    Attributes:
+        SPEC_REGEX (re): Matches a shard given as `index/count`.
+        MANIFEST_NAME (str): Name of the manifest of a shard.
+        MANIFEST_REGEX (re): Matches the names of manifests.
+        MANIFEST_KEYS (str[]): Keys every manifest has.
+        BUNDLE_EXTENSION (str): Extension of the bundle files.
+        index (int): Index of this shard, starting at 1.
+        count (int): Number of shards.
+        key (str): Identifies the whole set of repositories and the sizes
+            they were split by.
+        repositories (dict): {relative path: repo} of this shard, as in
+            ReposFile.
+        all_paths (str[]): Paths of the repositories of all shards.
+    """
+
+    SPEC_REGEX = re.compile(r"^(\d+)/(\d+)$")
+    MANIFEST_NAME = "shard_{index}_of_{count}.json"
+    MANIFEST_REGEX = re.compile(r"^shard_\d+_of_\d+\.json$")
+    MANIFEST_KEYS = ['index', 'count', 'key', 'all_paths', 'repositories']
+    BUNDLE_EXTENSION = ".bundle"
+
+    def __init__(self, index, count, repositories, all_paths, key):
+        """Initialize a shard."""
+        super(Shard, self).__init__()
+        self.index = index
+        self.count = count
+        self.repositories = repositories
+        self.all_paths = all_paths
+        self.key = key
+
+    @staticmethod
+    def parse_spec(spec):
+        """Parse a shard given as `index/count`, e.g. `2/4`.
+
+        Raises:
+            ValueError: If the spec is malformed or out of range.
+
+        Returns:
+            tuple: (index, count)
+        """
+        match = Shard.SPEC_REGEX.match(spec.strip())
+        if not match:
+            raise ValueError(
+                "Shard '{}' is not in form 'index/count'.".format(spec))
+        index, count = int(match.group(1)), int(match.group(2))
+        if not 1 <= index <= count:
+            raise ValueError(
+                "Shard index must be between 1 and {}, got {}.".format(
+                    count, index))
+        return index, count
+
+    @staticmethod
+    def make_key(repositories, sizes=None):
+        """Get a key that identifies a set of repositories and its split.
+
+        Args:
+            repositories (dict): {relative path: repo} of all shards.
+            sizes (dict): {relative path: size in bytes} the shards were
+                split by.
+        """
+        text = json.dumps({'repositories': repositories,
+                           'sizes': sizes if sizes else {}}, sort_keys=True)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def split(sizes, count):
+        """Split names into count parts of about the same total size.
+
+        Args:
+            sizes (dict): {name: size in bytes}
+            count (int): Number of parts.
+
+        Returns:
+            list: count sorted lists of names.
+        """
+        parts = [[] for _ in range(count)]
+        totals = [(0, i) for i in range(count)]
+        heapq.heapify(totals)
+        for name in sorted(sizes, key=lambda name: (-sizes[name], name)):
+            total, i = heapq.heappop(totals)
+            parts[i].append(name)
+            heapq.heappush(totals, (total + sizes[name], i))
+        return [sorted(part) for part in parts]
+
+    @staticmethod
+    def from_repos(repos_file, index, count, size_hints=None):
+        """Pick the repositories of one shard.
+
+        Args:
+            repos_file (ReposFile): All repositories.
+            index (int): Index of the shard, starting at 1.
+            count (int): Number of shards.
+            size_hints (dict): {relative path: size in bytes} given by the
+                user, the same on all machines. Repositories without a hint
+                weigh CloneScheduler.DEFAULT_SIZE.
+
+        Returns:
+            Shard: The shard.
+        """
+        repositories = repos_file.repositories
+        if not size_hints:
+            size_hints = {}
+        sizes = {repo_path: size_hints.get(repo_path,
+                                           CloneScheduler.DEFAULT_SIZE)
+                 for repo_path in repositories}
+        part = Shard.split(sizes, count)[index - 1]
+        return Shard(index, count,
+                     {repo_path: repositories[repo_path]
+                      for repo_path in part},
+                     sorted(repositories),
+                     Shard.make_key(repositories, sizes))
+
+    def manifest_name(self):
+        """Get the file name of the manifest of this shard."""
+        return Shard.MANIFEST_NAME.format(index=self.index, count=self.count)
+
+    def write_bundles(self, ws_path, bundle_dir, backend=GitBridge,
+                      session=None):
+        """Bundle the cloned repositories of this shard.
+
+        The manifest lists every bundle that was written, along with the
+        url and version of its repository.
+
+        Args:
+            ws_path (str): Workspace source path with the clones.
+            bundle_dir (str): Folder to write the bundles and manifest to.
+            backend (GitBackend): Writes the bundles.
+            session (Session): Lends its workers, bundles are written one
+                by one if None.
+
+        Returns:
+            int: Error code. 0 if all fine, 1 if a bundle failed.
+        """
+        def write_bundle(repo_path):
+            bundle_path = path.join(bundle_dir,
+                                    repo_path + Shard.BUNDLE_EXTENSION)
+            try:
+                if not path.isdir(path.dirname(bundle_path)):
+                    os.makedirs(path.dirname(bundle_path))
+                backend.bundle(path.join(ws_path, repo_path), bundle_path)
+            except (OSError, subprocess.CalledProcessError) as e:
+                log.error(" %s: cannot write bundle: %s",
+                          Tools.decorate(repo_path), e)
+                return repo_path, None
+            return repo_path, path.relpath(bundle_path, bundle_dir)
+
+        paths = sorted(self.repositories)
+        if session:
+            results = list(session.thread_pool.map(write_bundle, paths))
+        else:
+            results = [write_bundle(repo_path) for repo_path in paths]
+        repositories = {}
+        for repo_path, bundle in results:
+            if bundle:
+                repositories[repo_path] = dict(self.repositories[repo_path],
+                                               bundle=bundle)
+        manifest = {'index': self.index,
+                    'count': self.count,
+                    'key': self.key,
+                    'all_paths': self.all_paths,
+                    'repositories': repositories}
+        if not Tools.save_json(path.join(bundle_dir, self.manifest_name()),
+                               manifest):
+            return 1
+        log.info(" Wrote %s of %s bundles of shard %s/%s to '%s'.",
+                 len(repositories), len(paths), self.index, self.count,
+                 bundle_dir)
+        if len(repositories) != len(paths):
+            return 1
+        return 0
+
+    @staticmethod
+    def load_bundles(bundle_dirs):
+        """Read the manifests of all shards from their folders.
+
+        Args:
+            bundle_dirs (str[]): Folders written by write_bundles. A folder
+                may hold the manifests of several shards.
+
+        Raises:
+            ValueError: If a shard is missing or they do not fit together.
+
+        Returns:
+            dict: {relative path: repo} of all repositories. The 'bundle' of
+                a repo is the absolute path to its bundle.
+        """
+        manifests = {}
+        for bundle_dir in bundle_dirs:
+            if not path.isdir(bundle_dir):
+                raise ValueError("'{}' is not a folder.".format(bundle_dir))
+            for file_name in sorted(os.listdir(bundle_dir)):
+                if not Shard.MANIFEST_REGEX.match(file_name):
+                    continue
+                manifest = Tools.load_json(path.join(bundle_dir, file_name))
+                if not isinstance(manifest, dict) or \
+                        not set(Shard.MANIFEST_KEYS) <= set(manifest):
+                    raise ValueError("Malformed manifest '{}'.".format(
+                        path.join(bundle_dir, file_name)))
+                manifest['folder'] = path.abspath(bundle_dir)
+                manifests[manifest['index']] = manifest
+        if not manifests:
+            raise ValueError("No shard manifests in {}.".format(
+                ", ".join(bundle_dirs)))
+        first = manifests[min(manifests)]
+        for manifest in manifests.values():
+            if manifest['key'] != first['key'] or \
+                    manifest['count'] != first['count']:
+                raise ValueError(
+                    "Shards were made from different repositories or "
+                    "size hints.")
+        missing_shards = sorted(set(range(1, first['count'] + 1)) -
+                                set(manifests))
+        if missing_shards:
+            raise ValueError("Missing shards {} of {}.".format(
+                ", ".join(str(i) for i in missing_shards), first['count']))
+        repositories = {}
+        for manifest in manifests.values():
+            for repo_path, repo in manifest['repositories'].items():
+                repositories[repo_path] = dict(
+                    repo, bundle=path.join(manifest['folder'], repo['bundle']))
+        missing = sorted(set(first['all_paths']) - set(repositories))
+        if missing:
+            raise ValueError("No bundle for: {}.".format(", ".join(missing)))
+        return repositories
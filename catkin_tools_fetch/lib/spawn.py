@@ -0,0 +1,277 @@
+"""Starts external commands without a shell.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import os
+import re
+import sys
+import time
+import errno
+import select
+import signal
+import logging
+import subprocess
+from threading import Lock
+
+try:
+    import selectors
+    from shutil import which as find_executable
+except ImportError:
+    # Python 2 has neither, select and distutils do the same there.
+    selectors = None
+    from distutils.spawn import find_executable
+
+log = logging.getLogger('deps')
+
+
+class CommandResult(object):
+    """Outcome of a single command.
+
+    Attributes:
+        argv (str[]): The command and its arguments.
+        returncode (int): Exit code, negative if killed by a signal.
+        stdout (bytes): What the command wrote to stdout.
+        stderr (bytes): What the command wrote to stderr.
+        timed_out (bool): True if the command was killed after a timeout.
+        duration (float): Seconds from the start to the exit of the command.
+    """
+
+    def __init__(self, argv, returncode, stdout, stderr, timed_out=False,
+                 duration=0.0):
+        """Initialize a result."""
+        super(CommandResult, self).__init__()
+        self.argv = argv
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+        self.duration = duration
+
+    @property
+    def output(self):
+        """Get stdout followed by stderr."""
+        return self.stdout + self.stderr
+
+    @property
+    def ok(self):
+        """Check if the command finished in time and succeeded."""
+        return not self.timed_out and self.returncode == 0
+
+
+class Spawner(object):
+    """Runs commands given as argument lists.
+
+    Commands are started with `posix_spawn` where the platform has it, which
+    avoids copying the memory map of a large Python process like a fork
+    does, and fall back to `subprocess.Popen` otherwise. Every command runs
+    in its own process group, so a timeout kills it and all its helpers.
+    Stdin is `/dev/null`, so nothing ever waits for a password.
+
+    Attributes:
+        USE_POSIX_SPAWN (bool): Start commands with `posix_spawn`.
+        PYTHON2 (bool): Use what Python 2 has instead of `selectors`,
+            `subprocess.DEVNULL` and `start_new_session`.
+        NOT_FOUND_CODE (int): Exit code reported for missing executables,
+            the same one a shell reports.
+        LINE_END_REGEX (re): Line endings. Git redraws progress with '\\r'.
+    """
+
+    USE_POSIX_SPAWN = hasattr(os, 'posix_spawn')
+    PYTHON2 = sys.version_info[0] < 3
+    NOT_FOUND_CODE = 127
+    LINE_END_REGEX = re.compile(b"(\r|\n)")
+    READ_SIZE = 4096
+
+    __executables = {}
+    __executables_lock = Lock()
+
+    @staticmethod
+    def which(name):
+        """Find the full path of an executable, cached per name and PATH.
+
+        Returns:
+            str: Path to the executable or None if there is none.
+        """
+        if os.sep in name:
+            return name
+        key = (name, os.environ.get('PATH'))
+        with Spawner.__executables_lock:
+            if key not in Spawner.__executables:
+                Spawner.__executables[key] = find_executable(name)
+            return Spawner.__executables[key]
+
+    @staticmethod
+    def run(argv, timeout=None, env=None, cwd=None, on_line=None):
+        """Run a command and collect its output.
+
+        Args:
+            argv (str[]): The command and its arguments.
+            timeout (float): Seconds before the command is killed.
+            env (dict): Environment of the command, the current one if None.
+            cwd (str): Folder to run the command in. Needs a fork, so
+                prefer options like `git -C` where possible.
+            on_line (callable): If given, called with every line of stdout
+                and stderr as soon as it arrives.
+
+        Returns:
+            CommandResult: The outcome of the command.
+        """
+        start = time.time()
+        executable = Spawner.which(argv[0])
+        if not executable:
+            return CommandResult(
+                argv, Spawner.NOT_FOUND_CODE, b"",
+                "{}: command not found\n".format(argv[0]).encode("utf-8"))
+        if env is None:
+            env = os.environ
+        stdout_read, stdout_write = os.pipe()
+        stderr_read, stderr_write = os.pipe()
+        try:
+            pid, process = Spawner.__start(executable, argv, env, cwd,
+                                           stdout_write, stderr_write)
+        except OSError as e:
+            for fd in [stdout_read, stdout_write, stderr_read, stderr_write]:
+                os.close(fd)
+            if e.errno not in [errno.ENOENT, errno.EACCES]:
+                raise
+            return CommandResult(argv, Spawner.NOT_FOUND_CODE, b"",
+                                 str(e).encode("utf-8"))
+        os.close(stdout_write)
+        os.close(stderr_write)
+        stdout, stderr, timed_out = Spawner.__collect(
+            pid, stdout_read, stderr_read, timeout, on_line)
+        if process:
+            returncode = process.wait()
+        else:
+            _, status = os.waitpid(pid, 0)
+            returncode = Spawner.exit_code(status)
+        return CommandResult(argv, returncode, stdout, stderr, timed_out,
+                             time.time() - start)
+
+    @staticmethod
+    def exit_code(status):
+        """Turn a wait status into an exit code, negative for a signal.
+
+        Same as `os.waitstatus_to_exitcode`, which needs Python 3.9, while
+        `posix_spawn` is there since Python 3.8.
+        """
+        if os.WIFSIGNALED(status):
+            return -os.WTERMSIG(status)
+        return os.WEXITSTATUS(status)
+
+    @staticmethod
+    def __start(executable, argv, env, cwd, stdout_fd, stderr_fd):
+        """Start a process in a new process group.
+
+        Returns:
+            tuple: (pid, Popen object or None if started by posix_spawn)
+        """
+        if Spawner.USE_POSIX_SPAWN and cwd is None:
+            file_actions = [
+                (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+                (os.POSIX_SPAWN_DUP2, stdout_fd, 1),
+                (os.POSIX_SPAWN_DUP2, stderr_fd, 2)]
+            pid = os.posix_spawn(executable, argv, env,
+                                 file_actions=file_actions, setpgroup=0)
+            return pid, None
+        if Spawner.PYTHON2:
+            stdin = open(os.devnull, 'rb')
+            group = {'preexec_fn': os.setsid}
+        else:
+            stdin = subprocess.DEVNULL
+            group = {'start_new_session': True}
+        try:
+            # Python 2 lets children inherit all pipes unless closed here.
+            process = subprocess.Popen(argv, executable=executable,
+                                       stdin=stdin,
+                                       stdout=stdout_fd,
+                                       stderr=stderr_fd,
+                                       cwd=cwd,
+                                       env=env,
+                                       close_fds=True,
+                                       **group)
+        finally:
+            if Spawner.PYTHON2:
+                stdin.close()
+        return process.pid, process
+
+    @staticmethod
+    def kill_group(pid):
+        """Kill a process group: the command and all its helpers."""
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    @staticmethod
+    def __collect(pid, stdout_fd, stderr_fd, timeout, on_line):
+        """Read both pipes until they close or the timeout passes."""
+        deadline = None if timeout is None else time.time() + timeout
+        chunks = {stdout_fd: [], stderr_fd: []}
+        partial = {stdout_fd: b"", stderr_fd: b""}
+        timed_out = False
+        open_fds = set(chunks)
+        selector = None
+        if not Spawner.PYTHON2:
+            selector = selectors.DefaultSelector()
+            for fd in chunks:
+                selector.register(fd, selectors.EVENT_READ)
+        try:
+            while open_fds:
+                wait = None
+                if deadline is not None:
+                    wait = deadline - time.time()
+                    if wait <= 0:
+                        timed_out = True
+                        Spawner.kill_group(pid)
+                        deadline = None
+                        wait = None
+                for fd in Spawner.__readable(selector, open_fds, wait):
+                    chunk = os.read(fd, Spawner.READ_SIZE)
+                    if not chunk:
+                        open_fds.discard(fd)
+                        if selector:
+                            selector.unregister(fd)
+                        continue
+                    chunks[fd].append(chunk)
+                    if on_line:
+                        partial[fd] = Spawner.__split_lines(
+                            partial[fd] + chunk, on_line)
+        finally:
+            if selector:
+                selector.close()
+            os.close(stdout_fd)
+            os.close(stderr_fd)
+        if on_line:
+            for line in partial.values():
+                if line:
+                    on_line(line.decode("utf-8", "replace"))
+        return (b"".join(chunks[stdout_fd]), b"".join(chunks[stderr_fd]),
+                timed_out)
+
+    @staticmethod
+    def __readable(selector, fds, wait):
+        """Wait at most wait seconds for some of the fds to be readable.
+
+        Uses `select` if there is no selector, as on Python 2.
+        """
+        if selector:
+            return [key.fd for key, _ in selector.select(wait)]
+        try:
+            readable, _, _ = select.select(sorted(fds), [], [], wait)
+        except select.error as e:
+            # Python 2 does not retry a select interrupted by a signal.
+            if e.args[0] != errno.EINTR:
+                raise
+            return []
+        return readable
+
+    @staticmethod
+    def __split_lines(data, on_line):
+        """Report complete lines and return the unfinished rest."""
+        parts = Spawner.LINE_END_REGEX.split(data)
+        for line in parts[:-1:2]:
+            if line:
+                on_line(line.decode("utf-8", "replace"))
+        return parts[-1]
@@ -0,0 +1,249 @@
+"""Summarizes the history of past runs.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import re
+import math
+import time
+import logging
+from collections import defaultdict
+
+from catkin_tools_fetch.lib.history import RunHistory
+from catkin_tools_fetch.lib.progress import CloneProgress
+
+log = logging.getLogger('deps')
+
+
+class RunStats(object):
+    """Statistics over the runs stored in a `RunHistory` file.
+
+    Attributes:
+        PERCENTILES (int[]): Percentiles reported for every operation.
+        LOCAL_HOST (str): Host name used for local and unknown urls.
+        METRIC_PREFIX (str): Prefix of all exported Prometheus metrics.
+        runs (list): Runs as dictionaries, the oldest first.
+    """
+
+    PERCENTILES = [50, 90, 99]
+    LOCAL_HOST = 'local'
+    METRIC_PREFIX = 'catkin_deps'
+
+    HOST_REGEX = re.compile(r"^(?:[\w+.-]+://)?(?:[^@/]+@)?(?P<host>[^/:]+)")
+
+    def __init__(self, runs):
+        """Initialize the statistics with a list of runs."""
+        super(RunStats, self).__init__()
+        self.runs = runs
+
+    @staticmethod
+    def percentile(values, percent):
+        """Get a percentile of values using the nearest-rank method.
+
+        Args:
+            values (list): Numbers, not necessarily sorted.
+            percent (float): Percentile in [0, 100].
+
+        Returns:
+            float: The percentile or None if there are no values.
+        """
+        if not values:
+            return None
+        values = sorted(values)
+        rank = int(math.ceil(percent / 100.0 * len(values)))
+        return values[min(max(rank, 1), len(values)) - 1]
+
+    @staticmethod
+    def host(url):
+        """Get the host of a repository url, e.g. 'github.com'."""
+        if not url or '://' not in url and '@' not in url:
+            return RunStats.LOCAL_HOST
+        match = RunStats.HOST_REGEX.match(url)
+        if not match:
+            return RunStats.LOCAL_HOST
+        return match.group('host')
+
+    def records(self, operation=None):
+        """Iterate over all recorded operations of all runs."""
+        for run in self.runs:
+            for record in run.get('repos', []):
+                if operation and record.get('operation') != operation:
+                    continue
+                yield record
+
+    def durations(self):
+        """Get percentiles of durations per operation.
+
+        Returns:
+            dict: {operation: {'count': int, 'sum': float,
+                               'percentiles': {percent: seconds}}}
+        """
+        by_operation = defaultdict(list)
+        for record in self.records():
+            by_operation[record['operation']].append(record['duration'])
+        summary = {}
+        for operation, values in by_operation.items():
+            summary[operation] = {
+                'count': len(values),
+                'sum': sum(values),
+                'percentiles': {
+                    percent: RunStats.percentile(values, percent)
+                    for percent in RunStats.PERCENTILES}}
+        return summary
+
+    def slowest(self, count=10):
+        """Get the repositories that are slow to clone or pull most often.
+
+        A repository is ranked by its median duration over all runs, so a
+        single slow run does not put it on the list.
+
+        Args:
+            count (int): Maximum number of repositories to return.
+
+        Returns:
+            list: Tuples (name, operation, median seconds, number of runs).
+        """
+        by_repo = defaultdict(list)
+        for record in self.records():
+            if record['operation'] == 'probe':
+                continue
+            by_repo[(record['name'], record['operation'])].append(
+                record['duration'])
+        slowest = [(name, operation, RunStats.percentile(values, 50),
+                    len(values))
+                   for (name, operation), values in by_repo.items()]
+        slowest.sort(key=lambda entry: (-entry[2], entry[0]))
+        return slowest[:count]
+
+    def failure_rates(self):
+        """Get the failure rate of clones and pulls per host.
+
+        Returns:
+            dict: {host: (failures, total)}
+        """
+        rates = defaultdict(lambda: [0, 0])
+        for record in self.records():
+            if record['operation'] == 'probe':
+                continue
+            counts = rates[RunStats.host(record.get('url'))]
+            counts[1] += 1
+            if record['outcome'] == RunHistory.ERROR:
+                counts[0] += 1
+        return {host: tuple(counts) for host, counts in rates.items()}
+
+    def trend(self, bucket_seconds=24 * 3600):
+        """Get how the runs evolved over time.
+
+        Args:
+            bucket_seconds (int): Length of a time bucket, one day by default.
+
+        Returns:
+            list: Tuples (bucket start, number of runs, median run duration,
+                received bytes), the oldest first.
+        """
+        buckets = defaultdict(list)
+        for run in self.runs:
+            start = int(run.get('started', 0) // bucket_seconds)
+            buckets[start * bucket_seconds].append(run)
+        trend = []
+        for start in sorted(buckets):
+            runs = buckets[start]
+            received = sum(record.get('bytes', 0)
+                           for run in runs for record in run.get('repos', []))
+            trend.append((start, len(runs), RunStats.percentile(
+                [run.get('duration', 0) for run in runs], 50), received))
+        return trend
+
+    def report(self, count=10):
+        """Generate a human readable report.
+
+        Args:
+            count (int): Number of slowest repositories to show.
+
+        Returns:
+            str[]: Lines of the report.
+        """
+        if not self.runs:
+            return ["No runs recorded yet."]
+        lines = ["{} runs recorded since {}.".format(
+            len(self.runs), RunStats.__format_time(self.runs[0]['started']))]
+        lines.append("Durations:")
+        for operation, summary in sorted(self.durations().items()):
+            lines.append("  {:<6} {:>6} ops  {}".format(
+                operation, summary['count'], "  ".join(
+                    "p{}: {:.2f} s".format(percent, value) for
+                    percent, value in sorted(summary['percentiles'].items()))))
+        lines.append("Slowest repositories (median):")
+        for name, operation, median, num_runs in self.slowest(count):
+            lines.append("  {:<30} {:<6} {:.2f} s over {} runs".format(
+                name, operation, median, num_runs))
+        lines.append("Failure rates by host:")
+        for host, (failures, total) in sorted(self.failure_rates().items()):
+            lines.append("  {:<30} {:.1f}% of {} ops".format(
+                host, 100.0 * failures / total, total))
+        lines.append("Trend per day (UTC):")
+        for start, num_runs, median, received in self.trend():
+            lines.append("  {}  {:>4} runs  median {:.1f} s  {}".format(
+                time.strftime('%Y-%m-%d', time.gmtime(start)), num_runs,
+                median, CloneProgress.format_bytes(received)))
+        return lines
+
+    def to_prometheus(self):
+        """Export the statistics in the Prometheus text format.
+
+        Returns:
+            str: Contents of a textfile for the node exporter.
+        """
+        prefix = RunStats.METRIC_PREFIX
+        lines = []
+        lines.append("# HELP {}_runs_total Recorded runs.".format(prefix))
+        lines.append("# TYPE {}_runs_total counter".format(prefix))
+        runs_per_verb = defaultdict(int)
+        last_runs = {}
+        for run in self.runs:
+            runs_per_verb[run.get('verb')] += 1
+            last_runs[run.get('verb')] = run
+        for verb, num_runs in sorted(runs_per_verb.items()):
+            lines.append('{}_runs_total{{verb="{}"}} {}'.format(
+                prefix, verb, num_runs))
+        name = prefix + "_last_run_duration_seconds"
+        lines.append("# HELP {} Duration of the last run.".format(name))
+        lines.append("# TYPE {} gauge".format(name))
+        for verb, run in sorted(last_runs.items()):
+            lines.append('{}{{verb="{}"}} {}'.format(
+                name, verb, run.get('duration', 0)))
+        name = prefix + "_last_run_timestamp_seconds"
+        lines.append("# HELP {} Start time of the last run.".format(name))
+        lines.append("# TYPE {} gauge".format(name))
+        for verb, run in sorted(last_runs.items()):
+            lines.append('{}{{verb="{}"}} {}'.format(
+                name, verb, run.get('started', 0)))
+        name = prefix + "_operation_duration_seconds"
+        lines.append("# HELP {} Duration of git operations.".format(name))
+        lines.append("# TYPE {} summary".format(name))
+        for operation, summary in sorted(self.durations().items()):
+            for percent, value in sorted(summary['percentiles'].items()):
+                lines.append('{}{{operation="{}",quantile="{}"}} {}'.format(
+                    name, operation, percent / 100.0, value))
+            lines.append('{}_sum{{operation="{}"}} {}'.format(
+                name, operation, round(summary['sum'], 3)))
+            lines.append('{}_count{{operation="{}"}} {}'.format(
+                name, operation, summary['count']))
+        name = prefix + "_operations_total"
+        lines.append("# HELP {} Clones and pulls per host.".format(name))
+        lines.append("# TYPE {} counter".format(name))
+        failures_name = prefix + "_operation_failures_total"
+        failure_lines = [
+            "# HELP {} Failed clones and pulls per host.".format(
+                failures_name),
+            "# TYPE {} counter".format(failures_name)]
+        for host, (failures, total) in sorted(self.failure_rates().items()):
+            lines.append('{}{{host="{}"}} {}'.format(name, host, total))
+            failure_lines.append('{}{{host="{}"}} {}'.format(
+                failures_name, host, failures))
+        return "\n".join(lines + failure_lines) + "\n"
+
+    @staticmethod
+    def __format_time(timestamp):
+        """Format a timestamp in local time."""
+        return time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp))
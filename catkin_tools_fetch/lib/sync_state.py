@@ -0,0 +1,85 @@
+"""Remembers when each repository of a workspace was last synced."""
+import re
+import time
+import threading
+from os import path
+
+from catkin_tools_fetch.lib.closure_cache import ClosureCache
+from catkin_tools_fetch.lib.tools import Tools
+
+
+class SyncState(object):
+    """Time and commit of the last successful pull of every repository.
+
+    `update --max-age` skips the repositories that were pulled within the
+    window, so that repeated updates during a day do not ask every remote
+    again. The state is kept inside the workspace, keyed by the folder of
+    each package relative to the source space.
+
+    Attributes:
+        FILE_NAME (str): Name of the state inside ClosureCache.FOLDER.
+        AGE_REGEX (re): Matches an age like `90`, `15m`, `2h` or `1d`.
+        AGE_UNITS (dict): Seconds per unit of an age.
+        state_path (str): Path to the state file.
+        repos (dict): {folder: {'synced': time, 'sha': sha}}
+    """
+
+    FILE_NAME = 'sync_state.json'
+    AGE_REGEX = re.compile(r"^(\d+(?:\.\d+)?)([smhd]?)$")
+    AGE_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+    def __init__(self, state_path):
+        """Initialize the state stored in a file."""
+        super(SyncState, self).__init__()
+        self.state_path = state_path
+        self.repos = Tools.load_json(state_path, default={})
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def default_state_path(workspace):
+        """Get the state file inside the workspace."""
+        return path.join(workspace, ClosureCache.FOLDER, SyncState.FILE_NAME)
+
+    @staticmethod
+    def parse_age(text):
+        """Parse an age in seconds, or with a unit `s`, `m`, `h` or `d`.
+
+        Raises:
+            ValueError: If the age is malformed.
+
+        Returns:
+            float: The age in seconds.
+        """
+        match = SyncState.AGE_REGEX.match(text.strip().lower())
+        if not match:
+            raise ValueError(
+                "Age '{}' is not a number with an optional unit s, m, h "
+                "or d.".format(text))
+        return float(match.group(1)) * SyncState.AGE_UNITS[match.group(2)]
+
+    def is_fresh(self, folder, max_age, now=None):
+        """Check if a folder was synced less than max_age seconds ago."""
+        with self.__lock:
+            repo = self.repos.get(folder)
+        if not repo or 'synced' not in repo:
+            return False
+        if now is None:
+            now = time.time()
+        return 0 <= now - repo['synced'] < max_age
+
+    def record(self, folder, sha, now=None):
+        """Remember that a folder was synced to a commit."""
+        if now is None:
+            now = time.time()
+        with self.__lock:
+            self.repos[folder] = {'synced': round(now, 3), 'sha': sha}
+
+    def save(self):
+        """Write the state to its file.
+
+        Returns:
+            bool: True if written, False otherwise.
+        """
+        with self.__lock:
+            repos = dict(self.repos)
+        return Tools.save_json(self.state_path, repos)
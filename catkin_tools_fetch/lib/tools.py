@@ -5,35 +5,379 @@ Attributes:
 """
 import subprocess
 import logging
+import random
+import shutil
+import signal
+import json
+import time
+import os
 import re
 
+from os import path
+
 from termcolor import colored
 
+from catkin_tools_fetch.lib.spawn import Spawner
+
 log = logging.getLogger('deps')
 
 
-class GitBridge(object):
-    """A bridge to git and its cmd functions."""
+class GitTimeoutError(subprocess.CalledProcessError):
+    """A git command did not finish in time and was killed."""
 
-    STATUS_CMD = "git status --porcelain --branch"
-    PULL_CMD_MASK = "git pull origin {branch}"
+    def __str__(self):
+        """Show how to print it."""
+        return "Command '{}' timed out and was killed.".format(self.cmd)
 
-    CHECK_CMD_MASK = "git ls-remote {url}"
-    CLONE_CMD_MASK = "git clone --recursive --branch {branch} {url} {path}"
 
-    BRANCH_REGEX = re.compile(r"## (?!HEAD)([\w\-_]+)")
+class GitBackend(object):
+    """The interface of everything that talks to git repositories.
+
+    Downloader and Updater only use these methods, so another transport or
+    an in-memory fake can replace the git command line.
+    """
 
     EXISTS_TAG = colored("[ALREADY EXISTS]", "green")
     CLONED_TAG = colored("[CLONED]", "green") + " [BRANCH: '{branch}']"
     ERROR_TAG = colored("[ERROR]", "red")
 
+    def status(self, repo_folder):
+        """Get the status of a local repository.
+
+        Returns:
+            tuple: (output, branch, has_changes)
+        """
+        raise NotImplementedError()
+
+    def pull(self, repo_folder, branch):
+        """Pull the branch of a local repository and return the output.
+
+        Raises:
+            subprocess.CalledProcessError: If the pull failed.
+        """
+        raise NotImplementedError()
+
+    def clone(self, name, url, clone_path, branch="master", on_progress=None,
+              subdir=None, sha=None):
+        """Clone the repo from url into clone_path.
+
+        Only subdir and the files at the top of the repository are checked
+        out if subdir is given. The branch is checked out at sha if given.
+
+        Returns:
+            tuple: (name, tag) where tag shows the result of the clone.
+        """
+        raise NotImplementedError()
+
+    def repository_exists(self, dependency):
+        """Find the first url of a dependency that hosts its branch.
+
+        Returns:
+            tuple: (dependency, found). The url and the sha of the branch
+                are set in the dependency.
+        """
+        raise NotImplementedError()
+
+    def get_branch_name(self, status_output):
+        """Parse branch name from the output of status."""
+        raise NotImplementedError()
+
+    def maintain(self, repo_folder, task):
+        """Run a single maintenance task, e.g. 'commit-graph', in a repo.
+
+        Raises:
+            subprocess.CalledProcessError: If the task failed.
+        """
+        raise NotImplementedError()
+
+    def remote_url(self, repo_folder):
+        """Get the url of the origin of a local repository.
+
+        Returns:
+            str: The url or None if there is no origin.
+        """
+        raise NotImplementedError()
+
+    def head(self, repo_folder):
+        """Get what is checked out in a local repository.
+
+        Returns:
+            tuple: (branch or None if detached, sha)
+
+        Raises:
+            subprocess.CalledProcessError: If there is no commit.
+        """
+        raise NotImplementedError()
+
+    def fetched_sha(self, repo_folder):
+        """Get the commit of the remote branch fetched by the last pull.
+
+        Raises:
+            subprocess.CalledProcessError: If nothing was fetched.
+        """
+        raise NotImplementedError()
+
+    def bundle(self, repo_folder, bundle_path):
+        """Write all refs and objects of a local repository into one file.
+
+        Raises:
+            subprocess.CalledProcessError: If the bundle cannot be written.
+        """
+        raise NotImplementedError()
+
+    def set_remote_url(self, repo_folder, url):
+        """Point the origin of a local repository to another url.
+
+        Raises:
+            subprocess.CalledProcessError: If there is no origin.
+        """
+        raise NotImplementedError()
+
+
+class GitBridge(GitBackend):
+    """A bridge to git and its cmd functions.
+
+    This is the default backend. All methods are static, so the class itself
+    is used as the backend object.
+
+    Attributes:
+        TIMEOUTS (dict): {operation: seconds} before a git command is killed.
+        RETRIES (int): How many times to retry after a transient error.
+        BACKOFF (float): Base delay in seconds between the retries.
+    """
+
+    GIT = "git"
+    STATUS_ARGS = ["status", "--porcelain", "--branch"]
+    PULL_ARGS = ["pull", "origin", "{branch}"]
+
+    # Under protocol v2, --heads and --tags make the server send only refs
+    # with that prefix. Name patterns alone are matched on the client, after
+    # every ref has been sent. The peeled annotated tag is only listed if
+    # asked for explicitly.
+    CHECK_ARGS = ["-c", "protocol.version=2", "ls-remote", "--{kind}",
+                  "{url}"]
+    PROBE_REFS = [('heads', ["{branch}"]),
+                  ('tags', ["{branch}", "{branch}^{{}}"])]
+    DEFAULT_BRANCH = "master"
+    CLONE_ARGS = ["clone", "--recursive", "--branch", "{branch}", "{url}",
+                  "{path}"]
+    # A commit cannot be cloned as a branch, so it is checked out after.
+    # Without a branch the default branch of the remote is checked out.
+    CLONE_COMMIT_ARGS = ["clone", "--recursive", "{url}", "{path}"]
+    # Blobs are fetched on demand, so only the checked out ones are sent.
+    SPARSE_CLONE_FLAGS = ["--filter=blob:none", "--sparse"]
+    SPARSE_SET_ARGS = ["sparse-checkout", "set", "--cone", "{subdir}"]
+    CHECKOUT_ARGS = ["checkout", "-q", "--detach", "{sha}"]
+    # Moves the cloned branch back to the commit seen by the probe.
+    RESET_ARGS = ["reset", "-q", "--hard", "{sha}"]
+    SUBMODULE_ARGS = ["submodule", "update", "-q", "--init", "--recursive"]
+    REMOTE_URL_ARGS = ["remote", "get-url", "origin"]
+    # Options of rev-parse apply to the arguments after them.
+    HEAD_ARGS = ["rev-parse", "HEAD", "--abbrev-ref", "HEAD"]
+    # The commit of the remote branch brought in by the last pull.
+    FETCH_HEAD_ARGS = ["rev-parse", "FETCH_HEAD"]
+    PROGRESS_FLAG = "--progress"
+    PARTIAL_SUFFIX = ".partial"
+    MAINTENANCE_ARGS = ["maintenance", "run", "--task={task}"]
+    BUNDLE_ARGS = ["bundle", "create", "{bundle_path}", "--all"]
+    SET_URL_ARGS = ["remote", "set-url", "origin", "{url}"]
+
+    BRANCH_REGEX = re.compile(r"## (?!HEAD)([\w\-_]+)")
+    SHA_REGEX = re.compile(r"^[0-9a-f]{40,64}$")
+    LS_REMOTE_REGEX = re.compile(r"^(?P<sha>[0-9a-f]{40,64})\t(?P<ref>\S+)$",
+                                 re.MULTILINE)
+    # A host that does not resolve is not retried: the name is wrong far
+    # more often than DNS is briefly down, and every url would wait.
+    TRANSIENT_ERROR_REGEX = re.compile(
+        r"Connection timed out|Connection reset|Operation timed out|"
+        r"Failed to connect|early EOF|RPC failed|"
+        r"remote end hung up unexpectedly|Couldn't connect to server|"
+        r"SSL_ERROR_SYSCALL")
+
+    TIMEOUTS = {'status': 60, 'pull': 600, 'probe': 60, 'clone': 3600,
+                'maintain': 3600}
+    RETRIES = 2
+    BACKOFF = 1.0
+
+    # Git never asks for credentials, a missing repository just fails.
+    ENV_OVERRIDES = {"GIT_TERMINAL_PROMPT": "0"}
+    __environment = None
+
+    @staticmethod
+    def environment():
+        """Get the environment of all git commands.
+
+        It is computed once and shared by all commands instead of copying
+        the environment of the process for every call.
+        """
+        if GitBridge.__environment is None:
+            environment = dict(os.environ)
+            environment.update(GitBridge.ENV_OVERRIDES)
+            GitBridge.__environment = environment
+        return GitBridge.__environment
+
+    @staticmethod
+    def git_argv(args, repo_folder=None, **fields):
+        """Build the arguments of a git command from a template.
+
+        Args:
+            args (str[]): Arguments after `git`, formatted with the fields.
+            repo_folder (str): Repository to run in, passed as `git -C`.
+            **fields: Values of the placeholders in the arguments.
+
+        Returns:
+            str[]: The full command.
+        """
+        argv = [GitBridge.GIT]
+        if repo_folder:
+            argv += ["-C", repo_folder]
+        return argv + [arg.format(**fields) for arg in args]
+
+    @staticmethod
+    def configure(timeouts=None, retries=None):
+        """Configure timeouts and retries of all git commands.
+
+        Args:
+            timeouts (dict): {operation: seconds}, only given ones change.
+            retries (int): How many times to retry after a transient error.
+        """
+        if timeouts:
+            unknown = set(timeouts) - set(GitBridge.TIMEOUTS)
+            if unknown:
+                raise ValueError("Unknown git operations: {}".format(
+                    ", ".join(sorted(unknown))))
+            GitBridge.TIMEOUTS.update(timeouts)
+        if retries is not None:
+            GitBridge.RETRIES = retries
+
+    @staticmethod
+    def parse_timeouts(timeouts_str):
+        """Parse timeouts in the form 'probe=30,clone=600'.
+
+        Returns:
+            dict: {operation: seconds}
+        """
+        timeouts = {}
+        for item in timeouts_str.split(","):
+            if not item.strip():
+                continue
+            try:
+                operation, seconds = item.split("=")
+                timeouts[operation.strip()] = float(seconds)
+            except ValueError:
+                raise ValueError(
+                    "Timeout '{}' is not in form 'operation=seconds'".format(
+                        item))
+        return timeouts
+
+    @staticmethod
+    def is_transient(error):
+        """Check if a failed git command is worth retrying."""
+        if isinstance(error, GitTimeoutError):
+            return True
+        output = error.output
+        if isinstance(output, bytes):
+            output = output.decode("utf-8", "replace")
+        return bool(GitBridge.TRANSIENT_ERROR_REGEX.search(output or ""))
+
+    @staticmethod
+    def run_once(argv, timeout, env=None, on_line=None):
+        """Run a command in its own process group and kill it on timeout.
+
+        Args:
+            argv (str[]): The command and its arguments.
+            timeout (float): Seconds before the command is killed.
+            env (dict): Environment of the command, the shared git
+                environment if None.
+            on_line (callable): If given, called with every line of output as
+                soon as it arrives. Lines end with '\\n' or '\\r', the
+                latter is how git redraws its progress.
+
+        Raises:
+            GitTimeoutError: The command did not finish in time.
+            subprocess.CalledProcessError: The command failed.
+
+        Returns:
+            CommandResult: Exit code, stdout and stderr of the command.
+        """
+        if env is None:
+            env = GitBridge.environment()
+        result = Spawner.run(argv, timeout=timeout, env=env, on_line=on_line)
+        if result.timed_out:
+            raise GitTimeoutError(-signal.SIGKILL, argv, result.output,
+                                  result.stderr)
+        if result.returncode:
+            raise subprocess.CalledProcessError(
+                result.returncode, argv, result.output, result.stderr)
+        return result
+
+    @staticmethod
+    def run(argv, operation, env=None, name=None, on_line=None,
+            retries=None):
+        """Run a git command with a timeout and retry transient errors.
+
+        Every failed attempt is reported. The delay between the attempts
+        grows exponentially and is jittered so that parallel workers do not
+        hit a struggling server at the same time.
+
+        Args:
+            argv (str[]): The command and its arguments.
+            operation (str): Kind of operation, a key of TIMEOUTS.
+            env (dict): Environment of the command.
+            name (str): Name of the package to report.
+            on_line (callable): Called with every line of output as soon as
+                it arrives.
+            retries (int): Number of retries, RETRIES if None.
+
+        Raises:
+            subprocess.CalledProcessError: The last attempt failed.
+
+        Returns:
+            CommandResult: Exit code, stdout and stderr of the command.
+        """
+        if retries is None:
+            retries = GitBridge.RETRIES
+        attempts = retries + 1
+        for attempt in range(1, attempts + 1):
+            try:
+                return GitBridge.run_once(
+                    argv, GitBridge.TIMEOUTS[operation], env=env,
+                    on_line=on_line)
+            except subprocess.CalledProcessError as e:
+                if attempt == attempts or not GitBridge.is_transient(e):
+                    raise
+                GitBridge.__wait_to_retry(name, operation, attempt, attempts,
+                                          e)
+
+    @staticmethod
+    def __wait_to_retry(name, operation, attempt, attempts, error):
+        """Report a failed attempt and sleep for a growing, jittered delay."""
+        delay = GitBridge.BACKOFF * 2 ** (attempt - 1)
+        delay *= random.uniform(0.5, 1.5)
+        log.warning(" %s: git %s attempt %s/%s failed: %s "
+                    "Retrying in %.1f s.",
+                    Tools.decorate(str(name)), operation,
+                    attempt, attempts, GitBridge.__short_error(error),
+                    delay)
+        time.sleep(delay)
+
+    @staticmethod
+    def __short_error(error):
+        """Get the last line of the error output."""
+        if isinstance(error, GitTimeoutError):
+            return str(error)
+        output = error.output
+        if isinstance(output, bytes):
+            output = output.decode("utf-8", "replace")
+        lines = (output or "").strip().splitlines()
+        return lines[-1] if lines else str(error)
+
     @staticmethod
     def status(repo_folder):
-        """Get output from `git pull --porcelain --branch` for a repo."""
-        output = subprocess.check_output(GitBridge.STATUS_CMD,
-                                         stderr=subprocess.STDOUT,
-                                         shell=True,
-                                         cwd=repo_folder)
+        """Get output from `git status --porcelain --branch` for a repo."""
+        output = GitBridge.run(
+            GitBridge.git_argv(GitBridge.STATUS_ARGS, repo_folder),
+            'status', name=repo_folder).stdout
         branch = GitBridge.get_branch_name(output)
         # when no changes - output is single line with name of branch
         has_changes = False
@@ -44,75 +388,286 @@ class GitBridge(object):
     @staticmethod
     def pull(repo_folder, branch):
         """Pull the repo's branch and return the output."""
-        git_pull_cmd = GitBridge.PULL_CMD_MASK.format(branch=branch)
-        output = subprocess.check_output(git_pull_cmd,
-                                         stderr=subprocess.STDOUT,
-                                         shell=True,
-                                         cwd=repo_folder)
-        return output
-
-    @staticmethod
-    def clone(name, url, clone_path, branch="master"):
-        """Clone the repo from url into clone_path."""
-        cmd_clone = GitBridge.CLONE_CMD_MASK.format(url=url,
-                                                    path=clone_path,
-                                                    branch=branch)
+        git_pull_cmd = GitBridge.git_argv(GitBridge.PULL_ARGS, repo_folder,
+                                          branch=branch)
+        return GitBridge.run(git_pull_cmd, 'pull', name=repo_folder).output
+
+    @staticmethod
+    def clone(name, url, clone_path, branch="master", on_progress=None,
+              subdir=None, sha=None):
+        """Clone the repo from url into clone_path.
+
+        Args:
+            name (str): Name of the package.
+            url (str): Url to clone from.
+            clone_path (str): Folder to clone into.
+            branch (str): Branch, tag or full commit sha to check out. The
+                default branch of the remote if None.
+            on_progress (callable): If given, git reports its progress and
+                this is called with every progress line as it arrives.
+            subdir (str): If given, the clone is blobless and a cone-mode
+                sparse checkout of only this folder of the repository.
+            sha (str): Commit of the branch found by the probe. The branch
+                is reset to it, so the clone matches what was reported even
+                if the branch moved in between.
+
+        Returns:
+            tuple: (name, tag) where tag shows the result of the clone.
+        """
+        is_commit = GitBridge.is_sha(branch)
+        clone_args = GitBridge.CLONE_ARGS
+        if is_commit or not branch:
+            clone_args = GitBridge.CLONE_COMMIT_ARGS
+        if path.exists(clone_path) and not (path.isdir(clone_path) and
+                                            not os.listdir(clone_path)):
+            return name, GitBridge.EXISTS_TAG
+        # Only a complete clone is renamed into place, so an interrupted one
+        # never looks like a repository.
+        partial_path = GitBridge.partial_path(clone_path)
+        cmd_clone = GitBridge.git_argv(clone_args, url=url,
+                                       path=partial_path, branch=branch)
+        if subdir:
+            cmd_clone.extend(GitBridge.SPARSE_CLONE_FLAGS)
+        if on_progress:
+            cmd_clone.append(GitBridge.PROGRESS_FLAG)
         log.debug(" clone url: %s", cmd_clone)
         try:
-            subprocess.check_output(cmd_clone,
-                                    stderr=subprocess.STDOUT,
-                                    shell=True)
+            GitBridge.__clone_into(cmd_clone, partial_path, name,
+                                   on_progress)
+            if subdir:
+                GitBridge.run(
+                    GitBridge.git_argv(GitBridge.SPARSE_SET_ARGS,
+                                       partial_path, subdir=subdir),
+                    'clone', name=name)
+            if is_commit:
+                for args in [GitBridge.CHECKOUT_ARGS,
+                             GitBridge.SUBMODULE_ARGS]:
+                    GitBridge.run(
+                        GitBridge.git_argv(args, partial_path, sha=branch),
+                        'clone', name=name)
+            if sha and not is_commit:
+                GitBridge.__reset_to(partial_path, sha, name)
+            if not branch:
+                branch, _ = GitBridge.head(partial_path)
+            os.rename(partial_path, clone_path)
             return name, GitBridge.CLONED_TAG.format(branch=branch)
         except subprocess.CalledProcessError as e:
-            out_str = e.output.decode("utf8")
-            if "already exists" in out_str:
+            shutil.rmtree(partial_path, ignore_errors=True)
+            log.critical("Git error: %s", GitBridge.__short_error(e))
+            return name, GitBridge.ERROR_TAG
+        except OSError as e:
+            # Something else filled the folder while we were cloning.
+            shutil.rmtree(partial_path, ignore_errors=True)
+            if path.exists(clone_path):
                 return name, GitBridge.EXISTS_TAG
-            log.critical("Git error: %s", out_str)
+            log.critical("Cannot move clone into place: %s", e)
             return name, GitBridge.ERROR_TAG
 
+    @staticmethod
+    def __reset_to(repo_folder, sha, name):
+        """Reset a fresh clone to the probed commit if it is not there."""
+        _, head_sha = GitBridge.head(repo_folder)
+        if head_sha == sha:
+            return
+        try:
+            for args in [GitBridge.RESET_ARGS, GitBridge.SUBMODULE_ARGS]:
+                GitBridge.run(GitBridge.git_argv(args, repo_folder, sha=sha),
+                              'clone', name=name)
+        except subprocess.CalledProcessError as e:
+            # The branch was rewritten after the probe.
+            log.warning(" %s: cannot check out probed commit %s: %s",
+                        Tools.decorate(name), sha, GitBridge.__short_error(e))
+
+    @staticmethod
+    def __clone_into(cmd_clone, partial_path, name, on_progress):
+        """Run a clone into partial_path and retry transient errors.
+
+        A killed clone leaves a non-empty folder behind, which git refuses
+        to clone into, so the folder is removed before every attempt.
+
+        Raises:
+            subprocess.CalledProcessError: The last attempt failed.
+        """
+        attempts = GitBridge.RETRIES + 1
+        for attempt in range(1, attempts + 1):
+            if path.exists(partial_path):
+                shutil.rmtree(partial_path, ignore_errors=True)
+            try:
+                GitBridge.run(cmd_clone, 'clone', name=name,
+                              on_line=on_progress, retries=0)
+                return
+            except subprocess.CalledProcessError as e:
+                if attempt == attempts or not GitBridge.is_transient(e):
+                    raise
+                GitBridge.__wait_to_retry(name, 'clone', attempt, attempts,
+                                          e)
+
+    @staticmethod
+    def partial_path(clone_path):
+        """Get the hidden folder a clone is written to before it completes."""
+        return path.join(path.dirname(clone_path),
+                         "." + path.basename(clone_path) +
+                         GitBridge.PARTIAL_SUFFIX)
+
+    @staticmethod
+    def maintain(repo_folder, task):
+        """Run a single `git maintenance` task in a repo."""
+        cmd = GitBridge.git_argv(GitBridge.MAINTENANCE_ARGS, repo_folder,
+                                 task=task)
+        return GitBridge.run(cmd, 'maintain', name=repo_folder).output
+
+    @staticmethod
+    def remote_url(repo_folder):
+        """Get the url of the origin of a local repository."""
+        try:
+            output = GitBridge.run(
+                GitBridge.git_argv(GitBridge.REMOTE_URL_ARGS, repo_folder),
+                'status', name=repo_folder).stdout
+        except subprocess.CalledProcessError:
+            return None
+        return output.decode("utf-8").strip() or None
+
+    @staticmethod
+    def head(repo_folder):
+        """Get the checked out branch and commit of a local repository."""
+        output = GitBridge.run(
+            GitBridge.git_argv(GitBridge.HEAD_ARGS, repo_folder),
+            'status', name=repo_folder).stdout
+        sha, branch = output.decode("utf-8").split()
+        if branch == "HEAD":
+            branch = None
+        return branch, sha
+
+    @staticmethod
+    def fetched_sha(repo_folder):
+        """Get the commit of the remote branch fetched by the last pull."""
+        output = GitBridge.run(
+            GitBridge.git_argv(GitBridge.FETCH_HEAD_ARGS, repo_folder),
+            'status', name=repo_folder).stdout
+        return output.decode("utf-8").strip()
+
+    @staticmethod
+    def bundle(repo_folder, bundle_path):
+        """Write a repository into a bundle that can be cloned from."""
+        GitBridge.run(
+            GitBridge.git_argv(GitBridge.BUNDLE_ARGS, repo_folder,
+                               bundle_path=bundle_path),
+            'maintain', name=repo_folder)
+
+    @staticmethod
+    def set_remote_url(repo_folder, url):
+        """Point the origin of a local repository to another url."""
+        GitBridge.run(
+            GitBridge.git_argv(GitBridge.SET_URL_ARGS, repo_folder, url=url),
+            'status', name=repo_folder)
+
+    @staticmethod
+    def is_sha(version):
+        """Check if a version is a full commit sha, not a branch or tag."""
+        return bool(version and GitBridge.SHA_REGEX.match(version))
+
     @staticmethod
     def repository_exists(dependency):
-        """Check if repository exists.
+        """Check if repository exists and has the branch of the dependency.
 
-        Uses `git ls-remote` to check if the repository exists.
+        Uses `git ls-remote` to ask only for the branch or tag that will be
+        cloned, so a missing branch is found without starting a clone and
+        the server does not send all its refs. The sha of the branch is
+        stored in the dependency.
 
         Args:
-            url (str): Url to check.
+            dependency (Dependency): Dependency to check.
 
         Returns:
-            bool: True if exists, False otherwise
+            tuple: (dependency, True if exists, False otherwise)
         """
-        from os import environ
         urls = []
         if dependency.url:
             urls.append(dependency.url)
         else:
             urls.extend(dependency.default_urls)
         log.debug(" Checking urls: %s", urls)
-        # Disable git interactive promts. Just fail silently.
-        new_env = environ
-        new_env["GIT_TERMINAL_PROMPT"] = "0"
+        branch = dependency.branch or GitBridge.DEFAULT_BRANCH
+        dependency.probe_error = False
         # Check all urls.
         for url in urls:
-            git_cmd = GitBridge.CHECK_CMD_MASK.format(url=url)
+            log.debug(" Searching for package '%s' under url '%s'",
+                      dependency.name, url)
             try:
-                log.debug(" Searching for package '%s' under url '%s'",
-                          dependency.name, url)
-                subprocess.check_call(git_cmd,
-                                      stdout=subprocess.PIPE,
-                                      stderr=subprocess.PIPE,
-                                      shell=True,
-                                      env=new_env)
-                # Update the working url if needed.
-                dependency.url = url
-                return dependency, True
+                sha = GitBridge.find_ref(url, branch, name=dependency.name)
             except subprocess.CalledProcessError as e:
                 log.debug(
                     'Package "%s" was not found under: "%s" with error: %s',
                     dependency.name, url, e)
+                if GitBridge.is_transient(e):
+                    dependency.probe_error = True
+                continue
+            if not sha:
+                log.warning(" %s: Branch '%s' not found in '%s'.",
+                            Tools.decorate(dependency.name), branch, url)
+                continue
+            # Update the working url if needed.
+            dependency.url = url
+            dependency.sha = sha
+            return dependency, True
         # If we reached here we failed to find the dependency.
         return dependency, False
 
+    @staticmethod
+    def probe_cmds(url, branch):
+        """Get the commands that look for a branch, then for a tag."""
+        cmds = []
+        for kind, masks in GitBridge.PROBE_REFS:
+            cmd = GitBridge.git_argv(GitBridge.CHECK_ARGS, kind=kind, url=url)
+            cmds.append(cmd + [mask.format(branch=branch) for mask in masks])
+        return cmds
+
+    @staticmethod
+    def find_ref(url, branch, env=None, name=None):
+        """Find the sha of a branch or tag in a remote repository.
+
+        Tags are only asked for if there is no branch with this name, which
+        is rare, so most probes need a single round trip.
+
+        Raises:
+            subprocess.CalledProcessError: The repository does not exist.
+
+        Returns:
+            str: The sha or None if there is no such branch or tag.
+        """
+        for git_cmd in GitBridge.probe_cmds(url, branch):
+            output = GitBridge.run(git_cmd, 'probe', env=env, name=name)
+            sha = GitBridge.parse_ls_remote(output.stdout, branch)
+            if sha:
+                return sha
+        return None
+
+    @staticmethod
+    def parse_ls_remote(output, branch):
+        """Find the sha of a branch or tag in the output of `git ls-remote`.
+
+        Branches win over tags with the same name. Annotated tags are
+        resolved to the commit they point to.
+
+        Args:
+            output (bytes): Output of `git ls-remote`.
+            branch (str): Name of the branch or tag.
+
+        Returns:
+            str: The sha or None if there is no such branch or tag.
+        """
+        try:
+            output = output.decode("utf-8", "replace")
+        except AttributeError:
+            pass
+        refs = {match.group('ref'): match.group('sha')
+                for match in GitBridge.LS_REMOTE_REGEX.finditer(output)}
+        for ref in ["refs/heads/{}", "refs/tags/{}^{{}}", "refs/tags/{}"]:
+            ref = ref.format(branch)
+            if ref in refs:
+                return refs[ref]
+        return None
+
     @staticmethod
     def get_branch_name(git_status_output):
         """Parse branch name from the output of git status."""
@@ -135,6 +690,142 @@ class Tools(object):
     """
 
     PACKAGE_TAG = '{package}'
+    CACHE_DIR_ENV = 'CATKIN_DEPS_CACHE_DIR'
+
+    @staticmethod
+    def cache_dir():
+        """Get the folder where this tool keeps its persistent caches.
+
+        The folder can be overridden with `CATKIN_DEPS_CACHE_DIR` and
+        otherwise follows the XDG convention.
+
+        Returns:
+            str: Path to the cache folder. It is not guaranteed to exist.
+        """
+        if os.environ.get(Tools.CACHE_DIR_ENV):
+            return os.environ[Tools.CACHE_DIR_ENV]
+        xdg_cache = os.environ.get('XDG_CACHE_HOME',
+                                   path.join(path.expanduser('~'), '.cache'))
+        return path.join(xdg_cache, 'catkin_tools_fetch')
+
+    @staticmethod
+    def folder_size(folder):
+        """Get the total size of all files in a folder in bytes."""
+        total = 0
+        for current_folder, _, files in os.walk(folder):
+            for file_name in files:
+                try:
+                    total += path.getsize(path.join(current_folder, file_name))
+                except OSError:
+                    continue
+        return total
+
+    @staticmethod
+    def repo_root(folder, ws_path):
+        """Find the root of the repository that holds a package folder.
+
+        Returns:
+            str: Folder with a `.git` in it or None if there is none below
+                the workspace path.
+        """
+        ws_path = path.abspath(ws_path)
+        folder = path.abspath(folder)
+        while folder == ws_path or folder.startswith(ws_path + os.sep):
+            if path.exists(path.join(folder, '.git')):
+                return folder
+            parent = path.dirname(folder)
+            if parent == folder:
+                break
+            folder = parent
+        return None
+
+    @staticmethod
+    def find_repos(ws_path, packages, selected_packages=None):
+        """Map the repositories of a workspace to the names of their packages.
+
+        Args:
+            ws_path (str): Workspace source path.
+            packages (dict): {package folder: package} in the workspace.
+            selected_packages (str[]): Names picked by the user, all if empty.
+
+        Returns:
+            dict: {repo root: sorted package names}
+        """
+        repos = {}
+        for ws_folder, package in packages.items():
+            if selected_packages and package.name not in selected_packages:
+                continue
+            root = Tools.repo_root(path.join(ws_path, ws_folder), ws_path)
+            if not root:
+                log.debug(" Package [%s] is not in a git repo.", package.name)
+                continue
+            repos.setdefault(root, []).append(package.name)
+        return {root: sorted(names) for root, names in repos.items()}
+
+    @staticmethod
+    def load_json(file_path, default=None):
+        """Load a json object returning a default value if it is unusable.
+
+        All our files hold a json object at the top, so anything else, e.g.
+        a list or a number written by hand, is unusable too.
+
+        Args:
+            file_path (str): Path to the json file.
+            default (object): Value returned if the file cannot be read.
+
+        Returns:
+            dict: Parsed contents of the file or the default value.
+        """
+        try:
+            with open(file_path) as json_file:
+                data = json.load(json_file)
+        except (IOError, OSError, ValueError) as e:
+            log.debug(" Cannot read '%s': %s", file_path, e)
+            return default
+        if not isinstance(data, dict):
+            log.debug(" No json object in '%s'.", file_path)
+            return default
+        return data
+
+    @staticmethod
+    def save_json(file_path, data):
+        """Atomically write data to a json file.
+
+        Args:
+            file_path (str): Path to the json file.
+            data (object): Json-serializable data.
+
+        Returns:
+            bool: True if written, False otherwise.
+        """
+        return Tools.save_text(file_path, json.dumps(data, sort_keys=True))
+
+    @staticmethod
+    def save_text(file_path, text):
+        """Atomically write text to a file.
+
+        The text is written to a temporary file that is then renamed, so a
+        reader never sees a half-written file.
+
+        Args:
+            file_path (str): Path to the file.
+            text (str): Contents of the file.
+
+        Returns:
+            bool: True if written, False otherwise.
+        """
+        tmp_path = "{}.{}.tmp".format(file_path, os.getpid())
+        try:
+            folder = path.dirname(file_path)
+            if folder and not path.isdir(folder):
+                os.makedirs(folder)
+            with open(tmp_path, 'w') as text_file:
+                text_file.write(text)
+            os.rename(tmp_path, file_path)
+            return True
+        except (IOError, OSError) as e:
+            log.warning(" Cannot write '%s': %s", file_path, e)
+            return False
 
     @staticmethod
     def prepare_default_urls(default_urls):
@@ -205,18 +896,11 @@ class Tools(object):
         """
         log.info(" Avoid fetching ROS packages.")
         log.info(" [ROS]: Searching all packages.")
-        get_ros_packages_command = 'rospack list'
+        get_ros_packages_command = ['rospack', 'list']
         pkg_list = []
-        try:
-            output = subprocess.check_output(
-                get_ros_packages_command,
-                stderr=subprocess.STDOUT,
-                shell=True)
-            try:
-                str_output = output.decode("utf-8")
-            except AttributeError:
-                str_output = output
-            output = str_output.splitlines()
+        result = Spawner.run(get_ros_packages_command)
+        if result.ok:
+            output = result.stdout.decode("utf-8").splitlines()
             for pkg_line in output:
                 pkg_line_list = pkg_line.split(' ')
                 pkg_name = pkg_line_list[0]
@@ -225,9 +909,8 @@ class Tools(object):
                     pkg_list.append(pkg_name)
             log.info(" [ROS]: Ignoring %s packages.", len(pkg_list))
             return set(pkg_list)
-        except subprocess.CalledProcessError:
-            log.info(" [ROS]: Not found. Ignoring pre-defined ROS packages.")
-            return set(Tools.default_ros_packages)
+        log.info(" [ROS]: Not found. Ignoring pre-defined ROS packages.")
+        return set(Tools.default_ros_packages)
 
     @staticmethod
     def decorate(pkg_name, max_width=25):
@@ -235,6 +918,21 @@ class Tools(object):
         decorated = "[" + pkg_name + "]"
         return decorated.ljust(max_width)
 
+    @staticmethod
+    def normalize_subdir(subdir):
+        """Normalize a folder inside a repository, e.g. `a//b/` to `a/b`.
+
+        Returns:
+            str: The folder or None if it points outside of the repository.
+        """
+        subdir = subdir.strip().replace("\\", "/")
+        if not subdir or subdir.startswith("/"):
+            return None
+        parts = [part for part in subdir.split("/") if part not in ["", "."]]
+        if not parts or ".." in parts:
+            return None
+        return "/".join(parts)
+
     @staticmethod
     def update_deps_dict(base_dict, new_dict):
         """We don't want to overwrite any value, but check for conflicts."""
@@ -256,6 +954,13 @@ class Tools(object):
                         " Dependency '%s': conflicting urls: '%s' vs '%s'",
                         dep_name, dep.url, old_dep.url)
                     return None
+                if not old_dep.subdir:
+                    old_dep.subdir = dep.subdir
+                if dep.subdir and dep.subdir != old_dep.subdir:
+                    log.critical(
+                        " Dependency '%s': conflicting subdirs: '%s' vs '%s'",
+                        dep_name, dep.subdir, old_dep.subdir)
+                    return None
             else:
                 base_dict[dep_name] = dep
         return base_dict
@@ -3,6 +3,7 @@
 Attributes:
     log (TYPE): Description
 """
+import time
 import logging
 import subprocess
 from os import path
@@ -11,7 +12,9 @@ from concurrent import futures
 
 from catkin_tools_fetch.lib.tools import Tools
 from catkin_tools_fetch.lib.tools import GitBridge
+from catkin_tools_fetch.lib.history import RunHistory
 from catkin_tools_fetch.lib.printer import Printer
+from catkin_tools_fetch.lib.session import Session
 
 log = logging.getLogger('deps')
 
@@ -23,6 +26,7 @@ class Updater(object):
     UP_TO_DATE_TAG = "[UP TO DATE]"
     OK_TAGS = [PULLED_TAG, UP_TO_DATE_TAG]
 
+    FRESH_TAG = "[FRESH]"
     CHANGES_TAG = "[UNCOMMITTED CHANGES]"
     RUNNING_TAG = "[RUNNING]"
     NO_TRACK_TAG = "[NO BRANCH]"
@@ -37,20 +41,42 @@ class Updater(object):
                  packages,
                  use_preprint=True,
                  colored=True,
-                 num_threads=4):
+                 num_threads=None,
+                 history=None,
+                 backend=GitBridge,
+                 session=None,
+                 sync_state=None,
+                 max_age=None):
         """Initialize the updater.
 
         Args:
             ws_path (str): Path to the workspace
             packages (dict(str)): Dictionary of packages to be downloaded
+            num_threads (int): Maximum number of parallel pulls. The limit
+                adapts up to a default if None.
+            history (RunHistory): Records the duration and outcome of every
+                pull.
+            backend (GitBackend): Pulls repositories, git command line by
+                default.
+            session (Session): Lends its worker pool, pull limiter and
+                printer. A session of its own is used for every update and
+                closed afterwards if None.
+            sync_state (SyncState): Records every successful pull.
+            max_age (float): Skip the packages that sync_state saw pulled
+                less than this many seconds ago. Never skip if None.
         """
         super(Updater, self).__init__()
         self.ws_path = ws_path
         self.packages = packages
-        self.thread_pool = futures.ThreadPoolExecutor(max_workers=num_threads)
-        self.printer = Printer()
+        self.session = session
+        self.num_threads = num_threads
+        self.printer = session.printer if session else Printer()
         self.colored = colored
         self.use_preprint = use_preprint
+        self.history = history
+        self.backend = backend
+        self.sync_state = sync_state
+        self.max_age = max_age
 
     def filter_packages(self, selected_packages):
         """Filter the packages based on user input.
@@ -71,15 +97,49 @@ class Updater(object):
 
     def pick_tag(self, folder, package):
         """Pick result tag for a folder."""
+        started = time.time()
+        package, tag = self.__pick_tag(folder, package)
+        if self.history:
+            outcome = RunHistory.ERROR
+            if tag in Updater.OK_TAGS:
+                outcome = RunHistory.OK
+            elif tag == Updater.CHANGES_TAG:
+                outcome = RunHistory.SKIPPED
+            self.history.record(package.name, 'pull', time.time() - started,
+                                outcome, url=self.backend.remote_url(folder))
+        if self.sync_state and tag in Updater.OK_TAGS:
+            self.sync_state.record(path.relpath(folder, self.ws_path),
+                                   self.__fetched_sha(folder))
+        return package, tag
+
+    def __fetched_sha(self, folder):
+        """Get the remote commit a pull brought in, None on error.
+
+        Local commits that are not pushed yet do not count as synced.
+        """
+        try:
+            return self.backend.fetched_sha(folder)
+        except subprocess.CalledProcessError as e:
+            log.debug(" git rev-parse returned error: %s", e)
+            return None
+
+    def is_fresh(self, ws_folder):
+        """Check if a package was pulled within the freshness window."""
+        if not self.sync_state or self.max_age is None:
+            return False
+        return self.sync_state.is_fresh(ws_folder, self.max_age)
+
+    def __pick_tag(self, folder, package):
+        """Run git in a folder and pick the result tag."""
         if self.use_preprint:
             msg = " {}: {}".format(Tools.decorate(
                 package.name), Updater.RUNNING_TAG)
             self.printer.add_msg(package.name, msg)
-        output, branch, has_changes = GitBridge.status(folder)
+        output, branch, has_changes = self.backend.status(folder)
         if has_changes:
             return package, Updater.CHANGES_TAG
         try:
-            output = GitBridge.pull(folder, branch)
+            output = self.backend.pull(folder, branch)
             return package, Updater.tag_from_output(output)
         except subprocess.CalledProcessError as e:
             log.debug(" git pull returned error: %s", e)
@@ -88,6 +148,9 @@ class Updater(object):
     def update_packages(self, selected_packages):
         """Update all the folders to match the remote. Considers the branch.
 
+        Packages pulled within the freshness window are shown as fresh and
+        skipped, unless the user picked them by name.
+
         Args:
             selected_packages (str[]): List of packages picked by the user.
 
@@ -97,23 +160,44 @@ class Updater(object):
         log.info(" Pulling packages:")
         packages = self.filter_packages(selected_packages)
         status_msgs = []
-        futures_list = []
+        to_pull = []
         for ws_folder, package in packages.items():
             picked_tag = None
-            folder = path.join(self.ws_path, ws_folder)
-            futures_list.append(
-                self.thread_pool.submit(self.pick_tag, folder, package))
-        for future in futures.as_completed(futures_list):
-            package, picked_tag = future.result()
-            # change logger for warning if something is wrong
-            if self.colored:
-                picked_tag = Updater.colorize_tag(picked_tag)
-            # now show the results to the user
-            status_msgs.append((package.name, picked_tag))
-            msg = " {}: {}".format(Tools.decorate(package.name), picked_tag)
-            self.printer.purge_msg(package.name, msg)
+            if package.name not in selected_packages and \
+                    self.is_fresh(ws_folder):
+                picked_tag = Updater.FRESH_TAG
+                if self.colored:
+                    picked_tag = Updater.colorize_tag(picked_tag)
+                status_msgs.append((package.name, picked_tag))
+                msg = " {}: {}".format(Tools.decorate(package.name),
+                                       picked_tag)
+                self.printer.purge_msg(package.name, msg)
+                continue
+            to_pull.append((path.join(self.ws_path, ws_folder), package))
+        with Session.borrow(self.session, self.num_threads) as session:
+            futures_list = [
+                session.thread_pool.submit(
+                    session.limiters['pull'].call, Updater.__pull_failed,
+                    self.pick_tag, folder, package)
+                for folder, package in to_pull]
+            for future in futures.as_completed(futures_list):
+                package, picked_tag = future.result()
+                # change logger for warning if something is wrong
+                if self.colored:
+                    picked_tag = Updater.colorize_tag(picked_tag)
+                # now show the results to the user
+                status_msgs.append((package.name, picked_tag))
+                msg = " {}: {}".format(Tools.decorate(package.name),
+                                       picked_tag)
+                self.printer.purge_msg(package.name, msg)
         return status_msgs
 
+    @staticmethod
+    def __pull_failed(result):
+        """Tell the pull limiter if a pull failed."""
+        _, tag = result
+        return tag == Updater.ERROR_TAG
+
     @staticmethod
     def tag_from_output(output):
         """Get tag from output."""
@@ -130,7 +214,7 @@ class Updater(object):
     @staticmethod
     def colorize_tag(picked_tag):
         """Colorize the tag."""
-        if picked_tag in Updater.OK_TAGS:
+        if picked_tag in Updater.OK_TAGS + [Updater.FRESH_TAG]:
             return colored(picked_tag, 'green')
 
         if picked_tag == Updater.CHANGES_TAG:
@@ -0,0 +1,155 @@
+"""Learns which default urls are likely to host a package.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import logging
+from os import path
+from threading import Lock
+
+from catkin_tools_fetch.lib.tools import Tools
+
+log = logging.getLogger('deps')
+
+
+class UrlRanker(object):
+    """Order default url templates by how likely they are to hit.
+
+    For every url template we keep the number of probe hits and misses. The
+    same statistics are kept per package-name prefix, e.g. `velodyne` for
+    `velodyne_driver`, as packages of one family tend to live on one host.
+
+    Attributes:
+        FILE_NAME (str): Name of the file that stores the statistics.
+        PRIOR_WEIGHT (float): How many observations the template-wide hit
+            rate is worth when estimating the hit rate for a prefix.
+        stats_path (str): Path to the file with statistics.
+        priorities (dict): {template: priority}. Higher goes first,
+            regardless of the statistics.
+    """
+
+    FILE_NAME = 'url_stats.json'
+    PRIOR_WEIGHT = 2.0
+
+    def __init__(self, stats_path=None, priorities=None):
+        """Initialize the ranker and read existing statistics.
+
+        Args:
+            stats_path (str): Path to the statistics file. If None, the
+                statistics are kept only in memory.
+            priorities (dict): {template: priority} explicit overrides.
+        """
+        super(UrlRanker, self).__init__()
+        self.stats_path = stats_path
+        self.priorities = priorities if priorities else {}
+        self.__lock = Lock()
+        stats = {}
+        if stats_path:
+            stats = Tools.load_json(stats_path, default={})
+        self.__templates = stats.get('templates', {})
+        self.__prefixes = stats.get('prefixes', {})
+
+    @staticmethod
+    def default_stats_path():
+        """Get the default location of the statistics file."""
+        return path.join(Tools.cache_dir(), UrlRanker.FILE_NAME)
+
+    @staticmethod
+    def priorities_from_urls(preferred_urls):
+        """Generate priorities from an ordered list of url templates.
+
+        Args:
+            preferred_urls (str[]): Templates, the most preferred first.
+
+        Returns:
+            dict: {template: priority}
+        """
+        total = len(preferred_urls)
+        return {url: total - i for i, url in enumerate(preferred_urls)}
+
+    @staticmethod
+    def prefix(pkg_name):
+        """Get the family prefix of a package name."""
+        return pkg_name.split('_')[0]
+
+    def hit_rate(self, template, pkg_name):
+        """Estimate the probability that the template hosts the package.
+
+        Args:
+            template (str): Url template with a {package} tag.
+            pkg_name (str): Name of the package.
+
+        Returns:
+            float: Estimated hit probability.
+        """
+        hits, misses = self.__templates.get(template, (0, 0))
+        template_rate = (hits + 1.0) / (hits + misses + 2.0)
+        prefix_stats = self.__prefixes.get(UrlRanker.prefix(pkg_name), {})
+        hits, misses = prefix_stats.get(template, (0, 0))
+        return (hits + UrlRanker.PRIOR_WEIGHT * template_rate) / (
+            hits + misses + UrlRanker.PRIOR_WEIGHT)
+
+    def rank(self, templates, pkg_name):
+        """Sort templates, the most likely to hit first.
+
+        Explicit priorities go first, then the estimated hit rate. Ties are
+        broken by the template string to keep the order deterministic.
+
+        Args:
+            templates (iterable): Url templates with a {package} tag.
+            pkg_name (str): Name of the package.
+
+        Returns:
+            str[]: Sorted templates.
+        """
+        with self.__lock:
+            return sorted(templates, key=lambda template: (
+                -self.priorities.get(template, 0),
+                -self.hit_rate(template, pkg_name),
+                template))
+
+    def sort_dependency_urls(self, dependency):
+        """Reorder default urls of a dependency in place."""
+        if not dependency.url_templates:
+            return
+        ranked = self.rank(dependency.url_templates.keys(), dependency.name)
+        dependency.default_urls = [
+            dependency.url_templates[template] for template in ranked]
+
+    def record(self, dependency, found):
+        """Record the outcome of probing the dependency's default urls.
+
+        All urls before the one that was found count as misses. If nothing
+        was found all the urls count as misses.
+
+        Args:
+            dependency (Dependency): A probed dependency.
+            found (bool): Result of the probe.
+        """
+        if not dependency.url_templates:
+            return
+        url_to_template = {
+            url: template
+            for template, url in dependency.url_templates.items()}
+        prefix = UrlRanker.prefix(dependency.name)
+        with self.__lock:
+            prefix_stats = self.__prefixes.setdefault(prefix, {})
+            for url in dependency.default_urls:
+                template = url_to_template.get(url)
+                if template is None:
+                    continue
+                hit = found and url == dependency.url
+                for stats in [self.__templates, prefix_stats]:
+                    counts = stats.setdefault(template, [0, 0])
+                    counts[0 if hit else 1] += 1
+                if hit:
+                    break
+
+    def save(self):
+        """Write the statistics to disk."""
+        if not self.stats_path:
+            return False
+        with self.__lock:
+            data = {'templates': self.__templates,
+                    'prefixes': self.__prefixes}
+            return Tools.save_json(self.stats_path, data)
@@ -0,0 +1,227 @@
+"""Watches the workspace manifests and prefetches new dependencies.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import os
+import time
+import logging
+from os import path
+from concurrent import futures
+
+from catkin_tools_fetch.lib.dependency_parser import Parser
+from catkin_tools_fetch.lib.downloader import Downloader
+from catkin_tools_fetch.lib.session import Session
+from catkin_tools_fetch.lib.tools import Tools
+
+log = logging.getLogger('deps')
+
+
+class Watcher(object):
+    """Keeps resolving the dependencies of a workspace in the background.
+
+    The watcher polls the modification times of all `package.xml` files in
+    the workspace. Only new or changed manifests are parsed again and their
+    new dependencies are cloned in the background, one round at a time. A
+    freshly cloned dependency brings its own manifest, which is picked up by
+    the next poll, so the whole dependency closure is fetched eventually.
+
+    Attributes:
+        IGNORE_MARKERS (str[]): Files that exclude a folder from the search.
+        ws_path (str): Workspace path. This is where packages live.
+        default_urls (set(str)): Url templates to search packages in.
+        ignore_pkgs (set): Packages to ignore (mostly ROS ones).
+        system_pkgs (set): System dependencies installed by rosdep.
+        tags (list): Dependency tags to follow.
+        session (Session): Shared by all downloads while watching.
+    """
+
+    IGNORE_MARKERS = ['CATKIN_IGNORE', 'COLCON_IGNORE']
+
+    def __init__(self,
+                 ws_path,
+                 default_urls,
+                 ignore_pkgs,
+                 use_preprint=False,
+                 num_threads=None,
+                 url_ranker=None,
+                 system_pkgs=None,
+                 tags=None):
+        """Initialize the watcher.
+
+        Args:
+            ws_path (str): Workspace path. This is where packages live.
+            default_urls (set(str)): Url templates to search packages in.
+            ignore_pkgs (iterable): Packages to ignore (e.g. ROS ones).
+            use_preprint (bool): Show status messages while cloning.
+            num_threads (int): Maximum number of parallel git operations.
+            url_ranker (UrlRanker): Orders default urls before probing them.
+            system_pkgs (iterable): System dependencies, never probed.
+            tags (list): Dependency tags to follow, Parser.TAGS if None.
+        """
+        super(Watcher, self).__init__()
+        if not path.exists(ws_path):
+            raise ValueError("Folder '{}' is missing.".format(ws_path))
+        self.ws_path = ws_path
+        self.default_urls = set(default_urls)
+        self.ignore_pkgs = ignore_pkgs
+        self.use_preprint = use_preprint
+        self.url_ranker = url_ranker
+        self.system_pkgs = system_pkgs
+        self.tags = tags
+        # Downloads share the pool and keep what the limiters learn.
+        self.session = Session(num_threads)
+        self.__mtimes = {}
+        self.__pkg_names = {}
+        # A single worker makes sure that download rounds never overlap.
+        self.__resolver = futures.ThreadPoolExecutor(max_workers=1)
+        self.__pending = []
+
+    def find_manifests(self):
+        """Find all `package.xml` files in the workspace.
+
+        Returns:
+            dict: {path_to_xml: mtime}
+        """
+        manifests = {}
+        for folder, subfolders, files in os.walk(self.ws_path):
+            subfolders[:] = [sub for sub in subfolders
+                             if not sub.startswith('.')]
+            if any(marker in files for marker in Watcher.IGNORE_MARKERS):
+                subfolders[:] = []
+                continue
+            if Parser.XML_FILE_NAME not in files:
+                continue
+            path_to_xml = path.join(folder, Parser.XML_FILE_NAME)
+            try:
+                manifests[path_to_xml] = os.stat(path_to_xml).st_mtime
+            except OSError:
+                # The file was removed while we were looking at it.
+                continue
+            # Packages cannot be nested, no need to look deeper.
+            subfolders[:] = []
+        return manifests
+
+    def changed_manifests(self):
+        """Get the manifests that are new or changed since the last call.
+
+        Returns:
+            str[]: Sorted paths to changed `package.xml` files.
+        """
+        manifests = self.find_manifests()
+        changed = [path_to_xml for path_to_xml, mtime in manifests.items()
+                   if self.__mtimes.get(path_to_xml) != mtime]
+        for removed in set(self.__mtimes) - set(manifests):
+            self.__pkg_names.pop(removed, None)
+        self.__mtimes = manifests
+        return sorted(changed)
+
+    def poll_once(self):
+        """Parse changed manifests and start fetching new dependencies.
+
+        Returns:
+            Future: A future to the started download or None if there is
+                nothing new to download.
+        """
+        changed = self.changed_manifests()
+        if not changed:
+            return None
+        to_parse = []
+        for path_to_xml in changed:
+            pkg_name = Parser.get_package_name(path_to_xml)
+            if not pkg_name:
+                continue
+            self.__pkg_names[path_to_xml] = pkg_name
+            to_parse.append((pkg_name, path.dirname(path_to_xml)))
+        deps_to_fetch = {}
+        for pkg_name, deps in Parser.parse_packages(to_parse,
+                                                    self.default_urls,
+                                                    tags=self.tags,
+                                                    session=self.session):
+            if not deps:
+                continue
+            merged = Tools.update_deps_dict(deps_to_fetch, deps)
+            if merged is None:
+                log.error(" Skipping conflicting dependencies of [%s].",
+                          pkg_name)
+                continue
+            deps_to_fetch = merged
+        available_pkgs = set(self.__pkg_names.values())
+        new_deps = {name: dep for name, dep in deps_to_fetch.items()
+                    if name not in available_pkgs and
+                    name not in self.ignore_pkgs}
+        if not new_deps:
+            return None
+        log.info(" Prefetching %s new dependencies in background.",
+                 len(new_deps))
+        future = self.__resolver.submit(
+            self.__download, new_deps, available_pkgs)
+        self.__pending.append(future)
+        return future
+
+    def __download(self, deps_to_fetch, available_pkgs):
+        """Download dependencies. Runs on the resolver thread."""
+        downloader = Downloader(ws_path=self.ws_path,
+                                available_pkgs=available_pkgs,
+                                ignore_pkgs=self.ignore_pkgs,
+                                use_preprint=self.use_preprint,
+                                url_ranker=self.url_ranker,
+                                session=self.session,
+                                system_pkgs=self.system_pkgs)
+        error_code = downloader.download_dependencies(deps_to_fetch)
+        if self.url_ranker:
+            self.url_ranker.save()
+        return error_code
+
+    def wait(self):
+        """Wait for all started downloads to finish.
+
+        Returns:
+            int: Return code. 0 if all fine, 1 if any download failed.
+        """
+        error_code = Downloader.NO_ERROR
+        for future in self.__pending:
+            try:
+                if future.result() != Downloader.NO_ERROR:
+                    error_code = 1
+            except Exception as e:
+                log.error(" Background download failed: %s", e)
+                error_code = 1
+        self.__pending = []
+        return error_code
+
+    def run(self, poll_interval=1.0, max_polls=None):
+        """Watch the workspace until interrupted.
+
+        A poll that fails, e.g. on a broken manifest, is logged and the
+        watcher keeps polling.
+
+        Args:
+            poll_interval (float): Seconds between two polls.
+            max_polls (int): Stop after this many polls. Run forever if None.
+
+        Returns:
+            int: Return code. 0 if all fine, 1 if any poll or download
+                failed.
+        """
+        log.info(" Watching '%s' for changes in %s files. Stop with Ctrl-C.",
+                 self.ws_path, Parser.XML_FILE_NAME)
+        polls = 0
+        poll_failed = False
+        try:
+            while max_polls is None or polls < max_polls:
+                try:
+                    self.poll_once()
+                except Exception as e:
+                    log.error(" Poll failed, keep watching: %s", e)
+                    poll_failed = True
+                polls += 1
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            log.info(" Stop watching. Waiting for running downloads.")
+        error_code = self.wait()
+        if poll_failed:
+            error_code = 1
+        self.__resolver.shutdown(wait=True)
+        self.session.close()
+        return error_code
@@ -0,0 +1,304 @@
+"""Packs the repositories of a workspace into archives and unpacks them.
+
+Attributes:
+    log (logging.Log): logger
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tarfile
+import tempfile
+import subprocess
+from os import path
+
+from catkin_tools_fetch.lib.dependency_parser import Dependency
+from catkin_tools_fetch.lib.tools import GitBridge
+from catkin_tools_fetch.lib.tools import Tools
+
+log = logging.getLogger('deps')
+
+
+class WorkspaceCache(object):
+    """A folder of compressed repository checkouts, e.g. kept between CI jobs.
+
+    Every repository is packed on its own into an archive named by its url
+    and commit, so a repository that did not change is never packed twice
+    and all of them unpack in parallel. A manifest named by the key of the
+    whole graph, the url, branch and commit of every repository, lists the
+    archives that make up a workspace.
+
+    Attributes:
+        ARCHIVES_DIR (str): Subfolder with the archives of repositories.
+        ARCHIVE_EXTENSION (str): Extension of an archive.
+        MANIFEST_EXTENSION (str): Extension of a manifest.
+        COMPRESS_LEVEL (int): Gzip level, low as unpacking is what counts.
+        cache_dir (str): Folder of the cache.
+    """
+
+    FOLDER_NAME = 'workspaces'
+    ARCHIVES_DIR = 'repos'
+    ARCHIVE_EXTENSION = '.tar.gz'
+    MANIFEST_EXTENSION = '.json'
+    COMPRESS_LEVEL = 3
+
+    def __init__(self, cache_dir):
+        """Initialize the cache in a folder."""
+        super(WorkspaceCache, self).__init__()
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def default_cache_dir():
+        """Get the default location of the cache."""
+        return path.join(Tools.cache_dir(), WorkspaceCache.FOLDER_NAME)
+
+    @staticmethod
+    def make_key(graph):
+        """Get the key of a graph {path: {'url', 'branch', 'sha'}}."""
+        text = json.dumps(
+            {repo_path: [repo['url'], repo['branch'], repo['sha']]
+             for repo_path, repo in graph.items()}, sort_keys=True)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def archive_name(url, sha):
+        """Get the file name of the archive of a commit of a repository."""
+        return hashlib.sha1("{}@{}".format(url, sha).encode(
+            "utf-8")).hexdigest() + WorkspaceCache.ARCHIVE_EXTENSION
+
+    @staticmethod
+    def read_graph(ws_path, repo_roots, backend=GitBridge, session=None):
+        """Read the url, branch and commit of repositories.
+
+        Repositories without an origin or with uncommitted changes cannot be
+        restored from their url and commit and are skipped.
+
+        Args:
+            ws_path (str): Workspace source path.
+            repo_roots (iterable): Paths to the repositories.
+            backend (GitBackend): Reads the repositories.
+            session (Session): Lends its workers, one by one if None.
+
+        Returns:
+            dict: {relative path: {'url', 'branch', 'sha'}}
+        """
+        def read_repo(repo_root):
+            repo_path = path.relpath(repo_root, ws_path)
+            url = backend.remote_url(repo_root)
+            if not url:
+                log.warning(" Skip repository '%s' with no origin.",
+                            repo_path)
+                return repo_path, None
+            try:
+                _, _, has_changes = backend.status(repo_root)
+                branch, sha = backend.head(repo_root)
+            except subprocess.CalledProcessError as e:
+                log.warning(" Skip repository '%s': %s", repo_path, e)
+                return repo_path, None
+            if has_changes:
+                log.warning(" Skip repository '%s' with uncommitted "
+                            "changes.", repo_path)
+                return repo_path, None
+            return repo_path, {'url': url, 'branch': branch, 'sha': sha}
+
+        roots = sorted(repo_roots)
+        if session:
+            results = session.thread_pool.map(read_repo, roots)
+        else:
+            results = [read_repo(repo_root) for repo_root in roots]
+        return {repo_path: repo for repo_path, repo in results if repo}
+
+    def manifest_path(self, key):
+        """Get the path to the manifest of a graph."""
+        return path.join(self.cache_dir,
+                         key + WorkspaceCache.MANIFEST_EXTENSION)
+
+    def archive_path(self, archive_name):
+        """Get the path to the archive of a repository."""
+        return path.join(self.cache_dir, WorkspaceCache.ARCHIVES_DIR,
+                         archive_name)
+
+    def latest_key(self):
+        """Get the key of the newest manifest or None if there is none."""
+        if not path.isdir(self.cache_dir):
+            return None
+        newest = None
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(WorkspaceCache.MANIFEST_EXTENSION):
+                continue
+            manifest = Tools.load_json(path.join(self.cache_dir, file_name))
+            if not isinstance(manifest, dict) or 'key' not in manifest:
+                continue
+            candidate = (manifest.get('created', 0), manifest['key'])
+            if newest is None or candidate > newest:
+                newest = candidate
+        return newest[1] if newest else None
+
+    def load(self, key):
+        """Read the graph of a manifest.
+
+        Raises:
+            ValueError: If there is no such manifest.
+
+        Returns:
+            dict: {relative path: {'url', 'branch', 'sha', 'archive'}}
+        """
+        manifest = Tools.load_json(self.manifest_path(key))
+        if not isinstance(manifest, dict) or \
+                not isinstance(manifest.get('repositories'), dict):
+            raise ValueError("No workspace with key '{}' in '{}'.".format(
+                key, self.cache_dir))
+        return manifest['repositories']
+
+    def save(self, ws_path, graph, session=None):
+        """Pack the repositories of a graph and write its manifest.
+
+        Args:
+            ws_path (str): Workspace source path.
+            graph (dict): {relative path: {'url', 'branch', 'sha'}}
+            session (Session): Lends its workers, one by one if None.
+
+        Returns:
+            str: The key of the graph or None if an archive failed.
+        """
+        def pack(repo_path):
+            repo = graph[repo_path]
+            archive_name = WorkspaceCache.archive_name(repo['url'],
+                                                       repo['sha'])
+            archive_path = self.archive_path(archive_name)
+            if path.exists(archive_path):
+                return repo_path, archive_name, False
+            tmp_path = "{}.{}.tmp".format(archive_path, os.getpid())
+            try:
+                if not path.isdir(path.dirname(archive_path)):
+                    os.makedirs(path.dirname(archive_path))
+                with tarfile.open(
+                        tmp_path, 'w:gz',
+                        compresslevel=WorkspaceCache.COMPRESS_LEVEL) as tar:
+                    tar.add(path.join(ws_path, repo_path), arcname='.')
+                os.rename(tmp_path, archive_path)
+            except (IOError, OSError, tarfile.TarError) as e:
+                log.error(" %s: cannot pack: %s", Tools.decorate(repo_path),
+                          e)
+                if path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return repo_path, None, False
+            return repo_path, archive_name, True
+
+        paths = sorted(graph)
+        if session:
+            results = list(session.thread_pool.map(pack, paths))
+        else:
+            results = [pack(repo_path) for repo_path in paths]
+        repositories = {}
+        for repo_path, archive_name, _ in results:
+            if not archive_name:
+                return None
+            repositories[repo_path] = dict(graph[repo_path],
+                                           archive=archive_name)
+        key = WorkspaceCache.make_key(graph)
+        manifest = {'key': key,
+                    'created': round(time.time(), 3),
+                    'repositories': repositories}
+        if not Tools.save_json(self.manifest_path(key), manifest):
+            return None
+        log.info(" Packed %s of %s repositories, the others were cached.",
+                 sum(1 for _, _, packed in results if packed), len(results))
+        return key
+
+    def restore(self, ws_path, graph, session=None):
+        """Unpack the repositories of a graph that are not in the workspace.
+
+        Every archive is unpacked into a temporary folder next to its
+        repository, which is renamed into place once complete.
+
+        Args:
+            ws_path (str): Workspace source path.
+            graph (dict): As returned by load.
+            session (Session): Lends its workers, one by one if None.
+
+        Returns:
+            tuple: (restored paths, failed paths), both sorted.
+        """
+        def unpack(repo_path):
+            repo_folder = path.join(ws_path, repo_path)
+            if path.exists(repo_folder):
+                return repo_path, None
+            archive_path = self.archive_path(graph[repo_path]['archive'])
+            parent = path.dirname(repo_folder)
+            tmp_folder = None
+            try:
+                if not path.isdir(parent):
+                    os.makedirs(parent)
+                tmp_folder = tempfile.mkdtemp(
+                    prefix="." + path.basename(repo_folder) + ".", dir=parent)
+                WorkspaceCache.__extract(archive_path, tmp_folder)
+                os.rename(tmp_folder, repo_folder)
+            except (IOError, OSError, tarfile.TarError) as e:
+                log.error(" %s: cannot unpack: %s", Tools.decorate(repo_path),
+                          e)
+                if tmp_folder and path.exists(tmp_folder):
+                    shutil.rmtree(tmp_folder, ignore_errors=True)
+                return repo_path, False
+            return repo_path, True
+
+        paths = sorted(graph)
+        if session:
+            results = list(session.thread_pool.map(unpack, paths))
+        else:
+            results = [unpack(repo_path) for repo_path in paths]
+        restored = [repo_path for repo_path, ok in results if ok]
+        failed = [repo_path for repo_path, ok in results if ok is False]
+        return restored, failed
+
+    @staticmethod
+    def moved_tips(graph, repo_paths, backend=GitBridge, session=None):
+        """Find the repositories whose branch moved on the remote.
+
+        Only the tip of the branch is asked for, which is much quicker than
+        pulling every repository. Repositories pinned to a commit never move
+        and those whose remote cannot be reached are left as they are.
+
+        Args:
+            graph (dict): As returned by load.
+            repo_paths (str[]): Paths of the repositories to check.
+            backend (GitBackend): Probes the remotes.
+            session (Session): Lends its workers and probe limiter, one by
+                one if None.
+
+        Returns:
+            str[]: Sorted paths of the repositories that moved.
+        """
+        def probe(repo_path):
+            repo = graph[repo_path]
+            dependency = Dependency(repo_path, url=repo['url'],
+                                    branch=repo['branch'])
+            dependency, found = backend.repository_exists(dependency)
+            return repo_path, found and dependency.sha != repo['sha']
+
+        paths = [repo_path for repo_path in sorted(repo_paths)
+                 if graph[repo_path]['branch']]
+        if session:
+            results = session.thread_pool.map(
+                lambda repo_path: session.limiters['probe'].call(
+                    None, probe, repo_path), paths)
+        else:
+            results = [probe(repo_path) for repo_path in paths]
+        return sorted(repo_path for repo_path, moved in results if moved)
+
+    @staticmethod
+    def __extract(archive_path, folder):
+        """Unpack an archive into a folder, never writing outside of it."""
+        with tarfile.open(archive_path, 'r:*') as tar:
+            if hasattr(tarfile, 'data_filter'):
+                tar.extractall(folder, filter='data')
+                return
+            for member in tar.getmembers():
+                target = path.abspath(path.join(folder, member.name))
+                if target != path.abspath(folder) and not target.startswith(
+                        path.abspath(folder) + os.sep):
+                    raise tarfile.TarError(
+                        "'{}' is outside of the archive.".format(member.name))
+            tar.extractall(folder)
@@ -14,6 +14,7 @@ install_requires = [
     'catkin-pkg > 0.2.9',
     'catkin_tools >= 0.4.2',
     'mock',
+    'PyYAML',
     'setuptools',
     'termcolor'
 ]
@@ -0,0 +1,74 @@
+"""Create local git repositories with catkin packages for tests."""
+import os
+import subprocess
+from os import path
+
+PACKAGE_XML = """<?xml version="1.0"?>
+<package>
+  <name>{name}</name>
+  <version>1.0.0</version>
+  <description>{name} package</description>
+  <maintainer email="test@example.com">test</maintainer>
+  <license>BSD</license>
+  <buildtool_depend>catkin</buildtool_depend>
+{depends}
+  <export>
+{exports}
+  </export>
+</package>
+"""
+
+GIT_ENV = dict(os.environ,
+               GIT_AUTHOR_NAME="test",
+               GIT_AUTHOR_EMAIL="test@example.com",
+               GIT_COMMITTER_NAME="test",
+               GIT_COMMITTER_EMAIL="test@example.com")
+
+
+def git(args, cwd=None):
+    """Run a git command and return its output."""
+    return subprocess.check_output(
+        ["git", "-c", "init.defaultBranch=master"] + args,
+        cwd=cwd, env=GIT_ENV, stderr=subprocess.STDOUT).decode("utf-8")
+
+
+def write_package_xml(folder, name, depends=(), exports=()):
+    """Write a package.xml into a folder."""
+    if not path.isdir(folder):
+        os.makedirs(folder)
+    depends_str = "\n".join(
+        "  <build_depend>{}</build_depend>".format(dep) for dep in depends)
+    exports_str = "\n".join("    " + export for export in exports)
+    with open(path.join(folder, "package.xml"), "w") as xml_file:
+        xml_file.write(PACKAGE_XML.format(
+            name=name, depends=depends_str, exports=exports_str))
+
+
+def create_remote(root, name, depends=(), exports=(), branches=()):
+    """Create a bare repository with a single catkin package.
+
+    Args:
+        root (str): Folder to create remotes in.
+        name (str): Name of the repository and the package.
+        depends (str[]): Names of build dependencies.
+        exports (str[]): Raw xml lines to put into the export tag.
+        branches (str[]): Additional branches to create.
+
+    Returns:
+        str: Path to the bare repository.
+    """
+    work = path.join(root, "work", name)
+    write_package_xml(work, name, depends, exports)
+    git(["init", "-q"], cwd=work)
+    git(["add", "-A"], cwd=work)
+    git(["commit", "-q", "-m", "init"], cwd=work)
+    for branch in branches:
+        git(["branch", branch], cwd=work)
+    remote = path.join(root, "remotes", name)
+    git(["clone", "-q", "--bare", work, remote])
+    return remote
+
+
+def remote_template(root):
+    """Get the url template that matches remotes made by create_remote."""
+    return path.join(root, "remotes", "{package}")
@@ -0,0 +1,89 @@
+"""Test fetching the dependency closure of a profile once."""
+import os
+import unittest
+import tempfile
+import shutil
+from os import path
+from mock import MagicMock
+from catkin_tools_fetch import cli
+from catkin_tools_fetch.lib.closure_cache import ClosureCache
+from catkin_tools_fetch.lib.fake_backend import FakeGitBackend
+from tests.local_repos import write_package_xml
+
+URL = "fake://{package}"
+
+
+class TestClosureCache(unittest.TestCase):
+    """Test the closure cache."""
+
+    def setUp(self):
+        """Create a workspace with a package and fake remotes."""
+        self.test_dir = tempfile.mkdtemp()
+        self.ws_path = path.join(self.test_dir, "src")
+        self.backend = FakeGitBackend()
+        self.backend.add_remote(URL.format(package="build_dep"), "build_dep",
+                                depends=["nested_dep"])
+        self.backend.add_remote(URL.format(package="nested_dep"),
+                                "nested_dep")
+        self.backend.add_remote(URL.format(package="exec_dep"), "exec_dep")
+        write_package_xml(path.join(self.ws_path, "pkg"), "pkg",
+                          depends=["build_dep"])
+        xml_path = path.join(self.ws_path, "pkg", "package.xml")
+        with open(xml_path) as xml_file:
+            xml = xml_file.read()
+        with open(xml_path, "w") as xml_file:
+            xml_file.write(xml.replace(
+                "<package>", '<package format="2">').replace(
+                "<export>", "<exec_depend>exec_dep</exec_depend>\n<export>"))
+        self.context = MagicMock()
+        self.context.source_space_abs = self.ws_path
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    def fetch(self, profile, default_urls=None):
+        """Run fetch with the cache of a profile."""
+        cache = ClosureCache(ClosureCache.default_cache_path(
+            self.test_dir, profile))
+        return cli.fetch(packages=[],
+                         workspace=self.test_dir,
+                         context=self.context,
+                         default_urls=default_urls or set([URL]),
+                         use_preprint=False,
+                         num_threads=None,
+                         pull_after_fetch=False,
+                         backend=self.backend,
+                         dep_profile=profile,
+                         closure_cache=cache)
+
+    def test_profile_closure(self):
+        """Test that a profile only fetches what it needs."""
+        self.assertEqual(0, self.fetch('exec'))
+        self.assertEqual(["exec_dep", "pkg"], sorted(os.listdir(self.ws_path)))
+        self.assertEqual(0, self.fetch('build'))
+        self.assertEqual(["build_dep", "exec_dep", "nested_dep", "pkg"],
+                         sorted(os.listdir(self.ws_path)))
+
+    def test_cached_closure(self):
+        """Test that an unchanged workspace is not resolved again."""
+        self.assertEqual(0, self.fetch('build'))
+        calls = len(self.backend.calls)
+        self.assertEqual(0, self.fetch('build'))
+        self.assertEqual(calls, len(self.backend.calls))
+        # Other profiles have their own cache.
+        self.assertEqual(0, self.fetch('exec'))
+        self.assertLess(calls, len(self.backend.calls))
+        # Any changed manifest invalidates the cache.
+        calls = len(self.backend.calls)
+        xml_path = path.join(self.ws_path, "pkg", "package.xml")
+        os.utime(xml_path, (0, 0))
+        self.assertEqual(0, self.fetch('build'))
+        self.assertLess(calls, len(self.backend.calls))
+
+    def test_missing_dependency_not_cached(self):
+        """Test that a closure with unresolved dependencies is not cached."""
+        self.assertEqual(0, self.fetch('build', set(["fake://x/{package}"])))
+        calls = len(self.backend.calls)
+        self.assertEqual(0, self.fetch('build', set(["fake://x/{package}"])))
+        self.assertLess(calls, len(self.backend.calls))
@@ -0,0 +1,131 @@
+"""Test adaptive concurrency."""
+import time
+import unittest
+import threading
+from concurrent import futures
+from catkin_tools_fetch.lib.concurrency import AdaptiveLimiter
+from catkin_tools_fetch.lib.concurrency import IoBudget
+
+
+class FakeClock(object):
+    """A clock that only moves when told to."""
+
+    def __init__(self):
+        """Start at zero."""
+        self.now = 0.0
+
+    def __call__(self):
+        """Get current time."""
+        return self.now
+
+
+def run_window(limiter, clock, duration, errors=0):
+    """Run one window of tasks that together take duration seconds."""
+    count = max(2, int(limiter.limit))
+    for _ in range(count):
+        limiter.acquire()
+    clock.now += duration
+    for i in range(count):
+        limiter.release(error=i < errors)
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    """Test the adaptive limiter."""
+
+    def test_defaults(self):
+        """Test default ceilings per phase and the user ceiling."""
+        self.assertEqual(32, AdaptiveLimiter('probe').ceiling)
+        self.assertEqual(8, AdaptiveLimiter('clone').ceiling)
+        limiters = AdaptiveLimiter.for_phases(['probe', 'pull'], 2)
+        self.assertEqual(2, limiters['probe'].ceiling)
+        self.assertEqual(2, limiters['pull'].limit)
+
+    def test_additive_increase_up_to_ceiling(self):
+        """Test that steady throughput grows the limit to the ceiling."""
+        clock = FakeClock()
+        limiter = AdaptiveLimiter('probe', ceiling=6, clock=clock)
+        for _ in range(10):
+            # Throughput grows with the limit, latency stays the same.
+            run_window(limiter, clock, 1.0)
+        self.assertEqual(6, limiter.limit)
+        self.assertEqual([4, 5, 6], limiter.history[:3])
+
+    def test_multiplicative_decrease(self):
+        """Test that errors halve the limit."""
+        clock = FakeClock()
+        limiter = AdaptiveLimiter('clone', initial=8, clock=clock)
+        run_window(limiter, clock, 1.0, errors=1)
+        self.assertEqual(4, limiter.limit)
+
+    def test_back_off_when_throughput_drops(self):
+        """Test that an increase that hurts throughput is undone."""
+        clock = FakeClock()
+        limiter = AdaptiveLimiter('clone', clock=clock)
+        run_window(limiter, clock, 1.0)
+        self.assertEqual(5, limiter.limit)
+        # Five parallel tasks saturate the link: each window takes longer.
+        run_window(limiter, clock, 2.0)
+        self.assertEqual(4, limiter.limit)
+
+    def test_limit_respected(self):
+        """Test that no more tasks run in parallel than the limit."""
+        limiter = AdaptiveLimiter('clone', ceiling=2)
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def task():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return True
+
+        pool = futures.ThreadPoolExecutor(max_workers=8)
+        tasks = [pool.submit(limiter.call, None, task) for _ in range(20)]
+        self.assertTrue(all(future.result() for future in tasks))
+        self.assertLessEqual(running[1], 2)
+        pool.shutdown()
+
+    def test_ceiling_shared_by_phases(self):
+        """Test that a user ceiling caps the tasks of all phases together."""
+        limiters = AdaptiveLimiter.for_phases(['probe', 'clone', 'pull'], 2)
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def task():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return True
+
+        pool = futures.ThreadPoolExecutor(max_workers=12)
+        tasks = [pool.submit(limiters[phase].call, None, task)
+                 for _ in range(10) for phase in sorted(limiters)]
+        self.assertTrue(all(future.result() for future in tasks))
+        self.assertEqual(2, running[1])
+        pool.shutdown()
+
+
+class TestIoBudget(unittest.TestCase):
+    """Test the I/O budget."""
+
+    def test_unlimited(self):
+        """Test that no budget never waits."""
+        self.assertEqual(0.0, IoBudget().consume(10 ** 12))
+
+    def test_debt(self):
+        """Test that tasks wait until their bytes are paid off."""
+        clock = FakeClock()
+        slept = []
+        budget = IoBudget(100, clock=clock, sleep=slept.append)
+        self.assertEqual(0.0, budget.consume(100))
+        self.assertEqual(3.0, budget.consume(300))
+        self.assertEqual(4.0, budget.consume(100))
+        clock.now += 10.0
+        self.assertEqual(0.0, budget.consume(50))
+        self.assertEqual([3.0, 4.0], slept)
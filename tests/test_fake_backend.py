@@ -0,0 +1,207 @@
+"""Test the in-memory git backend and the code that runs on top of it."""
+import os
+import time
+import unittest
+import tempfile
+import shutil
+from os import path
+from mock import MagicMock
+from catkin_tools_fetch import cli
+from catkin_tools_fetch.lib.dependency_parser import Dependency
+from catkin_tools_fetch.lib.downloader import Downloader
+from catkin_tools_fetch.lib.fake_backend import FakeGitBackend
+from catkin_tools_fetch.lib.session import Session
+from catkin_tools_fetch.lib.tools import GitBackend
+from catkin_tools_fetch.lib.update import Updater
+from tests.local_repos import write_package_xml
+
+URL = "fake://{}"
+
+
+class TestFakeGitBackend(unittest.TestCase):
+    """Test the fake backend."""
+
+    def setUp(self):
+        """Create a workspace."""
+        self.test_dir = tempfile.mkdtemp()
+        self.ws_path = path.join(self.test_dir, "src")
+        os.makedirs(self.ws_path)
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    def test_clone_and_probe(self):
+        """Test probing urls in order and cloning."""
+        backend = FakeGitBackend()
+        backend.add_remote(URL.format("b/pkg"), "pkg", branches=["devel"])
+        dep = Dependency("pkg")
+        dep.set_default_urls_if_needed(set(["fake://a/{package}",
+                                            "fake://b/{package}"]))
+        dep, found = backend.repository_exists(dep)
+        self.assertFalse(found)
+        dep.branch = "devel"
+        dep, found = backend.repository_exists(dep)
+        self.assertTrue(found)
+        self.assertEqual("fake://b/pkg", dep.url)
+        self.assertEqual(40, len(dep.sha))
+        clone_path = path.join(self.ws_path, "pkg")
+        _, tag = backend.clone("pkg", dep.url, clone_path, "master")
+        self.assertEqual(GitBackend.ERROR_TAG, tag)
+        _, tag = backend.clone("pkg", dep.url, clone_path, "devel")
+        self.assertEqual(GitBackend.CLONED_TAG.format(branch="devel"), tag)
+        self.assertTrue(path.exists(path.join(clone_path, "package.xml")))
+        _, tag = backend.clone("pkg", dep.url, clone_path, "devel")
+        self.assertEqual(GitBackend.EXISTS_TAG, tag)
+        self.assertEqual(("probe", "fake://a/pkg"), backend.calls[0])
+
+    def test_failures_and_latency(self):
+        """Test injected failures and simulated latency."""
+        slept = []
+        backend = FakeGitBackend(latency={'clone': 2.0},
+                                 failures={'clone': ["pkg"]},
+                                 sleep=slept.append)
+        backend.add_remote(URL.format("pkg"), "pkg")
+        _, tag = backend.clone("pkg", URL.format("pkg"),
+                               path.join(self.ws_path, "pkg"))
+        self.assertEqual(GitBackend.ERROR_TAG, tag)
+        self.assertEqual([2.0], slept)
+        self.assertFalse(path.exists(path.join(self.ws_path, "pkg")))
+        always_fails = FakeGitBackend(failure_rate=1.0)
+        always_fails.add_remote(URL.format("pkg"), "pkg")
+        _, found = always_fails.repository_exists(
+            Dependency("pkg", url=URL.format("pkg")))
+        self.assertFalse(found)
+
+    def test_downloader_at_scale(self):
+        """Test that the downloader resolves many repos in little time."""
+        backend = FakeGitBackend()
+        deps = {}
+        for i in range(1000):
+            name = "pkg_{}".format(i)
+            backend.add_remote(URL.format(name), name)
+            deps[name] = Dependency(name)
+            deps[name].set_default_urls_if_needed(set([URL.format(
+                "{package}")]))
+        deps["missing"] = Dependency("missing", url=URL.format("missing"))
+        downloader = Downloader(self.ws_path, [], set(), use_preprint=False,
+                                backend=backend)
+        start = time.time()
+        self.assertEqual(0, downloader.download_dependencies(deps))
+        self.assertLess(time.time() - start, 30.0)
+        self.assertEqual(1000, len(os.listdir(self.ws_path)))
+        self.assertEqual(1000, len([call for call in backend.calls
+                                    if call[0] == 'clone']))
+
+    def test_downloader_pipeline(self):
+        """Test that a clone does not wait for the probes of others."""
+        fast_path = path.join(self.ws_path, "fast")
+        cloned_during_probe = []
+
+        class SlowProbeBackend(FakeGitBackend):
+            """Probe "slow" only once "fast" is cloned."""
+
+            def repository_exists(self, dependency):
+                if dependency.name == "slow":
+                    deadline = time.time() + 10.0
+                    while not path.exists(fast_path) and \
+                            time.time() < deadline:
+                        time.sleep(0.01)
+                    cloned_during_probe.append(path.exists(fast_path))
+                return super(SlowProbeBackend, self).repository_exists(
+                    dependency)
+
+        backend = SlowProbeBackend()
+        deps = {}
+        for name in ["fast", "slow", "missing"]:
+            if name != "missing":
+                backend.add_remote(URL.format(name), name)
+            deps[name] = Dependency(name, url=URL.format(name))
+        downloader = Downloader(self.ws_path, [], set(), use_preprint=False,
+                                backend=backend)
+        self.assertEqual(0, downloader.download_dependencies(deps))
+        self.assertEqual([True], cloned_during_probe)
+        self.assertTrue(path.exists(path.join(self.ws_path, "slow")))
+        self.assertEqual(set(["missing"]), downloader.not_found)
+
+    def test_failing_probes_reduce_limit(self):
+        """Test that probes failing on the network halve the probe limit."""
+        names = ["pkg_{}".format(i) for i in range(8)]
+        backend = FakeGitBackend(failures={'probe': names})
+        deps = {}
+        for name in names:
+            backend.add_remote(URL.format(name), name)
+            deps[name] = Dependency(name, url=URL.format(name))
+        with Session() as session:
+            downloader = Downloader(self.ws_path, [], set(),
+                                    use_preprint=False, backend=backend,
+                                    session=session)
+            downloader.download_dependencies(deps)
+            limiter = session.limiters['probe']
+            self.assertEqual(set(names), downloader.not_found)
+            self.assertLess(min(limiter.history), limiter.history[0])
+            self.assertEqual(1, limiter.history[-1])
+
+    def test_downloader_clones_probed_sha(self):
+        """Test that a commit after the probe does not end up cloned."""
+
+        class MovingBackend(FakeGitBackend):
+            """Commit to every remote right after it was probed."""
+
+            def repository_exists(self, dependency):
+                result = super(MovingBackend, self).repository_exists(
+                    dependency)
+                self.commit(dependency.url)
+                return result
+
+        backend = MovingBackend()
+        backend.add_remote(URL.format("pkg"), "pkg")
+        dep = Dependency("pkg", url=URL.format("pkg"))
+        downloader = Downloader(self.ws_path, [], set(), use_preprint=False,
+                                backend=backend)
+        self.assertEqual(0, downloader.download_dependencies({"pkg": dep}))
+        self.assertEqual(("master", dep.sha),
+                         backend.head(path.join(self.ws_path, "pkg")))
+
+    def test_updater(self):
+        """Test the tags the updater picks from the fake backend."""
+        backend = FakeGitBackend(failures={'pull': [
+            path.join(self.ws_path, "broken")]})
+        packages = {}
+        for name in ["new", "same", "changed", "broken"]:
+            backend.add_remote(URL.format(name), name)
+            backend.clone(name, URL.format(name), path.join(self.ws_path,
+                                                            name))
+            packages[name] = MagicMock()
+            packages[name].name = name
+        backend.commit(URL.format("new"))
+        backend.make_changes(path.join(self.ws_path, "changed"))
+        updater = Updater(self.ws_path, packages, use_preprint=False,
+                          colored=False, backend=backend)
+        tags = dict(updater.update_packages([]))
+        self.assertEqual({"new": Updater.PULLED_TAG,
+                          "same": Updater.UP_TO_DATE_TAG,
+                          "changed": Updater.CHANGES_TAG,
+                          "broken": Updater.ERROR_TAG}, tags)
+
+    def test_cli_fetch(self):
+        """Test that fetch resolves the whole dependency closure."""
+        backend = FakeGitBackend()
+        backend.add_remote(URL.format("dep_a"), "dep_a", depends=["dep_b"])
+        backend.add_remote(URL.format("dep_b"), "dep_b", depends=["dep_c"])
+        backend.add_remote(URL.format("dep_c"), "dep_c")
+        write_package_xml(path.join(self.ws_path, "pkg"), "pkg",
+                          depends=["dep_a"])
+        context = MagicMock()
+        context.source_space_abs = self.ws_path
+        error_code = cli.fetch(packages=[],
+                               workspace=self.test_dir,
+                               context=context,
+                               default_urls=set([URL.format("{package}")]),
+                               use_preprint=False,
+                               num_threads=None,
+                               pull_after_fetch=False,
+                               backend=backend)
+        self.assertEqual(0, error_code)
+        self.assertEqual(["dep_a", "dep_b", "dep_c", "pkg"],
+                         sorted(os.listdir(self.ws_path)))
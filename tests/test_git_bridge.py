@@ -4,8 +4,13 @@ import os
 import shutil
 import logging
 import tempfile
+import time
+import subprocess
 from catkin_tools_fetch.lib.tools import GitBridge
+from catkin_tools_fetch.lib.tools import GitTimeoutError
 from catkin_tools_fetch.lib.dependency_parser import Dependency
+from tests.local_repos import create_remote
+from tests.local_repos import git
 
 log = logging.getLogger('deps')
 
@@ -16,10 +21,18 @@ class TestGitBridge(unittest.TestCase):
     def setUp(self):
         """Create a temporary directory."""
         self.test_dir = tempfile.mkdtemp()
+        self.timeouts = dict(GitBridge.TIMEOUTS)
+        self.retries = GitBridge.RETRIES
+        self.backoff = GitBridge.BACKOFF
+        self.git = GitBridge.GIT
 
     def tearDown(self):
         """Remove the directory after the test."""
         shutil.rmtree(self.test_dir)
+        GitBridge.TIMEOUTS = self.timeouts
+        GitBridge.RETRIES = self.retries
+        GitBridge.BACKOFF = self.backoff
+        GitBridge.GIT = self.git
 
     def test_status(self):
         """Test that git status gives us branch and status."""
@@ -80,6 +93,126 @@ class TestGitBridge(unittest.TestCase):
         dep_res, exists = GitBridge.repository_exists(dependency)
         self.assertFalse(exists)
 
+    def test_repository_branch(self):
+        """Test that the probe checks the branch and finds its sha."""
+        remote = create_remote(self.test_dir, "pkg", branches=["devel"])
+        git(["tag", "-a", "-m", "release", "v1", "master"], cwd=remote)
+        head = git(["rev-parse", "master"], cwd=remote).strip()
+        for branch in [None, "devel", "v1"]:
+            dependency = Dependency(name="pkg", url=remote, branch=branch)
+            dependency, exists = GitBridge.repository_exists(dependency)
+            self.assertTrue(exists)
+            self.assertEqual(head, dependency.sha)
+        dependency = Dependency(name="pkg", url=remote, branch="missing")
+        dependency, exists = GitBridge.repository_exists(dependency)
+        self.assertFalse(exists)
+        self.assertIsNone(dependency.sha)
+        self.assertFalse(dependency.probe_error)
+
+    def test_probe_filters_refs_on_server(self):
+        """Test that a probe does not receive refs it did not ask for."""
+        remote = create_remote(self.test_dir, "pkg")
+        for i in range(20):
+            git(["tag", "ci-{}".format(i), "master"], cwd=remote)
+        trace = os.path.join(self.test_dir, "trace")
+        env = dict(os.environ, GIT_TRACE_PACKET=trace)
+        sha = GitBridge.find_ref("file://" + remote, "master", env=env)
+        self.assertEqual(git(["rev-parse", "master"], cwd=remote).strip(),
+                         sha)
+        with open(trace) as trace_file:
+            received = [line for line in trace_file if "ls-remote<" in line]
+        self.assertTrue(received)
+        self.assertFalse([line for line in received if "refs/tags" in line])
+        self.assertEqual(
+            git(["rev-parse", "ci-3"], cwd=remote).strip(),
+            GitBridge.find_ref("file://" + remote, "ci-3"))
+
+    def test_clone_commit(self):
+        """Test cloning a pinned commit and reading it back."""
+        remote = create_remote(self.test_dir, "pkg", branches=["devel"])
+        sha = git(["rev-parse", "master"], cwd=remote).strip()
+        clone_path = os.path.join(self.test_dir, "pinned")
+        name, result = GitBridge.clone("pkg", remote, clone_path, sha)
+        self.assertEqual(GitBridge.CLONED_TAG.format(branch=sha), result)
+        self.assertEqual((None, sha), GitBridge.head(clone_path))
+        self.assertEqual(remote, GitBridge.remote_url(clone_path))
+        clone_path = os.path.join(self.test_dir, "branch")
+        GitBridge.clone("pkg", remote, clone_path, "devel")
+        self.assertEqual(("devel", sha), GitBridge.head(clone_path))
+        git(["remote", "remove", "origin"], cwd=clone_path)
+        self.assertIsNone(GitBridge.remote_url(clone_path))
+        name, result = GitBridge.clone(
+            "pkg", remote, os.path.join(self.test_dir, "bad"), "b" * 40)
+        self.assertEqual(GitBridge.ERROR_TAG, result)
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "bad")))
+
+    def test_clone_probed_sha(self):
+        """Test that a clone stays at the commit found by the probe."""
+        remote = create_remote(self.test_dir, "pkg")
+        probed = GitBridge.find_ref("file://" + remote, "master")
+        work = os.path.join(self.test_dir, "work", "pkg")
+        git(["commit", "-q", "--allow-empty", "-m", "later"], cwd=work)
+        git(["push", "-q", remote, "master"], cwd=work)
+        clone_path = os.path.join(self.test_dir, "probed")
+        _, result = GitBridge.clone("pkg", remote, clone_path, "master",
+                                    sha=probed)
+        self.assertEqual(GitBridge.CLONED_TAG.format(branch="master"),
+                         result)
+        self.assertEqual(("master", probed), GitBridge.head(clone_path))
+        # A commit that is gone from the branch keeps the branch head.
+        clone_path = os.path.join(self.test_dir, "rewritten")
+        _, result = GitBridge.clone("pkg", remote, clone_path, "master",
+                                    sha="b" * 40)
+        self.assertEqual(GitBridge.CLONED_TAG.format(branch="master"),
+                         result)
+        self.assertNotEqual(probed, GitBridge.head(clone_path)[1])
+
+    def test_fetched_sha(self):
+        """Test reading the remote commit that a pull brought in."""
+        remote = create_remote(self.test_dir, "pkg")
+        clone_path = os.path.join(self.test_dir, "clone")
+        GitBridge.clone("pkg", remote, clone_path, "master")
+        self.assertRaises(subprocess.CalledProcessError,
+                          GitBridge.fetched_sha, clone_path)
+        work = os.path.join(self.test_dir, "work", "pkg")
+        git(["commit", "-q", "--allow-empty", "-m", "later"], cwd=work)
+        git(["push", "-q", remote, "master"], cwd=work)
+        GitBridge.pull(clone_path, "master")
+        self.assertEqual(git(["rev-parse", "master"], cwd=remote).strip(),
+                         GitBridge.fetched_sha(clone_path))
+
+    def test_is_transient(self):
+        """Test that only network hiccups are retried."""
+        def error(output):
+            return subprocess.CalledProcessError(128, "git", output=output)
+
+        self.assertTrue(GitBridge.is_transient(error(
+            b"fatal: unable to access 'https://example.com/': "
+            b"Failed to connect to example.com port 443")))
+        self.assertTrue(GitBridge.is_transient(error(
+            "error: RPC failed; curl 56 Connection reset by peer")))
+        self.assertTrue(GitBridge.is_transient(GitTimeoutError(
+            -9, ["git"])))
+        self.assertFalse(GitBridge.is_transient(error(
+            b"fatal: unable to access 'https://typo.example/': "
+            b"Could not resolve host: typo.example")))
+        self.assertFalse(GitBridge.is_transient(error(
+            b"ssh: Could not resolve hostname typo.example: "
+            b"Temporary failure in name resolution")))
+        self.assertFalse(GitBridge.is_transient(error(None)))
+
+    def test_parse_ls_remote(self):
+        """Test picking the sha of a branch or tag."""
+        output = b"""warning: redirecting to https://example.com/
+1111111111111111111111111111111111111111\trefs/tags/v1
+2222222222222222222222222222222222222222\trefs/tags/v1^{}
+3333333333333333333333333333333333333333\trefs/heads/master
+"""
+        self.assertEqual("3" * 40, GitBridge.parse_ls_remote(output, "master"))
+        self.assertEqual("2" * 40, GitBridge.parse_ls_remote(output, "v1"))
+        self.assertIsNone(GitBridge.parse_ls_remote(output, "devel"))
+        self.assertIsNone(GitBridge.parse_ls_remote(b"", "master"))
+
     def test_get_branch_name(self):
         """Test getting the branch name."""
         test_output = """## master...origin/master
@@ -93,3 +226,73 @@ M src/visualization/visualizer.cpp
         print(test_output)
         branch = GitBridge.get_branch_name(test_output)
         self.assertEqual(branch, "master")
+
+    def test_timeout_kills_process_group(self):
+        """Test that a hung command and its children are killed."""
+        marker = os.path.join(self.test_dir, "marker")
+        cmd = ["sh", "-c", "(sleep 1; touch {}) & sleep 5".format(marker)]
+        start = time.time()
+        self.assertRaises(GitTimeoutError, GitBridge.run_once, cmd, 0.2)
+        self.assertLess(time.time() - start, 2)
+        time.sleep(1.2)
+        self.assertFalse(os.path.exists(marker))
+
+    def test_retry_transient(self):
+        """Test that transient errors are retried and others are not."""
+        GitBridge.BACKOFF = 0
+        GitBridge.configure(retries=2)
+        counter = os.path.join(self.test_dir, "counter")
+        cmd = ["sh", "-c", "echo x >> {}; echo 'fatal: Connection reset "
+               "by peer' >&2; exit 128".format(counter)]
+        self.assertRaises(subprocess.CalledProcessError,
+                          GitBridge.run, cmd, "probe")
+        with open(counter) as counter_file:
+            self.assertEqual(3, len(counter_file.readlines()))
+        os.remove(counter)
+        cmd = ["sh", "-c", "echo x >> {}; echo 'fatal: repository not "
+               "found' >&2; exit 128".format(counter)]
+        self.assertRaises(subprocess.CalledProcessError,
+                          GitBridge.run, cmd, "probe")
+        with open(counter) as counter_file:
+            self.assertEqual(1, len(counter_file.readlines()))
+
+    def test_clone_retry_after_timeout(self):
+        """Test that a clone killed on timeout is retried from scratch."""
+        # Hangs on the first call after writing into the folder and refuses
+        # a non-empty folder like git does.
+        stub = os.path.join(self.test_dir, "git")
+        with open(stub, "w") as stub_file:
+            stub_file.write("""#!/bin/sh
+dest="$6"
+if [ -n "$(ls -A "$dest" 2>/dev/null)" ]; then
+    echo "fatal: destination path '$dest' already exists and is not an \\
+empty directory." >&2
+    exit 128
+fi
+mkdir -p "$dest"
+touch "$dest/file"
+if [ ! -e "{counter}" ]; then
+    touch "{counter}"
+    sleep 10
+fi
+""".format(counter=os.path.join(self.test_dir, "counter")))
+        os.chmod(stub, 0o755)
+        GitBridge.GIT = stub
+        GitBridge.BACKOFF = 0
+        GitBridge.configure(timeouts={"clone": 0.5}, retries=1)
+        clone_path = os.path.join(self.test_dir, "ws", "pkg")
+        start = time.time()
+        _, result = GitBridge.clone("pkg", "url", clone_path)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(GitBridge.CLONED_TAG.format(branch="master"), result)
+        self.assertTrue(os.path.exists(os.path.join(clone_path, "file")))
+        self.assertFalse(os.path.exists(GitBridge.partial_path(clone_path)))
+
+    def test_configure(self):
+        """Test configuring timeouts."""
+        timeouts = GitBridge.parse_timeouts("probe=5, clone=60.5")
+        self.assertEqual({"probe": 5, "clone": 60.5}, timeouts)
+        GitBridge.configure(timeouts=timeouts)
+        self.assertEqual(60.5, GitBridge.TIMEOUTS["clone"])
+        self.assertRaises(ValueError, GitBridge.parse_timeouts, "probe")
+        self.assertRaises(ValueError, GitBridge.configure, {"blah": 1})
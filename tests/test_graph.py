@@ -0,0 +1,162 @@
+"""Test building the dependency graph of a workspace."""
+import json
+import shutil
+import tempfile
+import unittest
+from os import path
+from mock import MagicMock
+from catkin_tools_fetch import cli
+from catkin_tools_fetch.lib.graph import DependencyGraph
+from catkin_tools_fetch.lib.history import RunHistory
+from tests.local_repos import git
+from tests.local_repos import write_package_xml
+
+URL = "fake://{package}"
+EXPLICIT_URL = "https://example.com/explicit_dep.git"
+
+
+class TestDependencyGraph(unittest.TestCase):
+    """Test the dependency graph."""
+
+    def setUp(self):
+        """Create a workspace with a repository of two packages."""
+        self.test_dir = tempfile.mkdtemp()
+        self.ws_path = path.join(self.test_dir, "src")
+        group = path.join(self.ws_path, "group")
+        write_package_xml(
+            path.join(group, "pkg"), "pkg",
+            depends=["helper", "cloned_dep", "boost", "missing_dep",
+                     "explicit_dep"],
+            exports=['<git_url target="explicit_dep" url="{}" '
+                     'branch="devel"/>'.format(EXPLICIT_URL)])
+        write_package_xml(path.join(group, "helper"), "helper",
+                          depends=["cloned_dep"])
+        git(["init", "-q"], cwd=group)
+        write_package_xml(path.join(self.ws_path, "cloned_dep"), "cloned_dep",
+                          depends=["resolved_dep"])
+        self.workspace_packages = {}
+        for folder in ["group/pkg", "group/helper", "cloned_dep"]:
+            package = MagicMock()
+            package.name = path.basename(folder)
+            self.workspace_packages[folder] = package
+        self.known_urls = {"cloned_dep": URL.format(package="cloned_dep"),
+                           "resolved_dep": URL.format(package="resolved_dep")}
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    def build(self, packages=()):
+        """Build the graph of the workspace."""
+        return DependencyGraph.from_workspace(
+            ws_path=self.ws_path,
+            workspace_packages=self.workspace_packages,
+            packages=list(packages),
+            default_urls=set([URL]),
+            known_urls=self.known_urls,
+            system_pkgs=set(["boost"]))
+
+    def test_known_urls(self):
+        """Test that the newest url of a package wins and errors do not."""
+        runs = [
+            {'repos': [{'name': 'a', 'operation': 'probe', 'outcome': 'ok',
+                        'url': 'old/a'}]},
+            {'repos': [{'name': 'a', 'operation': 'clone', 'outcome': 'ok',
+                        'url': 'new/a'},
+                       {'name': 'b', 'operation': 'probe', 'outcome': 'miss'},
+                       {'name': 'c', 'operation': 'clone',
+                        'outcome': 'error', 'url': 'bad/c'},
+                       {'name': 'd', 'operation': 'pull', 'outcome': 'ok',
+                        'url': 'pull/d'}]},
+        ]
+        self.assertEqual({'a': 'new/a'}, DependencyGraph.known_urls(runs))
+
+    def test_nodes(self):
+        """Test the kind and origin of every package."""
+        graph = self.build()
+        self.assertEqual(["cloned_dep", "helper", "pkg"], graph.roots)
+        nodes = graph.nodes
+        self.assertEqual(
+            set(["pkg", "helper", "cloned_dep", "resolved_dep", "boost",
+                 "missing_dep", "explicit_dep"]), set(nodes))
+        self.assertEqual(DependencyGraph.WORKSPACE, nodes["pkg"]["kind"])
+        self.assertEqual("group", nodes["pkg"]["repo"])
+        self.assertEqual("group", nodes["helper"]["repo"])
+        self.assertIsNone(nodes["cloned_dep"]["repo"])
+        self.assertEqual(["boost", "cloned_dep", "explicit_dep", "helper",
+                          "missing_dep"], nodes["pkg"]["depends"])
+        self.assertEqual(URL.format(package="cloned_dep"),
+                         nodes["cloned_dep"]["url"])
+        self.assertEqual(URL, nodes["cloned_dep"]["template"])
+        self.assertEqual(DependencyGraph.RESOLVED,
+                         nodes["resolved_dep"]["kind"])
+        self.assertEqual(URL, nodes["resolved_dep"]["template"])
+        self.assertEqual(DependencyGraph.SYSTEM, nodes["boost"]["kind"])
+        self.assertEqual(DependencyGraph.UNRESOLVED,
+                         nodes["missing_dep"]["kind"])
+        explicit = nodes["explicit_dep"]
+        self.assertEqual(DependencyGraph.RESOLVED, explicit["kind"])
+        self.assertEqual(EXPLICIT_URL, explicit["url"])
+        self.assertEqual(DependencyGraph.EXPLICIT, explicit["template"])
+        self.assertEqual("devel", explicit["branch"])
+
+    def test_roots(self):
+        """Test that only the closure of the given packages is shown."""
+        graph = self.build(["helper"])
+        self.assertEqual(["helper"], graph.roots)
+        self.assertEqual(set(["helper", "cloned_dep", "resolved_dep"]),
+                         set(graph.nodes))
+
+    def test_tree(self):
+        """Test that shared dependencies are expanded once."""
+        lines = self.build(["pkg"]).to_tree().splitlines()
+        self.assertTrue(lines[0].startswith("pkg  (workspace, repo: group"))
+        names = [line.lstrip("|`- ").split("  ")[0] for line in lines]
+        self.assertEqual(["pkg", "boost", "cloned_dep", "resolved_dep",
+                          "explicit_dep", "helper", "cloned_dep",
+                          "missing_dep"], names)
+        self.assertTrue(lines[2].startswith("|-- cloned_dep"))
+        self.assertTrue(lines[3].startswith("|   `-- resolved_dep"))
+        self.assertTrue(lines[6].endswith("(*)"))
+        self.assertTrue(lines[7].startswith("`-- missing_dep  (unresolved)"))
+
+    def test_dot_and_json(self):
+        """Test the machine readable formats."""
+        graph = self.build()
+        dot = graph.render("dot")
+        self.assertTrue(dot.startswith("digraph deps {"))
+        self.assertIn('label="group";', dot)
+        self.assertIn('"pkg" -> "helper";', dot)
+        self.assertIn('"missing_dep" [color=red, fontcolor=red];', dot)
+        data = json.loads(graph.render("json"))
+        self.assertEqual(graph.roots, data["roots"])
+        self.assertEqual(graph.nodes, data["packages"])
+
+    def test_cli(self):
+        """Test writing the graph with urls from the history."""
+        history_path = path.join(self.test_dir, "history.jsonl")
+        history = RunHistory(history_path, 'fetch')
+        history.record("cloned_dep", "clone", 1.0, RunHistory.OK,
+                       url=URL.format(package="cloned_dep"))
+        history.save()
+        context = MagicMock()
+        context.source_space_abs = self.ws_path
+        output_path = path.join(self.test_dir, "graph.json")
+        code = cli.graph(packages=["helper"],
+                         workspace=self.test_dir,
+                         context=context,
+                         default_urls=set([URL]),
+                         output_format="json",
+                         output_path=output_path,
+                         history_path=history_path)
+        self.assertEqual(0, code)
+        with open(output_path) as graph_file:
+            nodes = json.load(graph_file)["packages"]
+        self.assertEqual(URL.format(package="cloned_dep"),
+                         nodes["cloned_dep"]["url"])
+        self.assertEqual(DependencyGraph.UNRESOLVED,
+                         nodes["resolved_dep"]["kind"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Test recording the history of runs."""
+import os
+import unittest
+import tempfile
+import shutil
+from os import path
+from catkin_tools_fetch.lib.dependency_parser import Dependency
+from catkin_tools_fetch.lib.downloader import Downloader
+from catkin_tools_fetch.lib.history import RunHistory
+from tests.local_repos import create_remote
+from tests.local_repos import remote_template
+
+
+class TestRunHistory(unittest.TestCase):
+    """Test the run history."""
+
+    def setUp(self):
+        """Create a temporary directory."""
+        self.test_dir = tempfile.mkdtemp()
+        self.history_path = path.join(self.test_dir, "history.jsonl")
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    def test_append_and_load(self):
+        """Test that every run is appended and read back in order."""
+        for started in [20, 10]:
+            history = RunHistory(self.history_path, 'fetch',
+                                 clock=lambda: started)
+            history.record("pkg", 'clone', 1.23456, RunHistory.OK,
+                           url="git@github.com:a/pkg", num_bytes=100)
+            self.assertTrue(history.save())
+        with open(self.history_path, 'a') as history_file:
+            history_file.write('{"broken\n')
+        runs = RunHistory.load_runs(self.history_path)
+        self.assertEqual([10, 20], [run['started'] for run in runs])
+        self.assertEqual({'name': "pkg", 'operation': 'clone',
+                          'duration': 1.235, 'outcome': RunHistory.OK,
+                          'url': "git@github.com:a/pkg", 'bytes': 100},
+                         runs[0]['repos'][0])
+
+    def test_rotation(self):
+        """Test that a big history file is rotated."""
+        old_max_bytes = RunHistory.MAX_BYTES
+        RunHistory.MAX_BYTES = 10
+        try:
+            for started in range(3):
+                RunHistory(self.history_path, 'update',
+                           clock=lambda: started).save()
+        finally:
+            RunHistory.MAX_BYTES = old_max_bytes
+        self.assertTrue(path.exists(self.history_path + ".1"))
+        runs = RunHistory.load_runs(self.history_path)
+        self.assertEqual([1, 2], [run['started'] for run in runs])
+
+    def test_downloader_records(self):
+        """Test that the downloader records probes and clones."""
+        create_remote(self.test_dir, "dep_a")
+        ws_path = path.join(self.test_dir, "src")
+        os.makedirs(ws_path)
+        history = RunHistory()
+        downloader = Downloader(ws_path, [], set(), use_preprint=False,
+                                history=history)
+        deps = {}
+        for name in ["dep_a", "missing"]:
+            deps[name] = Dependency(name)
+            deps[name].set_default_urls_if_needed(
+                set([remote_template(self.test_dir)]))
+        self.assertEqual(0, downloader.download_dependencies(deps))
+        outcomes = sorted((record['name'], record['operation'],
+                           record['outcome']) for record in history.records)
+        self.assertEqual([("dep_a", 'clone', RunHistory.OK),
+                          ("dep_a", 'probe', RunHistory.OK),
+                          ("missing", 'probe', RunHistory.MISS)], outcomes)
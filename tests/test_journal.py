@@ -0,0 +1,163 @@
+"""Test resuming an interrupted fetch from its journal."""
+import os
+import shutil
+import tempfile
+import unittest
+from os import path
+from mock import MagicMock
+from catkin_tools_fetch import cli
+from catkin_tools_fetch.lib.dependency_parser import Dependency
+from catkin_tools_fetch.lib.fake_backend import FakeGitBackend
+from catkin_tools_fetch.lib.journal import FetchJournal
+from catkin_tools_fetch.lib.tools import GitBridge
+from tests.local_repos import create_remote
+from tests.local_repos import write_package_xml
+
+URL = "fake://{}"
+
+
+class TestJournal(unittest.TestCase):
+    """Test the fetch journal."""
+
+    def setUp(self):
+        """Create a workspace."""
+        self.test_dir = tempfile.mkdtemp()
+        self.ws_path = path.join(self.test_dir, "src")
+        os.makedirs(self.ws_path)
+        self.journal_path = FetchJournal.default_journal_path(self.test_dir)
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    @staticmethod
+    def dependency(name):
+        """Create a dependency that is searched under the default url."""
+        dependency = Dependency(name)
+        dependency.set_default_urls_if_needed(set([URL.format("{package}")]))
+        return dependency
+
+    def test_records(self):
+        """Test that a reloaded journal holds all complete records."""
+        journal = FetchJournal(self.journal_path)
+        self.assertFalse(journal.is_resumed())
+        found = self.dependency("dep_a")
+        found.url, found.sha = URL.format("dep_a"), "a" * 40
+        journal.record_probe(found)
+        journal.record_cloning("dep_a", path.join(self.ws_path, "dep_a"))
+        journal.record_cloning("dep_c", path.join(self.ws_path, "dep_c"))
+        journal.record_cloned("dep_a")
+        with open(self.journal_path, "a") as journal_file:
+            # A miss journaled by an older version and a record without key.
+            journal_file.write('{"name": "dep_b", "step": "missing"}\n')
+            journal_file.write('{"name": "dep_e", "step": "probed", '
+                               '"url": "fake://dep_e"}\n')
+            journal_file.write('{"name": "dep_d", "st')
+        journal = FetchJournal(self.journal_path)
+        self.assertTrue(journal.is_resumed())
+        self.assertEqual(set(["dep_a"]), journal.cloned)
+        self.assertEqual({"dep_c": path.join(self.ws_path, ".dep_c.partial")},
+                         journal.cloning)
+        resumed = self.dependency("dep_a")
+        self.assertTrue(journal.probe_result(resumed))
+        self.assertEqual((URL.format("dep_a"), "a" * 40),
+                         (resumed.url, resumed.sha))
+        for name in ["dep_b", "dep_d", "dep_e"]:
+            self.assertIsNone(journal.probe_result(self.dependency(name)))
+        other_branch = self.dependency("dep_a")
+        other_branch.branch = "devel"
+        self.assertIsNone(journal.probe_result(other_branch))
+        # Records after a torn line are still read.
+        journal.record_cloned("dep_c")
+        self.assertEqual(set(["dep_a", "dep_c"]),
+                         FetchJournal(self.journal_path).cloned)
+        journal.finish()
+        self.assertFalse(path.exists(self.journal_path))
+
+    def test_resume(self):
+        """Test that a rerun skips journaled probes and cleans up."""
+        backend = FakeGitBackend()
+        for name in ["dep_a", "dep_b"]:
+            backend.add_remote(URL.format(name), name)
+        write_package_xml(path.join(self.ws_path, "pkg"), "pkg",
+                          depends=["dep_a", "dep_b"])
+        journal = FetchJournal(self.journal_path)
+        found = self.dependency("dep_a")
+        found.url = URL.format("dep_a")
+        journal.record_probe(found)
+        journal.record_cloning("dep_a", path.join(self.ws_path, "dep_a"))
+        partial = GitBridge.partial_path(path.join(self.ws_path, "dep_a"))
+        os.makedirs(path.join(partial, ".git"))
+        context = MagicMock()
+        context.source_space_abs = self.ws_path
+        error_code = cli.fetch(packages=[],
+                               workspace=self.test_dir,
+                               context=context,
+                               default_urls=set([URL.format("{package}")]),
+                               use_preprint=False,
+                               num_threads=None,
+                               pull_after_fetch=False,
+                               backend=backend,
+                               journal=FetchJournal(self.journal_path))
+        self.assertEqual(0, error_code)
+        self.assertFalse(path.exists(partial))
+        self.assertEqual(["dep_a", "dep_b", "pkg"],
+                         sorted(os.listdir(self.ws_path)))
+        probes = [target for operation, target in backend.calls
+                  if operation == 'probe']
+        self.assertEqual([URL.format("dep_b")], probes)
+        self.assertFalse(path.exists(self.journal_path))
+
+    def test_resume_probes_misses(self):
+        """Test that a rerun probes again what an earlier run missed."""
+        backend = FakeGitBackend(failures={'clone': ["dep_a"]})
+        backend.add_remote(URL.format("dep_a"), "dep_a")
+        write_package_xml(path.join(self.ws_path, "pkg"), "pkg",
+                          depends=["dep_a", "dep_b"])
+        context = MagicMock()
+        context.source_space_abs = self.ws_path
+
+        def fetch():
+            return cli.fetch(packages=[],
+                             workspace=self.test_dir,
+                             context=context,
+                             default_urls=set([URL.format("{package}")]),
+                             use_preprint=False,
+                             num_threads=None,
+                             pull_after_fetch=False,
+                             backend=backend,
+                             journal=FetchJournal(self.journal_path))
+
+        self.assertNotEqual(0, fetch())
+        self.assertEqual(["dep_a"],
+                         sorted(FetchJournal(self.journal_path).probes))
+        backend.failures = {}
+        backend.add_remote(URL.format("dep_b"), "dep_b")
+        self.assertEqual(0, fetch())
+        self.assertEqual(["dep_a", "dep_b", "pkg"],
+                         sorted(os.listdir(self.ws_path)))
+
+    def test_clone_into_place(self):
+        """Test that git clones into a partial folder and renames it."""
+        url = create_remote(self.test_dir, "pkg_a")
+        clone_path = path.join(self.ws_path, "pkg_a")
+        partial = GitBridge.partial_path(clone_path)
+        os.makedirs(partial)
+        with open(path.join(partial, "stale"), "w") as stale_file:
+            stale_file.write("left by a killed clone")
+        _, result = GitBridge.clone("pkg_a", url, clone_path)
+        self.assertEqual(GitBridge.CLONED_TAG.format(branch="master"), result)
+        self.assertFalse(path.exists(partial))
+        self.assertTrue(path.exists(path.join(clone_path, "package.xml")))
+        self.assertFalse(path.exists(path.join(clone_path, "stale")))
+        _, result = GitBridge.clone("pkg_a", url, clone_path)
+        self.assertEqual(GitBridge.EXISTS_TAG, result)
+        missing_path = path.join(self.ws_path, "missing")
+        _, result = GitBridge.clone("missing", url + "_missing", missing_path)
+        self.assertEqual(GitBridge.ERROR_TAG, result)
+        self.assertFalse(path.exists(missing_path))
+        self.assertFalse(path.exists(GitBridge.partial_path(missing_path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,21 @@
+"""Test that the verb descriptors do not import the implementation."""
+import subprocess
+import sys
+import unittest
+
+
+class TestLazyImport(unittest.TestCase):
+    """Test importing the verb descriptors."""
+
+    def test_descriptors_are_cheap(self):
+        """Test that heavy modules are not loaded with the descriptors."""
+        code = """
+import sys
+import catkin_tools_fetch
+assert catkin_tools_fetch.description_deps['main']
+heavy = ['catkin_tools_fetch.cli', 'catkin_pkg', 'catkin_tools.context',
+         'termcolor']
+loaded = [name for name in heavy if name in sys.modules]
+assert not loaded, loaded
+"""
+        subprocess.check_call([sys.executable, '-c', code])
@@ -0,0 +1,98 @@
+"""Test git maintenance of the workspace repositories."""
+import os
+import unittest
+import tempfile
+import shutil
+from os import path
+from mock import MagicMock
+from catkin_tools_fetch.lib.fake_backend import FakeGitBackend
+from catkin_tools_fetch.lib.maintenance import Maintainer
+from catkin_tools_fetch.lib.tools import Tools
+from tests.local_repos import create_remote
+from tests.local_repos import git
+
+
+def make_package(name):
+    """Create a mock package with a name."""
+    package = MagicMock()
+    package.name = name
+    return package
+
+
+class TestMaintainer(unittest.TestCase):
+    """Test the maintainer."""
+
+    def setUp(self):
+        """Create a workspace."""
+        self.test_dir = tempfile.mkdtemp()
+        self.ws_path = path.join(self.test_dir, "src")
+        os.makedirs(self.ws_path)
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    def test_parse_tasks(self):
+        """Test parsing the tasks given by the user."""
+        self.assertEqual([], Maintainer.parse_tasks(""))
+        self.assertEqual(["prefetch", "commit-graph"],
+                         Maintainer.parse_tasks("prefetch, commit-graph"))
+        self.assertRaises(ValueError, Maintainer.parse_tasks, "gc,blah")
+
+    def test_repo_root(self):
+        """Test that packages inside one repo map to the same root."""
+        repo = path.join(self.ws_path, "repo")
+        os.makedirs(path.join(repo, ".git"))
+        os.makedirs(path.join(repo, "pkg_a"))
+        os.makedirs(path.join(self.test_dir, "src2", "pkg"))
+        self.assertEqual(repo, Tools.repo_root(
+            path.join(repo, "pkg_a"), self.ws_path))
+        self.assertIsNone(Tools.repo_root(
+            path.join(self.test_dir, "src2", "pkg"), self.ws_path))
+        packages = {"repo/pkg_a": make_package("pkg_a"),
+                    "repo/pkg_b": make_package("pkg_b"),
+                    "../src2/pkg": make_package("pkg")}
+        maintainer = Maintainer(self.ws_path, packages)
+        self.assertEqual({repo: ["pkg_a", "pkg_b"]},
+                         maintainer.find_repos([]))
+        self.assertEqual({repo: ["pkg_b"]}, maintainer.find_repos(["pkg_b"]))
+
+    def test_maintain_with_git(self):
+        """Test running the default tasks with git."""
+        remote = create_remote(self.test_dir, "pkg")
+        git(["clone", "-q", remote, path.join(self.ws_path, "pkg")])
+        maintainer = Maintainer(self.ws_path, {"pkg": make_package("pkg")},
+                                use_preprint=False)
+        results = maintainer.maintain_packages([])
+        self.assertEqual(1, len(results))
+        name, failed, before, after = results[0]
+        self.assertEqual("pkg", name)
+        self.assertEqual([], failed)
+        self.assertIsNotNone(before)
+        self.assertIsNotNone(after)
+        self.assertTrue(path.exists(path.join(
+            self.ws_path, "pkg", ".git", "objects", "info", "commit-graphs")))
+
+    def test_failed_tasks(self):
+        """Test that failed tasks are reported and others still run."""
+        repo = path.join(self.ws_path, "pkg")
+        os.makedirs(path.join(repo, ".git"))
+        backend = FakeGitBackend(failures={'maintain': ["prefetch"]})
+        maintainer = Maintainer(self.ws_path, {"pkg": make_package("pkg")},
+                                use_preprint=False, backend=backend)
+        results = maintainer.maintain_packages([])
+        self.assertEqual([("pkg", ["prefetch"])],
+                         [(name, failed) for name, failed, _, _ in results])
+        self.assertEqual(["commit-graph", "loose-objects",
+                          "incremental-repack"],
+                         backend.clones[repo]["maintained"])
+        self.assertEqual(0.0, Maintainer.report_status_times([]))
+
+    def test_report_status_times(self):
+        """Test that only changes beyond the noise count as faster."""
+        self.assertEqual(0.0, Maintainer.report_status_times(
+            [("a", [], 0.100, 0.095), ("b", [], None, 0.01)]))
+        self.assertEqual(0.0, Maintainer.report_status_times(
+            [("a", [], 0.100, 0.120)]))
+        self.assertAlmostEqual(0.06, Maintainer.report_status_times(
+            [("a", [], 0.100, 0.050), ("b", [], 0.020, 0.010)]))
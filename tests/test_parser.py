@@ -1,9 +1,13 @@
 """Module to test the parser and dependencies."""
 import unittest
 import logging
+import tempfile
+import shutil
 from os import path
 from catkin_tools_fetch.lib.dependency_parser import Parser
 from catkin_tools_fetch.lib.dependency_parser import Dependency
+from catkin_tools_fetch.lib.session import Session
+from tests.local_repos import write_package_xml
 
 log = logging.getLogger('deps')
 
@@ -49,6 +53,101 @@ class TestParser(unittest.TestCase):
         self.assertIn("http_link_default_2/dep_3", deps["dep_3"].default_urls)
         self.assertIsNone(deps["dep_3"].branch)
 
+    def test_get_package_name(self):
+        """Test reading the package name."""
+        xml_path = path.join(
+            path.dirname(__file__), "data", "simple_pkg", "package.xml")
+        self.assertEqual("simple_pkg", Parser.get_package_name(xml_path))
+        self.assertIsNone(Parser.get_package_name("missing.xml"))
+
+    def test_profiles(self):
+        """Test that profiles pick the right dependency tags."""
+        test_dir = tempfile.mkdtemp()
+        try:
+            folder = path.join(test_dir, "pkg")
+            write_package_xml(folder, "pkg")
+            with open(path.join(folder, "package.xml")) as xml_file:
+                xml = xml_file.read()
+            xml = xml.replace("<export>", "\n".join([
+                "<build_depend>build_dep</build_depend>",
+                "<exec_depend>exec_dep</exec_depend>",
+                "<run_depend>run_dep</run_depend>",
+                "<test_depend>test_dep</test_depend>",
+                "<doc_depend>doc_dep</doc_depend>",
+                "<depend>common_dep</depend>",
+                "<export>"]))
+            with open(path.join(folder, "package.xml"), "w") as xml_file:
+                xml_file.write(xml)
+            expected = {
+                'build': ["build_dep", "common_dep"],
+                'exec': ["common_dep", "exec_dep", "run_dep"],
+                'test': ["build_dep", "common_dep", "exec_dep", "run_dep",
+                         "test_dep"],
+                'doc': ["build_dep", "common_dep", "doc_dep"],
+                'full': ["build_dep", "catkin", "common_dep", "doc_dep",
+                         "exec_dep", "run_dep", "test_dep"],
+            }
+            for profile, deps in expected.items():
+                parser = Parser(set(), "pkg", tags=Parser.PROFILES[profile])
+                self.assertEqual(deps,
+                                 sorted(parser.get_dependencies(folder)))
+        finally:
+            shutil.rmtree(test_dir)
+
+    def test_explicit_url_outside_profile(self):
+        """Test that a git_url of a dependency outside the profile is ok."""
+        test_dir = tempfile.mkdtemp()
+        try:
+            folder = path.join(test_dir, "pkg")
+            write_package_xml(folder, "pkg", ["build_dep"], [
+                '<git_url target="build_dep" url="http_build" '
+                'branch="dev" />'])
+            parser = Parser(set(), "pkg", tags=Parser.PROFILES['exec'])
+            self.assertEqual({}, parser.get_dependencies(folder))
+            parser = Parser(set(), "pkg", tags=Parser.PROFILES['build'])
+            deps = parser.get_dependencies(folder)
+            self.assertEqual("http_build", deps["build_dep"].url)
+            self.assertEqual("dev", deps["build_dep"].branch)
+        finally:
+            shutil.rmtree(test_dir)
+
+    def test_parse_packages(self):
+        """Test parallel parsing keeps the serial semantics."""
+        test_dir = tempfile.mkdtemp()
+        try:
+            packages = []
+            for name, url in [("c", "http_c"), ("a", "http_a"), ("b", None)]:
+                exports = []
+                if url:
+                    exports = ['<git_url target="all" url="{}"/>'.format(url)]
+                folder = path.join(test_dir, name)
+                write_package_xml(folder, name, ["dep_" + name], exports)
+                packages.append((name, folder))
+            for threshold in [Parser.PROCESS_POOL_THRESHOLD, 0]:
+                old_threshold = Parser.PROCESS_POOL_THRESHOLD
+                Parser.PROCESS_POOL_THRESHOLD = threshold
+                default_urls = set(["{package}"])
+                try:
+                    with Session() as session:
+                        parsed = Parser.parse_packages(packages, default_urls,
+                                                       session=session)
+                finally:
+                    Parser.PROCESS_POOL_THRESHOLD = old_threshold
+                self.assertEqual(["a", "b", "c"],
+                                 [name for name, _ in parsed])
+                deps = dict(parsed)
+                self.assertEqual(["http_a/dep_a", "dep_a"],
+                                 deps["a"]["dep_a"].default_urls)
+                # b comes after a, so it sees a's url but not c's.
+                self.assertEqual(["http_a/dep_b", "dep_b"],
+                                 deps["b"]["dep_b"].default_urls)
+                self.assertEqual(3, len(deps["c"]["dep_c"].default_urls))
+                self.assertEqual(
+                    set(["{package}", "http_a/{package}", "http_c/{package}"]),
+                    default_urls)
+        finally:
+            shutil.rmtree(test_dir)
+
 
 class TestDependency(unittest.TestCase):
     """Testing the dependency class."""
@@ -0,0 +1,71 @@
+"""Test parsing of the clone progress."""
+import unittest
+import tempfile
+import shutil
+from os import path
+from catkin_tools_fetch.lib.progress import CloneProgress
+from catkin_tools_fetch.lib.downloader import Downloader
+from catkin_tools_fetch.lib.dependency_parser import Dependency
+from tests.local_repos import create_remote
+
+
+class TestCloneProgress(unittest.TestCase):
+    """Test the clone progress."""
+
+    def test_update_receiving(self):
+        """Test parsing of the receiving line."""
+        progress = CloneProgress("pkg", now=0)
+        line = "Receiving objects:  45% (450/1000), 1.50 MiB | 512.00 KiB/s"
+        self.assertTrue(progress.update(line, now=1))
+        self.assertEqual(CloneProgress.RECEIVING_PHASE, progress.phase)
+        self.assertEqual(45, progress.percent)
+        self.assertEqual(450, progress.objects)
+        self.assertEqual(1000, progress.total_objects)
+        self.assertEqual(int(1.5 * 1024 * 1024), progress.received_bytes)
+        self.assertEqual(512 * 1024, progress.throughput)
+        self.assertEqual("450/1000 objects, 1.5 MiB, 512.0 KiB/s",
+                         str(progress))
+        self.assertFalse(progress.update(line, now=2))
+        self.assertEqual(1, progress.last_change)
+
+    def test_update_other_lines(self):
+        """Test that other phases are tracked and noise is ignored."""
+        progress = CloneProgress("pkg", now=0)
+        self.assertFalse(progress.update("Cloning into 'pkg'...", now=1))
+        self.assertTrue(progress.update(
+            "remote: Counting objects: 100% (5/5), done.", now=1))
+        self.assertEqual("Counting objects: 100%", str(progress))
+
+    def test_stalled(self):
+        """Test stall detection."""
+        progress = CloneProgress("pkg", now=0)
+        self.assertFalse(progress.is_stalled(10, now=5))
+        self.assertTrue(progress.is_stalled(10, now=11))
+        progress.finish(now=12)
+        self.assertFalse(progress.is_stalled(10, now=100))
+        self.assertEqual(12, progress.duration())
+
+    def test_format_bytes(self):
+        """Test formatting the bytes."""
+        self.assertEqual("12 bytes", CloneProgress.format_bytes(12))
+        self.assertEqual("2.0 KiB", CloneProgress.format_bytes(2048))
+        self.assertEqual("3.00 GiB", CloneProgress.format_bytes(3 * 1024 ** 3))
+
+    def test_downloader_progress(self):
+        """Test that the downloader exposes the progress of clones."""
+        test_dir = tempfile.mkdtemp()
+        try:
+            remote = create_remote(test_dir, "pkg")
+            reports = []
+            downloader = Downloader(test_dir, [], [], use_preprint=False,
+                                    progress_callback=reports.append)
+            dep_dict = {"pkg": Dependency(name="pkg", url="file://" + remote)}
+            self.assertEqual(0, downloader.download_dependencies(dep_dict))
+            self.assertTrue(path.exists(path.join(test_dir, "pkg")))
+            progress = downloader.progress["pkg"]
+            self.assertIsNotNone(progress.finished)
+            self.assertTrue(reports)
+            self.assertEqual(progress.total_objects, progress.objects)
+            self.assertGreater(progress.received_bytes, 0)
+        finally:
+            shutil.rmtree(test_dir)
@@ -0,0 +1,185 @@
+"""Test importing and exporting vcstool `.repos` files."""
+import os
+import shutil
+import tempfile
+import unittest
+from os import path
+from mock import MagicMock
+from catkin_tools_fetch import cli
+from catkin_tools_fetch.lib.fake_backend import FakeGitBackend
+from catkin_tools_fetch.lib.repos_file import ReposFile
+from catkin_tools_fetch.lib.tools import GitBridge
+from tests.local_repos import create_remote
+from tests.local_repos import git
+from tests.local_repos import write_package_xml
+
+REPOS = """repositories:
+  group/pkg_a:
+    type: git
+    url: fake://pkg_a
+    version: devel
+  pkg_b:
+    type: git
+    url: fake://pkg_b
+  pinned:
+    type: git
+    url: fake://pinned
+    version: {sha}
+  svn_repo:
+    type: svn
+    url: svn://svn_repo
+"""
+SHA = "a" * 40
+
+
+class TestReposFile(unittest.TestCase):
+    """Test the `.repos` files."""
+
+    def setUp(self):
+        """Create a workspace and fake remotes."""
+        self.test_dir = tempfile.mkdtemp()
+        self.ws_path = path.join(self.test_dir, "src")
+        os.makedirs(self.ws_path)
+        self.repos_path = path.join(self.test_dir, "deps.repos")
+        with open(self.repos_path, "w") as repos_file:
+            repos_file.write(REPOS.format(sha=SHA))
+        self.backend = FakeGitBackend()
+        self.backend.add_remote("fake://pkg_a", "pkg_a",
+                                branches=["master", "devel"])
+        self.backend.add_remote("fake://pkg_b", "pkg_b")
+        self.backend.add_remote("fake://pinned", "pinned")
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    def write(self, text):
+        """Write another `.repos` file."""
+        with open(self.repos_path, "w") as repos_file:
+            repos_file.write(text)
+
+    def test_load(self):
+        """Test reading repositories and skipping other types."""
+        repositories = ReposFile.load(self.repos_path).repositories
+        self.assertEqual(["group/pkg_a", "pinned", "pkg_b"],
+                         sorted(repositories))
+        self.assertEqual({'type': 'git', 'url': 'fake://pkg_a',
+                          'version': 'devel'}, repositories["group/pkg_a"])
+        self.assertIsNone(repositories["pkg_b"]["version"])
+        self.assertEqual(SHA, repositories["pinned"]["version"])
+
+    def test_load_errors(self):
+        """Test that malformed files are reported."""
+        self.assertRaises(ValueError, ReposFile.load,
+                          path.join(self.test_dir, "missing.repos"))
+        self.write("repositories: [a, b]\n")
+        self.assertRaises(ValueError, ReposFile.load, self.repos_path)
+        self.write("repositories:\n  pkg:\n    type: git\n")
+        self.assertRaises(ValueError, ReposFile.load, self.repos_path)
+        self.write("repositories:\n  ../pkg:\n    url: fake://pkg\n")
+        self.assertRaises(ValueError, ReposFile.load, self.repos_path)
+
+    def test_fetch_repos(self):
+        """Test cloning missing repositories and pulling existing ones."""
+        existing = path.join(self.ws_path, "pkg_b")
+        os.makedirs(existing)
+        code = cli.fetch_repos(repos_path=self.repos_path,
+                               workspace=self.test_dir,
+                               use_preprint=False,
+                               num_threads=None,
+                               pull_after_fetch=True,
+                               backend=self.backend)
+        self.assertEqual(0, code)
+        self.assertTrue(path.exists(
+            path.join(self.ws_path, "group", "pkg_a", "package.xml")))
+        self.assertEqual("devel", self.backend.clones[
+            path.join(self.ws_path, "group", "pkg_a")]["branch"])
+        self.assertEqual(SHA, self.backend.clones[
+            path.join(self.ws_path, "pinned")]["branch"])
+        operations = [operation for operation, _ in self.backend.calls]
+        self.assertNotIn("probe", operations)
+        self.assertEqual(2, operations.count("clone"))
+        self.assertEqual([("pull", existing)],
+                         [call for call in self.backend.calls
+                          if call[0] == "pull"])
+
+    def test_fetch_repos_default_branch(self):
+        """Test that an entry without a version clones the default branch."""
+        self.backend.add_remote("fake://pkg_b", "pkg_b", branches=["main"])
+        code = cli.fetch_repos(repos_path=self.repos_path,
+                               workspace=self.test_dir,
+                               use_preprint=False,
+                               num_threads=None,
+                               pull_after_fetch=False,
+                               backend=self.backend)
+        self.assertEqual(0, code)
+        self.assertEqual("main", self.backend.clones[
+            path.join(self.ws_path, "pkg_b")]["branch"])
+        remote = create_remote(self.test_dir, "pkg_c", branches=["main"])
+        git(["symbolic-ref", "HEAD", "refs/heads/main"], cwd=remote)
+        git(["branch", "-D", "master"], cwd=remote)
+        self.write("repositories:\n  pkg_c:\n    type: git\n"
+                   "    url: {}\n".format(remote))
+        code = cli.fetch_repos(repos_path=self.repos_path,
+                               workspace=self.test_dir,
+                               use_preprint=False,
+                               num_threads=None,
+                               pull_after_fetch=False)
+        self.assertEqual(0, code)
+        self.assertEqual("main", GitBridge.head(
+            path.join(self.ws_path, "pkg_c"))[0])
+
+    def test_fetch_repos_error(self):
+        """Test that a failed clone is reported."""
+        self.backend.failures = {"clone": set(["fake://pkg_b"])}
+        code = cli.fetch_repos(repos_path=self.repos_path,
+                               workspace=self.test_dir,
+                               use_preprint=False,
+                               num_threads=None,
+                               pull_after_fetch=False,
+                               backend=self.backend)
+        self.assertEqual(1, code)
+        self.assertEqual(1, cli.fetch_repos(
+            repos_path=path.join(self.test_dir, "missing.repos"),
+            workspace=self.test_dir, use_preprint=False, num_threads=None,
+            pull_after_fetch=False, backend=self.backend))
+
+    def test_export_round_trip(self):
+        """Test that an export can be fetched again."""
+        cli.fetch_repos(repos_path=self.repos_path,
+                        workspace=self.test_dir,
+                        use_preprint=False,
+                        num_threads=None,
+                        pull_after_fetch=False,
+                        backend=self.backend)
+        for name in ["pkg_a", "pkg_b", "pinned"]:
+            folder = path.join(self.ws_path, name)
+            if not path.exists(folder):
+                folder = path.join(self.ws_path, "group", name)
+            os.makedirs(path.join(folder, ".git"))
+            write_package_xml(folder, name)
+        context = MagicMock()
+        context.source_space_abs = self.ws_path
+        export_path = path.join(self.test_dir, "export.repos")
+        code = cli.export(packages=[], workspace=self.test_dir,
+                          context=context, repos_path=export_path,
+                          backend=self.backend)
+        self.assertEqual(0, code)
+        repositories = ReposFile.load(export_path).repositories
+        self.assertEqual(["group/pkg_a", "pinned", "pkg_b"],
+                         sorted(repositories))
+        self.assertEqual("devel", repositories["group/pkg_a"]["version"])
+        self.assertEqual("fake://pkg_a", repositories["group/pkg_a"]["url"])
+        self.assertEqual(SHA, repositories["pinned"]["version"])
+        cli.export(packages=["pkg_b"], workspace=self.test_dir,
+                   context=context, repos_path=export_path, exact=True,
+                   backend=self.backend)
+        repositories = ReposFile.load(export_path).repositories
+        self.assertEqual(["pkg_b"], list(repositories))
+        self.assertEqual(
+            FakeGitBackend.sha("fake://pkg_b", "master", 0),
+            repositories["pkg_b"]["version"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""Test the index of rosdep keys."""
+import os
+import gzip
+import json
+import pickle
+import unittest
+import tempfile
+import shutil
+from os import path
+from catkin_tools_fetch.lib.rosdep_index import RosdepIndex
+from catkin_tools_fetch.lib.downloader import Downloader
+from catkin_tools_fetch.lib.dependency_parser import Dependency
+from tests.local_repos import create_remote
+from tests.local_repos import remote_template
+
+
+class TestRosdepIndex(unittest.TestCase):
+    """Test the rosdep index."""
+
+    def setUp(self):
+        """Create a fake rosdep cache."""
+        self.test_dir = tempfile.mkdtemp()
+        self.sources_cache = path.join(self.test_dir, "sources.cache")
+        self.index_path = path.join(self.test_dir, "keys.json")
+        os.makedirs(self.sources_cache)
+        with open(path.join(self.sources_cache, "index"), "w") as index:
+            index.write("yaml https://example.com/base.yaml\n")
+        with open(path.join(self.sources_cache, "a.pickle"), "wb") as data:
+            pickle.dump({"boost": {"ubuntu": ["libboost-all-dev"]}}, data, 2)
+        with gzip.open(path.join(self.sources_cache, "b.pickle.gz"),
+                       "wb") as data:
+            pickle.dump({"python-numpy": {}, "eigen": {}}, data, 2)
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    def test_read_sources(self):
+        """Test reading keys from the rosdep cache."""
+        keys = RosdepIndex.read_sources(self.sources_cache)
+        self.assertEqual(set(["boost", "python-numpy", "eigen"]), keys)
+
+    def test_load_uses_cache(self):
+        """Test that keys are read again only if rosdep cache changed."""
+        index = RosdepIndex.load(self.sources_cache, self.index_path)
+        self.assertIn("boost", index)
+        self.assertEqual(3, len(index))
+        with open(self.index_path) as index_file:
+            cached = json.load(index_file)
+        cached["keys"].append("from_cache")
+        with open(self.index_path, "w") as index_file:
+            json.dump(cached, index_file)
+        index = RosdepIndex.load(self.sources_cache, self.index_path)
+        self.assertIn("from_cache", index)
+        # Touch the rosdep cache: the index must be rebuilt.
+        file_path = path.join(self.sources_cache, "a.pickle")
+        os.utime(file_path, (1, cached["mtime"] + 10))
+        index = RosdepIndex.load(self.sources_cache, self.index_path)
+        self.assertNotIn("from_cache", index)
+
+    def test_load_no_cache(self):
+        """Test that missing rosdep cache gives an empty index."""
+        index = RosdepIndex.load(path.join(self.test_dir, "missing"),
+                                 self.index_path)
+        self.assertEqual(0, len(index))
+
+    def test_system_deps_not_probed(self):
+        """Test that the downloader does not probe system dependencies."""
+        index = RosdepIndex.load(self.sources_cache, self.index_path)
+        ws_path = path.join(self.test_dir, "ws")
+        os.makedirs(ws_path)
+        downloader = Downloader(ws_path, [], [], use_preprint=False,
+                                system_pkgs=index)
+        # Even if a repository exists, a system dependency is not probed.
+        create_remote(self.test_dir, "boost")
+        boost = Dependency(name="boost")
+        boost.set_default_urls_if_needed(
+            set([remote_template(self.test_dir)]))
+        self.assertEqual(0, downloader.download_dependencies(
+            {"boost": boost}))
+        self.assertIsNone(boost.url)
+        self.assertFalse(path.exists(path.join(ws_path, "boost")))
@@ -0,0 +1,74 @@
+"""Test ordering of the clones."""
+import json
+import unittest
+import tempfile
+import shutil
+from os import path
+from catkin_tools_fetch.lib.scheduler import CloneScheduler
+from catkin_tools_fetch.lib.downloader import Downloader
+from catkin_tools_fetch.lib.dependency_parser import Dependency
+from tests.local_repos import create_remote
+
+
+class TestCloneScheduler(unittest.TestCase):
+    """Test the clone scheduler."""
+
+    def setUp(self):
+        """Create a temporary directory."""
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    def test_order_by_size(self):
+        """Test that big repositories go first, ties sorted by name."""
+        scheduler = CloneScheduler(size_hints={"big": 10 ** 9})
+        self.assertEqual(["big", "a", "b"],
+                         scheduler.order(["b", "a", "big"]))
+
+    def test_order_by_chain(self):
+        """Test that a repository that unblocks a long chain goes first."""
+        scheduler = CloneScheduler(size_hints={"leaf": 10 ** 9,
+                                               "medium": 10 ** 8})
+        scheduler.record_dependencies("root", ["leaf"])
+        self.assertEqual(["root", "medium"],
+                         scheduler.order(["medium", "root"]))
+        # Cycles must not hang the scheduler.
+        scheduler.record_dependencies("leaf", ["root"])
+        self.assertEqual(3, len(scheduler.order(["medium", "root", "leaf"])))
+
+    def test_size_hints_file(self):
+        """Test reading user hints in MiB."""
+        hints_file = path.join(self.test_dir, "hints.json")
+        with open(hints_file, "w") as hints:
+            json.dump({"pkg": 2}, hints)
+        self.assertEqual({"pkg": 2 * 1024 * 1024},
+                         CloneScheduler.load_size_hints(hints_file))
+        self.assertEqual({}, CloneScheduler.load_size_hints("missing"))
+
+    def test_size_hints_file_bad_entries(self):
+        """Test that hints which are not sizes are skipped."""
+        hints_file = path.join(self.test_dir, "hints.json")
+        with open(hints_file, "w") as hints:
+            json.dump({"pkg": 2, "text": "1.5", "big": "big", "none": None,
+                       "list": [1], "negative": -1, "flag": True,
+                       "huge": "inf"}, hints)
+        self.assertEqual({"pkg": 2 * 1024 * 1024,
+                          "text": int(1.5 * 1024 * 1024)},
+                         CloneScheduler.load_size_hints(hints_file))
+
+    def test_learn_size_from_clone(self):
+        """Test that the downloader records the size of a clone."""
+        remote = create_remote(self.test_dir, "pkg")
+        hints_path = path.join(self.test_dir, "hints.json")
+        scheduler = CloneScheduler(hints_path=hints_path)
+        downloader = Downloader(self.test_dir, [], [], use_preprint=False,
+                                scheduler=scheduler)
+        dep_dict = {"pkg": Dependency(name="pkg", url=remote)}
+        self.assertEqual(0, downloader.download_dependencies(dep_dict))
+        self.assertTrue(path.isdir(path.join(self.test_dir, "pkg")))
+        self.assertTrue(scheduler.save())
+        learned = CloneScheduler(hints_path=hints_path).size("pkg")
+        self.assertNotEqual(CloneScheduler.DEFAULT_SIZE, learned)
+        self.assertGreater(learned, 0)
@@ -0,0 +1,130 @@
+"""Test the resources shared by one verb invocation."""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from os import path
+from mock import MagicMock
+from mock import patch
+from catkin_tools_fetch import cli
+from catkin_tools_fetch.lib.dependency_parser import Dependency
+from catkin_tools_fetch.lib.downloader import Downloader
+from catkin_tools_fetch.lib.fake_backend import FakeGitBackend
+from catkin_tools_fetch.lib.maintenance import Maintainer
+from catkin_tools_fetch.lib.repos_file import ReposFile
+from catkin_tools_fetch.lib.session import Session
+from catkin_tools_fetch.lib.update import Updater
+from tests.local_repos import write_package_xml
+
+URL = "fake://{}"
+
+
+class TestSession(unittest.TestCase):
+    """Test the session."""
+
+    def setUp(self):
+        """Create a workspace."""
+        self.test_dir = tempfile.mkdtemp()
+        self.ws_path = path.join(self.test_dir, "src")
+        os.makedirs(self.ws_path)
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    def test_shared_resources(self):
+        """Test that downloaders and updaters borrow from the session."""
+        with Session(2) as session:
+            self.assertEqual(2 * len(Session.PHASES),
+                             session.thread_pool._max_workers)
+            downloader = Downloader(self.ws_path, [], set(),
+                                    use_preprint=False, session=session)
+            updater = Updater(self.ws_path, {}, use_preprint=False,
+                              session=session)
+            self.assertIs(session, downloader.session)
+            self.assertIs(session, updater.session)
+            self.assertIs(session.printer, downloader.printer)
+            self.assertIs(session.printer, updater.printer)
+        self.assertRaises(RuntimeError, session.thread_pool.submit, len, [])
+
+    def test_borrow(self):
+        """Test that only a session made for the block is closed."""
+        with Session() as session:
+            with Session.borrow(session) as borrowed:
+                self.assertIs(session, borrowed)
+            self.assertEqual(0, session.thread_pool.submit(len, []).result())
+            with Session.borrow(None, 3) as own:
+                self.assertIsNot(session, own)
+                self.assertEqual(3, own.limiters['probe'].ceiling)
+            self.assertRaises(RuntimeError, own.thread_pool.submit, len, [])
+
+    @patch("catkin_tools_fetch.lib.session.RosdepIndex")
+    @patch("catkin_tools_fetch.lib.session.Tools")
+    def test_caches(self, tools, rosdep_index):
+        """Test that ROS packages and rosdep keys are loaded once."""
+        tools.list_all_ros_pkgs.return_value = set(["roscpp"])
+        rosdep_index.load.return_value = set(["boost"])
+        with Session() as session:
+            for _ in range(3):
+                self.assertEqual(set(["roscpp"]), session.ignore_pkgs)
+                self.assertEqual(set(["boost"]), session.system_pkgs)
+        self.assertEqual(1, tools.list_all_ros_pkgs.call_count)
+        self.assertEqual(1, rosdep_index.load.call_count)
+
+    def test_own_sessions_leave_no_threads(self):
+        """Test that objects without a session close the one they use."""
+        backend = FakeGitBackend()
+        backend.add_remote(URL.format("dep_a"), "dep_a")
+        folder = path.join(self.ws_path, "dep_a")
+        backend.clone("dep_a", URL.format("dep_a"), folder)
+        os.makedirs(path.join(folder, ".git"))
+        write_package_xml(path.join(self.ws_path, "pkg"), "pkg",
+                          depends=["dep_a"])
+        packages = {"dep_a": Dependency("dep_a", url=URL.format("dep_a"))}
+        threads_before = threading.active_count()
+        downloader = Downloader(self.ws_path, ["pkg"], set(),
+                                use_preprint=False, backend=backend)
+        self.assertEqual(0, downloader.download_dependencies(
+            {"dep_b": Dependency("dep_b", url=URL.format("dep_a"))}))
+        self.assertEqual(0, downloader.clone_dependencies(
+            {"dep_c": Dependency("dep_c", url=URL.format("dep_a"))}))
+        updater = Updater(self.ws_path, packages, use_preprint=False,
+                          colored=False, backend=backend)
+        for _ in range(2):
+            self.assertEqual([("dep_a", Updater.UP_TO_DATE_TAG)],
+                             updater.update_packages([]))
+        maintainer = Maintainer(self.ws_path, {"dep_a": packages["dep_a"]},
+                                use_preprint=False, backend=backend)
+        self.assertEqual(1, len(maintainer.maintain_packages([])))
+        self.assertEqual(threads_before, threading.active_count())
+        repos = ReposFile.from_workspace(self.ws_path, [folder],
+                                         backend=backend)
+        self.assertEqual(["dep_a"], list(repos.repositories))
+
+    def test_fetch_leaves_no_threads(self):
+        """Test that all rounds of fetch share one pool and close it."""
+        backend = FakeGitBackend()
+        backend.add_remote(URL.format("dep_a"), "dep_a", depends=["dep_b"])
+        backend.add_remote(URL.format("dep_b"), "dep_b")
+        write_package_xml(path.join(self.ws_path, "pkg"), "pkg",
+                          depends=["dep_a"])
+        context = MagicMock()
+        context.source_space_abs = self.ws_path
+        threads_before = threading.active_count()
+        error_code = cli.fetch(packages=[],
+                               workspace=self.test_dir,
+                               context=context,
+                               default_urls=set([URL.format("{package}")]),
+                               use_preprint=False,
+                               num_threads=None,
+                               pull_after_fetch=True,
+                               backend=backend)
+        self.assertEqual(0, error_code)
+        self.assertEqual(["dep_a", "dep_b", "pkg"],
+                         sorted(os.listdir(self.ws_path)))
+        self.assertEqual(threads_before, threading.active_count())
+
+
+if __name__ == '__main__':
+    unittest.main()
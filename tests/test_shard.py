@@ -0,0 +1,213 @@
+"""Test fetching shards on several machines and merging them."""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+from os import path
+from catkin_tools_fetch import cli
+from catkin_tools_fetch.lib.fake_backend import FakeGitBackend
+from catkin_tools_fetch.lib.repos_file import ReposFile
+from catkin_tools_fetch.lib.scheduler import CloneScheduler
+from catkin_tools_fetch.lib.shard import Shard
+from catkin_tools_fetch.lib.tools import GitBridge
+from tests.local_repos import create_remote
+from tests.local_repos import GIT_ENV
+
+REPO_TEMPLATE = """  {name}:
+    type: git
+    url: {url}
+"""
+
+FETCH_SHARD = """
+import sys
+from catkin_tools_fetch import cli
+sys.exit(cli.fetch_repos(repos_path=sys.argv[1], workspace=sys.argv[2],
+                         use_preprint=False, num_threads=None,
+                         pull_after_fetch=False, shard=(int(sys.argv[3]), 2),
+                         bundle_dir=sys.argv[4]))
+"""
+
+
+class TestShard(unittest.TestCase):
+    """Test sharded fetches."""
+
+    def setUp(self):
+        """Create a folder for workspaces and bundles."""
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    def write_repos(self, urls):
+        """Write a `.repos` file with {name: url}."""
+        repos_path = path.join(self.test_dir, "deps.repos")
+        with open(repos_path, "w") as repos_file:
+            repos_file.write("repositories:\n")
+            for name, url in sorted(urls.items()):
+                repos_file.write(REPO_TEMPLATE.format(name=name, url=url))
+        return repos_path
+
+    def workspace(self, name):
+        """Create an empty workspace."""
+        workspace = path.join(self.test_dir, name)
+        os.makedirs(path.join(workspace, "src"))
+        return workspace
+
+    def test_parse_spec(self):
+        """Test reading `index/count`."""
+        self.assertEqual((2, 4), Shard.parse_spec("2/4"))
+        self.assertEqual((1, 1), Shard.parse_spec(" 1/1 "))
+        for spec in ["0/2", "3/2", "1", "a/b", "1/2/3"]:
+            self.assertRaises(ValueError, Shard.parse_spec, spec)
+
+    def test_split(self):
+        """Test that the split is balanced and deterministic."""
+        sizes = {"huge": 100, "big": 60, "medium": 40, "a": 10, "b": 10,
+                 "c": 10, "d": 10}
+        parts = Shard.split(sizes, 2)
+        self.assertEqual([["a", "c", "huge"], ["b", "big", "d", "medium"]],
+                         parts)
+        self.assertEqual([120, 120], [sum(sizes[name] for name in part)
+                                      for part in parts])
+        self.assertEqual(parts, Shard.split(dict(sizes), 2))
+        self.assertEqual([["a", "c"], ["b", "d"]],
+                         Shard.split({"a": 1, "b": 1, "c": 1, "d": 1}, 2))
+        self.assertEqual([["a"], [], []], Shard.split({"a": 1}, 3))
+
+    def test_from_repos(self):
+        """Test that the shards cover all repositories exactly once."""
+        repos_file = ReposFile({
+            name: {'type': 'git', 'url': 'fake://' + name, 'version': None}
+            for name in ["a", "b", "c", "d", "e"]})
+        size_hints = {"a": 50 * 1024 * 1024}
+        shards = [Shard.from_repos(repos_file, i, 3, size_hints=size_hints)
+                  for i in range(1, 4)]
+        self.assertEqual(["a"], sorted(shards[0].repositories))
+        paths = [repo_path for shard in shards
+                 for repo_path in shard.repositories]
+        self.assertEqual(sorted(repos_file.repositories), sorted(paths))
+        self.assertEqual(1, len(set(shard.key for shard in shards)))
+        # Shards split by other sizes get another key.
+        self.assertNotEqual(shards[0].key, Shard.from_repos(
+            repos_file, 1, 3).key)
+
+    def test_learned_sizes_ignored(self):
+        """Test that sizes learned on one machine do not change a split."""
+        backend = FakeGitBackend()
+        urls = {}
+        for name in ["a", "b", "c"]:
+            urls[name] = "fake://" + name
+            backend.add_remote(urls[name], name)
+        repos_path = self.write_repos(urls)
+        bundle_dirs = []
+        for index in [1, 2]:
+            scheduler = CloneScheduler()
+            if index == 2:
+                scheduler.record_size("c", 10 ** 9)
+            bundle_dir = path.join(self.test_dir, "bundles_{}".format(index))
+            self.assertEqual(0, cli.fetch_repos(
+                repos_path=repos_path,
+                workspace=self.workspace("node_{}".format(index)),
+                use_preprint=False, num_threads=None,
+                pull_after_fetch=False, backend=backend, shard=(index, 2),
+                bundle_dir=bundle_dir, scheduler=scheduler))
+            bundle_dirs.append(bundle_dir)
+        cloned = []
+        for index, bundle_dir in enumerate(bundle_dirs, 1):
+            manifest_name = Shard.MANIFEST_NAME.format(index=index, count=2)
+            with open(path.join(bundle_dir, manifest_name)) as manifest:
+                cloned += list(json.load(manifest)["repositories"])
+        self.assertEqual(["a", "b", "c"], sorted(cloned))
+        self.assertEqual(["a", "b", "c"],
+                         sorted(Shard.load_bundles(bundle_dirs)))
+        # A node with other size hints splits differently and is rejected.
+        bundle_dir = path.join(self.test_dir, "bundles_hinted")
+        self.assertEqual(0, cli.fetch_repos(
+            repos_path=repos_path, workspace=self.workspace("node_hinted"),
+            use_preprint=False, num_threads=None, pull_after_fetch=False,
+            backend=backend, shard=(2, 2), bundle_dir=bundle_dir,
+            size_hints={"c": 10 ** 9}))
+        self.assertRaises(ValueError, Shard.load_bundles,
+                          [bundle_dirs[0], bundle_dir])
+
+    def test_fake_shards(self):
+        """Test fetching two shards and merging them with a fake backend."""
+        backend = FakeGitBackend()
+        urls = {}
+        for name in ["a", "b", "c"]:
+            urls[name] = "fake://" + name
+            backend.add_remote(urls[name], name)
+        repos_path = self.write_repos(urls)
+        bundle_dirs = []
+        for index in [1, 2]:
+            bundle_dir = path.join(self.test_dir, "bundles_{}".format(index))
+            code = cli.fetch_repos(repos_path=repos_path,
+                                   workspace=self.workspace(
+                                       "node_{}".format(index)),
+                                   use_preprint=False,
+                                   num_threads=None,
+                                   pull_after_fetch=False,
+                                   backend=backend,
+                                   shard=(index, 2),
+                                   bundle_dir=bundle_dir)
+            self.assertEqual(0, code)
+            bundle_dirs.append(bundle_dir)
+        self.assertEqual(1, cli.merge(bundle_dirs[:1],
+                                      self.workspace("partial"),
+                                      use_preprint=False,
+                                      num_threads=None,
+                                      backend=backend))
+        workspace = self.workspace("merged")
+        self.assertEqual(0, cli.merge(bundle_dirs, workspace,
+                                      use_preprint=False,
+                                      num_threads=None,
+                                      backend=backend))
+        for name in ["a", "b", "c"]:
+            clone_path = path.join(workspace, "src", name)
+            self.assertTrue(path.exists(path.join(clone_path,
+                                                  "package.xml")))
+            self.assertEqual(urls[name], backend.remote_url(clone_path))
+
+    def test_mismatched_shards(self):
+        """Test that shards of different repositories are not merged."""
+        for index, names in [(1, ["a"]), (2, ["b"])]:
+            shard = Shard(index, 2, {}, names, Shard.make_key(names))
+            bundle_dir = path.join(self.test_dir, "bundles")
+            self.assertEqual(0, shard.write_bundles(self.test_dir,
+                                                    bundle_dir))
+        self.assertRaises(ValueError, Shard.load_bundles, [bundle_dir])
+        self.assertRaises(ValueError, Shard.load_bundles,
+                          [path.join(self.test_dir, "missing")])
+
+    def test_processes(self):
+        """Test two shards fetched by two processes from local remotes."""
+        urls = {}
+        for name in ["pkg_a", "pkg_b", "pkg_c"]:
+            urls[name] = create_remote(self.test_dir, name)
+        repos_path = self.write_repos(urls)
+        bundle_dir = path.join(self.test_dir, "bundles")
+        env = dict(GIT_ENV, PYTHONPATH=os.pathsep.join(sys.path))
+        processes = [subprocess.Popen(
+            [sys.executable, "-c", FETCH_SHARD, repos_path,
+             self.workspace("node_{}".format(index)), str(index),
+             bundle_dir], env=env) for index in [1, 2]]
+        self.assertEqual([0, 0], [process.wait() for process in processes])
+        with open(path.join(bundle_dir, "shard_1_of_2.json")) as manifest:
+            self.assertEqual(2, len(json.load(manifest)["repositories"]))
+        workspace = self.workspace("merged")
+        self.assertEqual(0, cli.merge([bundle_dir], workspace,
+                                      use_preprint=False, num_threads=None))
+        for name, url in urls.items():
+            clone_path = path.join(workspace, "src", name)
+            self.assertTrue(path.exists(path.join(clone_path,
+                                                  "package.xml")))
+            self.assertEqual(url, GitBridge.remote_url(clone_path))
+            self.assertEqual("master", GitBridge.head(clone_path)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
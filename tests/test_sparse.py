@@ -0,0 +1,147 @@
+"""Test sparse checkouts of packages inside large repositories."""
+import os
+import shutil
+import tempfile
+import unittest
+from os import path
+from mock import MagicMock
+from catkin_pkg.packages import find_packages
+from catkin_tools_fetch import cli
+from catkin_tools_fetch.lib.dependency_parser import Dependency
+from catkin_tools_fetch.lib.dependency_parser import Parser
+from catkin_tools_fetch.lib.fake_backend import FakeGitBackend
+from catkin_tools_fetch.lib.fake_backend import PACKAGE_XML
+from catkin_tools_fetch.lib.tools import Tools
+from catkin_tools_fetch.lib.update import Updater
+from tests.local_repos import git
+from tests.local_repos import write_package_xml
+
+MONOREPO_PACKAGES = ["pkgs/foo", "pkgs/bar", "tools/baz"]
+
+
+class TestSparse(unittest.TestCase):
+    """Test cloning only the folder of a package."""
+
+    def setUp(self):
+        """Create a workspace."""
+        self.test_dir = tempfile.mkdtemp()
+        self.ws_path = path.join(self.test_dir, "src")
+        os.makedirs(self.ws_path)
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    def create_monorepo(self):
+        """Create a bare repository with several packages in subfolders."""
+        work = path.join(self.test_dir, "work", "monorepo")
+        for package_path in MONOREPO_PACKAGES:
+            write_package_xml(path.join(work, package_path),
+                              path.basename(package_path))
+        with open(path.join(work, "README"), "w") as readme:
+            readme.write("monorepo")
+        git(["init", "-q"], cwd=work)
+        git(["add", "-A"], cwd=work)
+        git(["commit", "-q", "-m", "init"], cwd=work)
+        remote = path.join(self.test_dir, "remotes", "monorepo")
+        git(["clone", "-q", "--bare", work, remote])
+        git(["config", "uploadpack.allowFilter", "true"], cwd=remote)
+        return work, "file://" + remote
+
+    def fetch(self, backend=None):
+        """Fetch the dependencies of the workspace."""
+        context = MagicMock()
+        context.source_space_abs = self.ws_path
+        kwargs = {'backend': backend} if backend else {}
+        return cli.fetch(packages=[],
+                         workspace=self.test_dir,
+                         context=context,
+                         default_urls=set(),
+                         use_preprint=False,
+                         num_threads=None,
+                         pull_after_fetch=False,
+                         **kwargs)
+
+    def test_normalize_subdir(self):
+        """Test that only folders inside the repository are accepted."""
+        self.assertEqual("a/b", Tools.normalize_subdir(" a//b/ "))
+        self.assertEqual("a/b", Tools.normalize_subdir("./a/./b"))
+        self.assertEqual("a/b", Tools.normalize_subdir("a\\b"))
+        for subdir in ["", "/", "/abs", ".", "..", "a/../../b"]:
+            self.assertIsNone(Tools.normalize_subdir(subdir))
+
+    def test_parse_subdir(self):
+        """Test reading the subdir of an explicit url."""
+        folder = path.join(self.ws_path, "pkg")
+        write_package_xml(folder, "pkg", depends=["foo", "bar"], exports=[
+            '<git_url target="foo" url="fake://mono" subdir="pkgs/foo/" />',
+            '<git_url target="bar" url="fake://bar" subdir="../bar" />'])
+        deps = Parser(set(), "pkg", quiet=True).get_dependencies(folder)
+        self.assertEqual("pkgs/foo", deps["foo"].subdir)
+        self.assertIsNone(deps["bar"].subdir)
+        merged = Tools.update_deps_dict(
+            {"foo": Dependency("foo", url="fake://mono")}, deps)
+        self.assertEqual("pkgs/foo", merged["foo"].subdir)
+        self.assertIsNone(Tools.update_deps_dict(
+            merged, {"foo": Dependency("foo", url="fake://mono",
+                                       subdir="pkgs/other")}))
+
+    def test_fake_sparse(self):
+        """Test that the fake backend writes only the sparse files."""
+        backend = FakeGitBackend()
+        backend.add_remote("fake://mono", "mono", files={
+            "README": "monorepo",
+            "pkgs/foo/package.xml": PACKAGE_XML.format(name="foo",
+                                                       depends=""),
+            "pkgs/bar/package.xml": PACKAGE_XML.format(name="bar",
+                                                       depends="")})
+        write_package_xml(path.join(self.ws_path, "pkg"), "pkg",
+                          depends=["foo"], exports=[
+                              '<git_url target="foo" url="fake://mono" '
+                              'subdir="pkgs/foo" />'])
+        self.assertEqual(0, self.fetch(backend))
+        clone_path = path.join(self.ws_path, "foo")
+        self.assertEqual(["README", "pkgs"], sorted(os.listdir(clone_path)))
+        self.assertEqual(["foo"], os.listdir(path.join(clone_path, "pkgs")))
+
+    def test_sparse_clone(self):
+        """Test a blobless sparse clone and an update of it with git."""
+        work, url = self.create_monorepo()
+        write_package_xml(path.join(self.ws_path, "pkg"), "pkg",
+                          depends=["foo"], exports=[
+                              '<git_url target="foo" url="{}" '
+                              'subdir="pkgs/foo" />'.format(url)])
+        self.assertEqual(0, self.fetch())
+        clone_path = path.join(self.ws_path, "foo")
+        self.assertEqual(["pkgs"], [name for name in os.listdir(clone_path)
+                                    if not name.startswith(".") and
+                                    name != "README"])
+        self.assertEqual(["foo"], os.listdir(path.join(clone_path, "pkgs")))
+        self.assertEqual("blob:none", git(
+            ["config", "remote.origin.partialclonefilter"],
+            cwd=clone_path).strip())
+        packages = find_packages(self.ws_path, exclude_subspaces=True,
+                                 warnings=[])
+        self.assertEqual(["foo", "pkg"],
+                         sorted(package.name
+                                for package in packages.values()))
+        self.assertIn(path.join("foo", "pkgs", "foo"), packages)
+        # Changes to other folders stay out of the checkout on update.
+        for package_path in ["pkgs/foo", "pkgs/bar"]:
+            with open(path.join(work, package_path, "CHANGES"), "w") as f:
+                f.write("changed")
+        git(["add", "-A"], cwd=work)
+        git(["commit", "-q", "-m", "change"], cwd=work)
+        git(["push", "-q", url, "master"], cwd=work)
+        updater = Updater(self.ws_path, packages, use_preprint=False,
+                          colored=False)
+        tags = dict(updater.update_packages(["foo"]))
+        self.assertEqual({"foo": Updater.PULLED_TAG}, tags)
+        self.assertTrue(path.exists(path.join(clone_path, "pkgs", "foo",
+                                              "CHANGES")))
+        self.assertEqual(["foo"], os.listdir(path.join(clone_path, "pkgs")))
+        self.assertFalse(path.exists(path.join(clone_path, "tools")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""Module for testing the spawn layer."""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from mock import patch
+
+from catkin_tools_fetch.lib.spawn import Spawner
+
+
+class TestSpawner(unittest.TestCase):
+    """Test running commands without a shell."""
+
+    def setUp(self):
+        """Create a temporary directory."""
+        self.test_dir = tempfile.mkdtemp()
+        self.use_posix_spawn = Spawner.USE_POSIX_SPAWN
+        self.python2 = Spawner.PYTHON2
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+        Spawner.USE_POSIX_SPAWN = self.use_posix_spawn
+        Spawner.PYTHON2 = self.python2
+
+    def check_run(self):
+        """Check exit codes and separate output streams."""
+        result = Spawner.run(
+            ["sh", "-c", "echo out; echo err >&2; exit 3"])
+        self.assertEqual(3, result.returncode)
+        self.assertEqual(b"out\n", result.stdout)
+        self.assertEqual(b"err\n", result.stderr)
+        self.assertEqual(b"out\nerr\n", result.output)
+        self.assertFalse(result.ok)
+        self.assertFalse(result.timed_out)
+        result = Spawner.run(["sh", "-c", "echo $SPAWN_VAR"],
+                             env={"SPAWN_VAR": "value"})
+        self.assertTrue(result.ok)
+        self.assertEqual(b"value\n", result.stdout)
+        result = Spawner.run(["pwd"], cwd=self.test_dir)
+        self.assertEqual(os.path.realpath(self.test_dir),
+                         result.stdout.decode("utf-8").strip())
+
+    def test_run_posix_spawn(self):
+        """Test running with posix_spawn."""
+        if not Spawner.USE_POSIX_SPAWN:
+            self.skipTest("No posix_spawn on this platform.")
+        self.check_run()
+
+    def test_run_posix_spawn_without_exit_code_helper(self):
+        """Test posix_spawn where os.waitstatus_to_exitcode is missing."""
+        if not Spawner.USE_POSIX_SPAWN:
+            self.skipTest("No posix_spawn on this platform.")
+        # Python 3.8 has posix_spawn but not waitstatus_to_exitcode.
+        with patch("os.waitstatus_to_exitcode", side_effect=AttributeError,
+                   create=True):
+            result = Spawner.run(["sh", "-c", "exit 3"])
+            self.assertEqual(3, result.returncode)
+            result = Spawner.run(["sh", "-c", "kill -9 $$"])
+            self.assertEqual(-9, result.returncode)
+            result = Spawner.run(["true"])
+            self.assertTrue(result.ok)
+
+    def test_run_popen(self):
+        """Test running with the Popen fallback."""
+        Spawner.USE_POSIX_SPAWN = False
+        self.check_run()
+
+    def test_run_python2_fallbacks(self):
+        """Test the select, devnull and setsid path that Python 2 takes."""
+        Spawner.USE_POSIX_SPAWN = False
+        Spawner.PYTHON2 = True
+        self.check_run()
+        self.test_stdin_is_empty()
+        self.test_timeout_kills_group()
+        self.test_on_line()
+
+    def test_stdin_is_empty(self):
+        """Test that a command reading stdin does not hang."""
+        result = Spawner.run(["cat"], timeout=5)
+        self.assertTrue(result.ok)
+        self.assertEqual(b"", result.stdout)
+
+    def test_missing_executable(self):
+        """Test that a missing executable fails like in a shell."""
+        result = Spawner.run(["surely-not-an-executable-here"])
+        self.assertEqual(Spawner.NOT_FOUND_CODE, result.returncode)
+        self.assertIn(b"not found", result.stderr)
+
+    def test_timeout_kills_group(self):
+        """Test that a timeout kills the command and its children."""
+        marker = os.path.join(self.test_dir, "marker")
+        start = time.time()
+        result = Spawner.run(
+            ["sh", "-c", "(sleep 1; touch {}) & sleep 5".format(marker)],
+            timeout=0.2)
+        self.assertTrue(result.timed_out)
+        self.assertFalse(result.ok)
+        self.assertLess(time.time() - start, 2)
+        time.sleep(1.2)
+        self.assertFalse(os.path.exists(marker))
+
+    def test_on_line(self):
+        """Test that lines of both streams are reported as they arrive."""
+        lines = []
+        Spawner.run(["sh", "-c", "printf 'a\\rb\\n'; printf 'c' >&2"],
+                    on_line=lines.append)
+        self.assertEqual(["a", "b", "c"], sorted(lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
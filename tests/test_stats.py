@@ -0,0 +1,110 @@
+"""Test the statistics of past runs."""
+import shutil
+import tempfile
+import unittest
+from os import path
+from catkin_tools_fetch.lib.dependency_parser import Dependency
+from catkin_tools_fetch.lib.fake_backend import FakeGitBackend
+from catkin_tools_fetch.lib.history import RunHistory
+from catkin_tools_fetch.lib.stats import RunStats
+from catkin_tools_fetch.lib.update import Updater
+
+DAY = 24 * 3600
+
+
+def make_run(started, duration, records):
+    """Create a run like the ones stored by RunHistory."""
+    return {'verb': 'fetch', 'started': started, 'duration': duration,
+            'repos': [{'name': name, 'operation': operation,
+                       'duration': seconds, 'outcome': outcome,
+                       'url': url, 'bytes': 10}
+                      for name, operation, seconds, outcome, url in records]}
+
+
+class TestRunStats(unittest.TestCase):
+    """Test the statistics."""
+
+    def setUp(self):
+        """Create a few runs."""
+        github = "https://github.com/a/{}"
+        self.runs = [
+            make_run(0, 10.0, [
+                ("big", 'clone', 9.0, RunHistory.OK, github.format("big")),
+                ("small", 'clone', 1.0, RunHistory.OK,
+                 "git@gitlab.com:a/small"),
+                ("big", 'probe', 0.5, RunHistory.OK, github.format("big"))]),
+            make_run(DAY + 1, 20.0, [
+                ("big", 'clone', 100.0, RunHistory.ERROR,
+                 github.format("big")),
+                ("local", 'clone', 2.0, RunHistory.OK, "/tmp/local")]),
+            make_run(DAY + 2, 30.0, [
+                ("big", 'clone', 8.0, RunHistory.OK, github.format("big"))]),
+        ]
+
+    def test_percentile(self):
+        """Test the nearest-rank percentile."""
+        self.assertIsNone(RunStats.percentile([], 50))
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual(3, RunStats.percentile(values, 50))
+        self.assertEqual(5, RunStats.percentile(values, 99))
+        self.assertEqual(1, RunStats.percentile(values, 0))
+
+    def test_host(self):
+        """Test finding the host of an url."""
+        self.assertEqual("github.com",
+                         RunStats.host("https://github.com/a/b"))
+        self.assertEqual("github.com", RunStats.host("git@github.com:a/b"))
+        self.assertEqual("host", RunStats.host("ssh://user@host:22/a"))
+        self.assertEqual(RunStats.LOCAL_HOST, RunStats.host("/tmp/a"))
+        self.assertEqual(RunStats.LOCAL_HOST, RunStats.host(None))
+
+    def test_summaries(self):
+        """Test durations, slowest repos, failure rates and trend."""
+        run_stats = RunStats(self.runs)
+        durations = run_stats.durations()
+        self.assertEqual(5, durations['clone']['count'])
+        self.assertEqual(8.0, durations['clone']['percentiles'][50])
+        self.assertEqual(100.0, durations['clone']['percentiles'][99])
+        self.assertEqual([("big", 'clone', 9.0, 3),
+                          ("local", 'clone', 2.0, 1)],
+                         run_stats.slowest(2))
+        self.assertEqual({"github.com": (1, 3), "gitlab.com": (0, 1),
+                          RunStats.LOCAL_HOST: (0, 1)},
+                         run_stats.failure_rates())
+        self.assertEqual([(0, 1, 10.0, 30), (DAY, 2, 20.0, 30)],
+                         run_stats.trend())
+        self.assertTrue(len(run_stats.report()) > 5)
+        self.assertEqual(["No runs recorded yet."], RunStats([]).report())
+
+    def test_pull_failure_rates(self):
+        """Test that pulls of an update are counted per host."""
+        ws_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, ws_path)
+        backend = FakeGitBackend()
+        packages = {}
+        for name, url in [("pkg_a", "https://github.com/a/pkg_a"),
+                          ("pkg_b", "https://github.com/a/pkg_b"),
+                          ("pkg_c", "git@gitlab.com:a/pkg_c")]:
+            backend.add_remote(url, name)
+            backend.clone(name, url, path.join(ws_path, name))
+            packages[name] = Dependency(name, url=url)
+        backend.failures = {"pull": set([path.join(ws_path, "pkg_b")])}
+        history = RunHistory(verb='update')
+        updater = Updater(ws_path, packages, use_preprint=False,
+                          colored=False, history=history, backend=backend)
+        updater.update_packages([])
+        run_stats = RunStats([history.to_dict()])
+        self.assertEqual({"github.com": (1, 2), "gitlab.com": (0, 1)},
+                         run_stats.failure_rates())
+
+    def test_prometheus(self):
+        """Test the export in the Prometheus text format."""
+        text = RunStats(self.runs).to_prometheus()
+        self.assertIn('catkin_deps_runs_total{verb="fetch"} 3\n', text)
+        self.assertIn('catkin_deps_last_run_duration_seconds{verb="fetch"} 30',
+                      text)
+        self.assertIn('catkin_deps_operation_duration_seconds'
+                      '{operation="clone",quantile="0.5"} 8.0', text)
+        self.assertIn('catkin_deps_operation_failures_total'
+                      '{host="github.com"} 1', text)
+        self.assertTrue(text.endswith("\n"))
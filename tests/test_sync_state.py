@@ -0,0 +1,122 @@
+"""Test skipping repositories that were synced recently."""
+import shutil
+import tempfile
+import unittest
+from os import path
+from mock import MagicMock
+from termcolor import colored
+from catkin_tools_fetch import cli
+from catkin_tools_fetch.lib.dependency_parser import Dependency
+from catkin_tools_fetch.lib.fake_backend import FakeGitBackend
+from catkin_tools_fetch.lib.sync_state import SyncState
+from catkin_tools_fetch.lib.update import Updater
+
+URL = "fake://{}"
+NAMES = ["pkg_a", "pkg_b"]
+
+
+class TestSyncState(unittest.TestCase):
+    """Test the sync state and the freshness window of the updater."""
+
+    def setUp(self):
+        """Create a workspace with fake clones."""
+        self.test_dir = tempfile.mkdtemp()
+        self.ws_path = path.join(self.test_dir, "src")
+        self.state_path = SyncState.default_state_path(self.test_dir)
+        self.backend = FakeGitBackend()
+        self.packages = {}
+        for name in NAMES:
+            self.backend.add_remote(URL.format(name), name)
+            self.backend.clone(name, URL.format(name),
+                               path.join(self.ws_path, name))
+            self.packages[name] = Dependency(name, url=URL.format(name))
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    def update(self, selected_packages, max_age=3600):
+        """Update with a fresh updater and return {name: tag}."""
+        sync_state = SyncState(self.state_path)
+        updater = Updater(self.ws_path, self.packages, use_preprint=False,
+                          colored=False, backend=self.backend,
+                          sync_state=sync_state, max_age=max_age)
+        tags = dict(updater.update_packages(selected_packages))
+        sync_state.save()
+        return tags
+
+    def pulls(self):
+        """Count the pulls of the backend so far."""
+        return len([call for call in self.backend.calls
+                    if call[0] == 'pull'])
+
+    def test_parse_age(self):
+        """Test reading ages with and without units."""
+        self.assertEqual(90, SyncState.parse_age("90"))
+        self.assertEqual(900, SyncState.parse_age("15m"))
+        self.assertEqual(7200, SyncState.parse_age(" 2H "))
+        self.assertEqual(86400, SyncState.parse_age("1d"))
+        self.assertEqual(30, SyncState.parse_age("0.5m"))
+        for age in ["", "m", "-1", "1w", "1h30m"]:
+            self.assertRaises(ValueError, SyncState.parse_age, age)
+
+    def test_is_fresh(self):
+        """Test the window and that records survive a reload."""
+        sync_state = SyncState(self.state_path)
+        self.assertFalse(sync_state.is_fresh("pkg_a", 60))
+        sync_state.record("pkg_a", "a" * 40, now=1000.0)
+        self.assertTrue(sync_state.save())
+        sync_state = SyncState(self.state_path)
+        self.assertEqual({"pkg_a": {"synced": 1000.0, "sha": "a" * 40}},
+                         sync_state.repos)
+        self.assertTrue(sync_state.is_fresh("pkg_a", 60, now=1059.0))
+        self.assertFalse(sync_state.is_fresh("pkg_a", 60, now=1060.0))
+        self.assertFalse(sync_state.is_fresh("pkg_a", 60, now=999.0))
+
+    def test_skip_fresh(self):
+        """Test that only stale or named repositories are pulled."""
+        self.assertEqual({name: Updater.UP_TO_DATE_TAG for name in NAMES},
+                         self.update([]))
+        self.assertEqual(2, self.pulls())
+        state = SyncState(self.state_path)
+        self.assertEqual(
+            self.backend.head(path.join(self.ws_path, "pkg_a"))[1],
+            state.repos["pkg_a"]["sha"])
+        self.assertEqual({name: Updater.FRESH_TAG for name in NAMES},
+                         self.update([]))
+        self.assertEqual(2, self.pulls())
+        self.assertEqual({"pkg_b": Updater.UP_TO_DATE_TAG},
+                         self.update(["pkg_b"]))
+        self.assertEqual(3, self.pulls())
+        self.update([], max_age=None)
+        self.assertEqual(5, self.pulls())
+        self.assertEqual(colored(Updater.FRESH_TAG, 'green'),
+                         Updater.colorize_tag(Updater.FRESH_TAG))
+
+    def test_record_fetched_sha(self):
+        """Test that only pulls that went through record the remote sha."""
+        self.backend.commit(URL.format("pkg_a"))
+        self.backend.failures['pull'] = set([path.join(self.ws_path,
+                                                       "pkg_b")])
+        self.assertEqual({"pkg_a": Updater.PULLED_TAG,
+                          "pkg_b": Updater.ERROR_TAG},
+                         self.update([]))
+        state = SyncState(self.state_path)
+        self.assertEqual(["pkg_a"], list(state.repos))
+        self.assertEqual(FakeGitBackend.sha(URL.format("pkg_a"), "master", 1),
+                         state.repos["pkg_a"]["sha"])
+
+    def test_fetch_records_pulls(self):
+        """Test that pulls after a fetch are recorded too."""
+        context = MagicMock()
+        context.source_space_abs = self.ws_path
+        self.assertEqual(0, cli.fetch(
+            packages=[], workspace=self.test_dir, context=context,
+            default_urls=set([URL.format("{package}")]), use_preprint=False,
+            num_threads=None, pull_after_fetch=True, backend=self.backend,
+            sync_state=SyncState(self.state_path)))
+        self.assertEqual(set(NAMES), set(SyncState(self.state_path).repos))
+
+
+if __name__ == '__main__':
+    unittest.main()
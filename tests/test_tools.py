@@ -1,7 +1,13 @@
 """Module that contains tests for various tools."""
+import shutil
+import tempfile
 import unittest
+from os import path
 from catkin_tools_fetch.lib.tools import Tools
 from catkin_tools_fetch.lib.dependency_parser import Dependency
+from catkin_tools_fetch.lib.closure_cache import ClosureCache
+from catkin_tools_fetch.lib.scheduler import CloneScheduler
+from catkin_tools_fetch.lib.url_ranker import UrlRanker
 
 
 class TestTools(unittest.TestCase):
@@ -59,3 +65,24 @@ class TestTools(unittest.TestCase):
         self.assertTrue('test2' in updated_dict)
         self.assertEqual('blah', updated_dict['test'].branch)
         pass
+
+    def test_load_json(self):
+        """Test that only a json object is loaded, else the default."""
+        test_dir = tempfile.mkdtemp()
+        try:
+            json_path = path.join(test_dir, "file.json")
+            for text in ['[1, 2]', '42', '"text"', 'null', '{broken']:
+                with open(json_path, 'w') as json_file:
+                    json_file.write(text)
+                self.assertEqual({}, Tools.load_json(json_path, default={}))
+                self.assertIsNone(Tools.load_json(json_path))
+                # Callers that expect a dict start afresh.
+                UrlRanker(json_path)
+                CloneScheduler(json_path)
+                self.assertFalse(ClosureCache(json_path).is_complete({}))
+            with open(json_path, 'w') as json_file:
+                json_file.write('{"a": [1]}')
+            self.assertEqual({"a": [1]}, Tools.load_json(json_path))
+            self.assertIsNone(Tools.load_json(path.join(test_dir, "none")))
+        finally:
+            shutil.rmtree(test_dir)
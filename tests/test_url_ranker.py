@@ -0,0 +1,77 @@
+"""Test learning the order of default urls."""
+import unittest
+import tempfile
+import shutil
+from os import path
+from catkin_tools_fetch.lib.url_ranker import UrlRanker
+from catkin_tools_fetch.lib.dependency_parser import Dependency
+
+
+class TestUrlRanker(unittest.TestCase):
+    """Test the url ranker."""
+
+    def setUp(self):
+        """Create a temporary directory."""
+        self.test_dir = tempfile.mkdtemp()
+        self.stats_path = path.join(self.test_dir, "stats.json")
+        self.templates = ["a/{package}", "b/{package}", "c/{package}"]
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    def test_rank_deterministic(self):
+        """Test that with no statistics we sort by template."""
+        ranker = UrlRanker()
+        ranked = ranker.rank(reversed(self.templates), "pkg")
+        self.assertEqual(self.templates, ranked)
+
+    def test_dependency_urls_sorted(self):
+        """Test that default urls of a dependency are sorted."""
+        dep = Dependency(name="pkg")
+        dep.set_default_urls_if_needed(set(self.templates))
+        self.assertEqual(["a/pkg", "b/pkg", "c/pkg"], dep.default_urls)
+        self.assertEqual("c/pkg", dep.url_templates["c/{package}"])
+
+    def test_learn_and_persist(self):
+        """Test that a hit moves the template to the front."""
+        ranker = UrlRanker(stats_path=self.stats_path)
+        dep = Dependency(name="velodyne_driver")
+        dep.set_default_urls_if_needed(set(self.templates))
+        dep.url = "c/velodyne_driver"
+        ranker.record(dep, True)
+        self.assertTrue(ranker.save())
+
+        ranker = UrlRanker(stats_path=self.stats_path)
+        other = Dependency(name="velodyne_msgs")
+        other.set_default_urls_if_needed(set(self.templates))
+        ranker.sort_dependency_urls(other)
+        self.assertEqual("c/velodyne_msgs", other.default_urls[0])
+        self.assertGreater(ranker.hit_rate("c/{package}", "velodyne_msgs"),
+                           ranker.hit_rate("c/{package}", "other_pkg"))
+
+    def test_misses_push_back(self):
+        """Test that a template that always misses goes last."""
+        ranker = UrlRanker()
+        for _ in range(3):
+            dep = Dependency(name="pkg")
+            dep.set_default_urls_if_needed(set(self.templates))
+            ranker.record(dep, False)
+        dep = Dependency(name="pkg")
+        dep.set_default_urls_if_needed(set(self.templates))
+        dep.url = "b/pkg"
+        ranker.record(dep, True)
+        ranked = ranker.rank(self.templates, "pkg")
+        self.assertEqual("b/{package}", ranked[0])
+
+    def test_explicit_priority(self):
+        """Test that explicit priority beats statistics."""
+        priorities = UrlRanker.priorities_from_urls(["c/{package}"])
+        ranker = UrlRanker(priorities=priorities)
+        dep = Dependency(name="pkg")
+        dep.set_default_urls_if_needed(set(self.templates))
+        dep.url = "a/pkg"
+        ranker.record(dep, True)
+        ranked = ranker.rank(self.templates, "pkg")
+        self.assertEqual(["c/{package}", "a/{package}", "b/{package}"],
+                         ranked)
@@ -0,0 +1,93 @@
+"""Test watching the workspace for new dependencies."""
+import os
+import unittest
+import tempfile
+import shutil
+from os import path
+from mock import patch
+from catkin_tools_fetch.lib.downloader import Downloader
+from catkin_tools_fetch.lib.watcher import Watcher
+from tests.local_repos import create_remote
+from tests.local_repos import remote_template
+from tests.local_repos import write_package_xml
+
+
+class TestWatcher(unittest.TestCase):
+    """Test the watcher."""
+
+    def setUp(self):
+        """Create a workspace and remotes."""
+        self.test_dir = tempfile.mkdtemp()
+        self.ws_path = path.join(self.test_dir, "src")
+        os.makedirs(self.ws_path)
+        create_remote(self.test_dir, "dep_a", depends=["dep_b"])
+        create_remote(self.test_dir, "dep_b")
+        self.default_urls = set([remote_template(self.test_dir)])
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    def test_init_death(self):
+        """Test that a missing workspace is reported."""
+        self.assertRaises(ValueError, Watcher, "blah", set(), set())
+
+    def test_changed_manifests(self):
+        """Test that only new or changed manifests are reported."""
+        pkg_folder = path.join(self.ws_path, "pkg")
+        write_package_xml(pkg_folder, "pkg")
+        ignored_folder = path.join(self.ws_path, "ignored")
+        write_package_xml(ignored_folder, "ignored")
+        open(path.join(ignored_folder, "CATKIN_IGNORE"), "w").close()
+        watcher = Watcher(self.ws_path, self.default_urls, set())
+        xml_path = path.join(pkg_folder, "package.xml")
+        self.assertEqual([xml_path], watcher.changed_manifests())
+        self.assertEqual([], watcher.changed_manifests())
+        mtime = os.stat(xml_path).st_mtime
+        os.utime(xml_path, (mtime + 10, mtime + 10))
+        self.assertEqual([xml_path], watcher.changed_manifests())
+
+    def test_prefetch_closure(self):
+        """Test that new dependencies and their dependencies are fetched."""
+        write_package_xml(path.join(self.ws_path, "pkg"), "pkg")
+        watcher = Watcher(self.ws_path, self.default_urls, set())
+        self.assertIsNone(watcher.poll_once())
+
+        write_package_xml(path.join(self.ws_path, "pkg"), "pkg",
+                          depends=["dep_a", "roscpp"])
+        os.utime(path.join(self.ws_path, "pkg", "package.xml"),
+                 (0, 0))
+        future = watcher.poll_once()
+        self.assertIsNotNone(future)
+        self.assertEqual(0, future.result())
+        self.assertTrue(path.exists(
+            path.join(self.ws_path, "dep_a", "package.xml")))
+        # The cloned package brings a new manifest with its own dependency.
+        future = watcher.poll_once()
+        self.assertEqual(0, future.result())
+        self.assertTrue(path.exists(
+            path.join(self.ws_path, "dep_b", "package.xml")))
+        self.assertEqual(0, watcher.run(poll_interval=0, max_polls=1))
+        self.assertFalse(path.exists(path.join(self.ws_path, "roscpp")))
+
+    def test_keep_polling_after_errors(self):
+        """Test that failing polls and downloads do not stop the watcher."""
+        polls = []
+
+        class FlakyWatcher(Watcher):
+            """Fail the first poll."""
+
+            def poll_once(self):
+                polls.append(len(polls))
+                if len(polls) == 1:
+                    raise IOError("cannot read manifest")
+                return super(FlakyWatcher, self).poll_once()
+
+        write_package_xml(path.join(self.ws_path, "pkg"), "pkg",
+                          depends=["dep_b"])
+        watcher = FlakyWatcher(self.ws_path, self.default_urls, set())
+        with patch.object(Downloader, 'download_dependencies',
+                          side_effect=RuntimeError("git is gone")):
+            self.assertEqual(1, watcher.run(poll_interval=0, max_polls=3))
+        self.assertEqual(3, len(polls))
+        self.assertFalse(path.exists(path.join(self.ws_path, "dep_b")))
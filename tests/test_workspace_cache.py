@@ -0,0 +1,126 @@
+"""Test saving workspaces to a cache and restoring them."""
+import os
+import shutil
+import tempfile
+import unittest
+from os import path
+from mock import MagicMock
+from catkin_tools_fetch import cli
+from catkin_tools_fetch.lib.tools import GitBridge
+from catkin_tools_fetch.lib.workspace_cache import WorkspaceCache
+from tests.local_repos import create_remote
+from tests.local_repos import git
+
+NAMES = ["pkg_a", "pkg_b"]
+
+
+class TestWorkspaceCache(unittest.TestCase):
+    """Test the workspace cache with local remotes."""
+
+    def setUp(self):
+        """Create remotes and a workspace with their clones."""
+        self.test_dir = tempfile.mkdtemp()
+        self.cache_dir = path.join(self.test_dir, "cache")
+        self.urls = {name: create_remote(self.test_dir, name)
+                     for name in NAMES}
+        self.workspace = self.make_workspace("saved")
+        for name, url in self.urls.items():
+            git(["clone", "-q", url, name],
+                cwd=path.join(self.workspace, "src"))
+
+    def tearDown(self):
+        """Remove the directory after the test."""
+        shutil.rmtree(self.test_dir)
+
+    def make_workspace(self, name):
+        """Create an empty workspace."""
+        workspace = path.join(self.test_dir, name)
+        os.makedirs(path.join(workspace, "src"))
+        return workspace
+
+    def run_cache(self, action, workspace, key=None):
+        """Run the cache verb in a workspace."""
+        context = MagicMock()
+        context.source_space_abs = path.join(workspace, "src")
+        return cli.cache(action=action,
+                         packages=[],
+                         workspace=workspace,
+                         context=context,
+                         cache_dir=self.cache_dir,
+                         key=key,
+                         use_preprint=False,
+                         num_threads=None)
+
+    def archives(self):
+        """List the archives in the cache."""
+        return sorted(os.listdir(path.join(self.cache_dir,
+                                           WorkspaceCache.ARCHIVES_DIR)))
+
+    def test_make_key(self):
+        """Test that the key depends on urls, branches and commits."""
+        graph = {"a": {"url": "u", "branch": "master", "sha": "1"}}
+        key = WorkspaceCache.make_key(graph)
+        self.assertEqual(key, WorkspaceCache.make_key(dict(graph)))
+        for field in ["url", "branch", "sha"]:
+            changed = {"a": dict(graph["a"], **{field: "other"})}
+            self.assertNotEqual(key, WorkspaceCache.make_key(changed))
+
+    def test_save_restore(self):
+        """Test restoring a saved workspace into an empty one."""
+        self.assertEqual(1, self.run_cache("restore",
+                                           self.make_workspace("empty")))
+        self.assertEqual(0, self.run_cache("save", self.workspace))
+        self.assertEqual(2, len(self.archives()))
+        key = WorkspaceCache(self.cache_dir).latest_key()
+        self.assertIsNotNone(key)
+        # Nothing changed, so nothing is packed again.
+        self.assertEqual(0, self.run_cache("save", self.workspace))
+        self.assertEqual(2, len(self.archives()))
+        workspace = self.make_workspace("restored")
+        self.assertEqual(0, self.run_cache("restore", workspace, key=key))
+        for name in NAMES:
+            clone_path = path.join(workspace, "src", name)
+            self.assertTrue(path.exists(path.join(clone_path,
+                                                  "package.xml")))
+            self.assertEqual(self.urls[name],
+                             GitBridge.remote_url(clone_path))
+            self.assertEqual(("master", GitBridge.head(path.join(
+                self.workspace, "src", name))[1]),
+                GitBridge.head(clone_path))
+        self.assertEqual(NAMES, sorted(os.listdir(path.join(workspace,
+                                                            "src"))))
+
+    def test_restore_pulls_moved(self):
+        """Test that only repositories that moved are pulled."""
+        self.assertEqual(0, self.run_cache("save", self.workspace))
+        saved_heads = {name: GitBridge.head(path.join(
+            self.workspace, "src", name))[1] for name in NAMES}
+        work = path.join(self.test_dir, "work", "pkg_b")
+        with open(path.join(work, "new_file"), "w") as new_file:
+            new_file.write("new")
+        git(["add", "-A"], cwd=work)
+        git(["commit", "-q", "-m", "move"], cwd=work)
+        git(["push", "-q", self.urls["pkg_b"], "master"], cwd=work)
+        moved_sha = GitBridge.head(work)[1]
+        workspace = self.make_workspace("restored")
+        self.assertEqual(0, self.run_cache("restore", workspace))
+        src = path.join(workspace, "src")
+        self.assertEqual(saved_heads["pkg_a"],
+                         GitBridge.head(path.join(src, "pkg_a"))[1])
+        self.assertEqual(moved_sha,
+                         GitBridge.head(path.join(src, "pkg_b"))[1])
+        self.assertTrue(path.exists(path.join(src, "pkg_b", "new_file")))
+
+    def test_skip_changed(self):
+        """Test that repositories with local changes are not saved."""
+        with open(path.join(self.workspace, "src", "pkg_a",
+                            "package.xml"), "a") as xml_file:
+            xml_file.write("<!-- local change -->\n")
+        repos = [path.join(self.workspace, "src", name) for name in NAMES]
+        graph = WorkspaceCache.read_graph(path.join(self.workspace, "src"),
+                                          repos)
+        self.assertEqual(["pkg_b"], sorted(graph))
+
+
+if __name__ == '__main__':
+    unittest.main()